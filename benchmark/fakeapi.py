@@ -0,0 +1,773 @@
+#!/usr/bin/env python3
+
+# A stand-in Kubernetes API server with a (very) simple Kueue and Job
+# controller, to measure the executor without a cluster. It serves the
+# Job, Pod (log and exec), ConfigMap, DaemonSet, MiniCluster, Workload, queue,
+# and pod metrics endpoints the executor uses, including watches and label
+# selected deletes.
+#
+# python benchmark/fakeapi.py --port 8080 --latency 5 --admission-delay 1
+
+import argparse
+import base64
+import collections
+import hashlib
+import heapq
+import json
+import random
+import re
+import socket
+import string
+import struct
+import threading
+import time
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Paths we serve, by kind
+routes = [
+    ("jobs", r"/apis/batch/v1/namespaces/(?P<ns>[^/]+)/jobs"),
+    ("pods", r"/api/v1/namespaces/(?P<ns>[^/]+)/pods"),
+    ("configmaps", r"/api/v1/namespaces/(?P<ns>[^/]+)/configmaps"),
+    ("daemonsets", r"/apis/apps/v1/namespaces/(?P<ns>[^/]+)/daemonsets"),
+    (
+        "miniclusters",
+        r"/apis/flux-framework.org/v1alpha2/namespaces/(?P<ns>[^/]+)/miniclusters",
+    ),
+    ("workloads", r"/apis/kueue.x-k8s.io/v1beta1/namespaces/(?P<ns>[^/]+)/workloads"),
+    (
+        "localqueues",
+        r"/apis/kueue.x-k8s.io/v1beta1/namespaces/(?P<ns>[^/]+)/localqueues",
+    ),
+    ("clusterqueues", r"/apis/kueue.x-k8s.io/v1beta1(?P<ns>)/clusterqueues"),
+    ("podmetrics", r"/apis/metrics.k8s.io/v1beta1/namespaces/(?P<ns>[^/]+)/pods"),
+]
+routes = [
+    (
+        kind,
+        re.compile(pattern + r"(?:/(?P<name>[^/]+))?(?:/(?P<sub>log|status|exec))?$"),
+    )
+    for kind, pattern in routes
+]
+
+index_annotation = "batch.kubernetes.io/job-completion-index"
+
+# Accept key suffix of a websocket handshake (RFC 6455)
+websocket_guid = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def now():
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+def container_status(container, state):
+    return {
+        "name": container.get("name", "main"),
+        "image": container.get("image", "busybox"),
+        "imageID": "",
+        "ready": "running" in state,
+        "restartCount": 0,
+        "state": state,
+    }
+
+
+def parse_selector(selector):
+    """
+    Parse a label selector (k=v, k!=v, k in (a,b), k) into checks.
+    """
+    checks = []
+    for term in re.findall(r"[^,(]+(?:\([^)]*\))?", selector or ""):
+        term = term.strip()
+        match = re.match(r"^(\S+)\s+(in|notin)\s+\((.*)\)$", term)
+        if match:
+            key, op, values = match.groups()
+            values = {v.strip() for v in values.split(",")}
+            checks.append((key, op, values))
+        elif "!=" in term:
+            key, value = term.split("!=", 1)
+            checks.append((key.strip(), "notin", {value.strip()}))
+        elif "=" in term:
+            key, value = term.split("=", 1)
+            checks.append((key.strip(), "in", {value.strip().lstrip("=")}))
+        elif term:
+            checks.append((term, "exists", None))
+    return checks
+
+
+def matches(obj, checks):
+    labels = obj["metadata"].get("labels") or {}
+    for key, op, values in checks:
+        if op == "exists" and key not in labels:
+            return False
+        if op == "in" and labels.get(key) not in values:
+            return False
+        if op == "notin" and labels.get(key) in values:
+            return False
+    return True
+
+
+class Cluster:
+    """
+    Objects, watch events, and a controller that runs jobs through Kueue.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.objects = collections.defaultdict(dict)
+        self.events = collections.defaultdict(list)
+        self.resource_version = 0
+        self.lock = threading.Condition()
+
+        # Scheduled controller actions, and admitted workloads
+        self.actions = []
+        self.counter = 0
+        self.admitted = 0
+        self.running = set()
+        self.waiting = collections.deque()
+
+        # What the benchmark asks about afterwards
+        self.requests = collections.Counter()
+        self.finished = {}
+        self.connections = 0
+
+        # What each container of a running pod uses, for the metrics API
+        self.usage = {"cpu": "250m", "memory": "100Mi"}
+
+        # What an exec in a pod does, given the namespace, pod, and command,
+        # returning the exit code and output (by default, nothing)
+        self.exec_handler = lambda ns, pod, command: (0, "")
+
+    def next_version(self):
+        self.resource_version += 1
+        return str(self.resource_version)
+
+    def put(self, kind, ns, obj, event="MODIFIED"):
+        """
+        Store an object and record a watch event (lock held).
+        """
+        obj["metadata"]["resourceVersion"] = self.next_version()
+        self.objects[kind][(ns, obj["metadata"]["name"])] = obj
+        self.events[kind].append((self.resource_version, ns, event, obj))
+        self.lock.notify_all()
+
+    def remove(self, kind, ns, name):
+        obj = self.objects[kind].pop((ns, name), None)
+        if obj is None:
+            return
+        obj["metadata"]["resourceVersion"] = self.next_version()
+        self.events[kind].append((self.resource_version, ns, "DELETED", obj))
+        self.lock.notify_all()
+
+        # Deleting a job deletes its pods and its workload
+        if kind == "miniclusters":
+            self.remove("jobs", ns, name)
+            self.remove("workloads", ns, f"job-{name}")
+        if kind == "jobs":
+            for pod in self.select("pods", ns, [("job-name", "in", {name})]):
+                self.remove("pods", ns, pod["metadata"]["name"])
+            self.remove("workloads", ns, f"job-{name}")
+            if (ns, name) in self.running:
+                self.running.discard((ns, name))
+                self.release()
+        return obj
+
+    def select(self, kind, ns, checks):
+        return [
+            obj
+            for (namespace, _), obj in list(self.objects[kind].items())
+            if (not ns or namespace == ns) and matches(obj, checks)
+        ]
+
+    def create(self, kind, ns, obj):
+        with self.lock:
+            metadata = obj.setdefault("metadata", {})
+            if not metadata.get("name"):
+                suffix = "".join(random.choices(string.ascii_lowercase, k=5))
+                metadata["name"] = metadata.get("generateName", "") + suffix
+            if (ns, metadata["name"]) in self.objects[kind]:
+                return None
+            metadata.update(namespace=ns, uid=str(uuid.uuid4()))
+            metadata["creationTimestamp"] = now()
+            if kind in ["jobs", "miniclusters"]:
+                obj.setdefault("status", {})
+            # Kueue's webhook suspends queued jobs until they are admitted
+            if kind == "jobs":
+                obj.setdefault("spec", {})["suspend"] = True
+            self.put(kind, ns, obj, "ADDED")
+            if kind in ["jobs", "miniclusters"]:
+                self.submitted(kind, ns, obj)
+            return obj
+
+    # Controller
+
+    def schedule(self, delay, func, *args):
+        """
+        Run func (with the lock held) after delay seconds.
+
+        The lock is reentrant, so actions can schedule more actions.
+        """
+        with self.lock:
+            self.counter += 1
+            heapq.heappush(
+                self.actions, (time.time() + delay, self.counter, func, args)
+            )
+            self.lock.notify_all()
+
+    def run(self):
+        with self.lock:
+            while True:
+                if not self.actions:
+                    self.lock.wait()
+                    continue
+                when, _, func, args = self.actions[0]
+                if when > time.time():
+                    self.lock.wait(when - time.time())
+                    continue
+                heapq.heappop(self.actions)
+                func(*args)
+
+    def submitted(self, kind, ns, obj):
+        """
+        Kueue creates a (pending) Workload owned by the job.
+        """
+        name = obj["metadata"]["name"]
+        labels = obj["metadata"].get("labels") or {}
+        workload = {
+            "apiVersion": "kueue.x-k8s.io/v1beta1",
+            "kind": "Workload",
+            "metadata": {
+                "name": f"job-{name}",
+                "namespace": ns,
+                "labels": dict(labels),
+                "creationTimestamp": now(),
+                "ownerReferences": [{"kind": obj.get("kind"), "name": name}],
+            },
+            "spec": {
+                "queueName": labels.get("kueue.x-k8s.io/queue-name"),
+                "priority": 0,
+            },
+            "status": {"conditions": []},
+        }
+        self.put("workloads", ns, workload, "ADDED")
+        self.waiting.append((kind, ns, name))
+        self.admit()
+
+    def admit(self):
+        """
+        Admit waiting workloads while there is capacity (lock held).
+        """
+        capacity = self.args.capacity
+        while self.waiting and (not capacity or self.admitted < capacity):
+            self.admitted += 1
+            item = self.waiting.popleft()
+            self.schedule(self.args.admission_delay, self.start, *item)
+
+    def release(self):
+        self.admitted -= 1
+        self.admit()
+
+    def start(self, kind, ns, name):
+        """
+        The workload is admitted: unsuspend the job and create its pods.
+        """
+        workload = self.objects["workloads"].get((ns, f"job-{name}"))
+        job = self.objects["jobs"].get((ns, name))
+        if kind == "miniclusters":
+            job = self.minicluster_job(ns, name)
+        if workload is None or job is None:
+            self.release()
+            return
+        self.running.add((ns, name))
+        workload["status"]["conditions"] = [
+            {"type": "QuotaReserved", "status": "True", "lastTransitionTime": now()},
+            {"type": "Admitted", "status": "True", "lastTransitionTime": now()},
+        ]
+        self.put("workloads", ns, workload)
+
+        spec = job["spec"]
+        spec["suspend"] = False
+        completions = spec.get("completions") or 1
+        template = spec.get("template") or {}
+        labels = (template.get("metadata") or {}).get("labels") or {}
+        containers = (template.get("spec") or {}).get("containers") or [{}]
+        for index in range(completions):
+            pod = {
+                "apiVersion": "v1",
+                "kind": "Pod",
+                "metadata": {
+                    "name": f"{name}-{index}-" + "".join(random.choices("abcdef", k=5)),
+                    "namespace": ns,
+                    "labels": {**labels, "job-name": name},
+                    "annotations": {index_annotation: str(index)},
+                    "creationTimestamp": now(),
+                },
+                "spec": {
+                    "containers": [{"name": c.get("name", "main")} for c in containers]
+                },
+                "status": {
+                    "phase": "Running",
+                    "conditions": [
+                        {
+                            "type": "PodScheduled",
+                            "status": "True",
+                            "lastTransitionTime": now(),
+                        }
+                    ],
+                    "containerStatuses": [
+                        container_status(c, {"running": {"startedAt": now()}})
+                        for c in containers
+                    ],
+                },
+            }
+            self.put("pods", ns, pod, "ADDED")
+
+        job["status"] = {"active": completions, "startTime": now()}
+        self.put("jobs", ns, job)
+        runtime = max(0, random.gauss(self.args.runtime, self.args.runtime / 4))
+        self.schedule(runtime, self.finish, kind, ns, name)
+
+    def minicluster_job(self, ns, name):
+        """
+        The Flux Operator runs a MiniCluster as a Job of the same name.
+        """
+        minicluster = self.objects["miniclusters"].get((ns, name))
+        if minicluster is None:
+            return
+        labels = minicluster["metadata"].get("labels") or {}
+        job = {
+            "apiVersion": "batch/v1",
+            "kind": "Job",
+            "metadata": {"name": name, "namespace": ns, "labels": dict(labels)},
+            "spec": {
+                "completions": minicluster["spec"].get("size") or 1,
+                "template": {
+                    "metadata": {"labels": dict(labels)},
+                    "spec": {"containers": [{"name": "flux-sample"}]},
+                },
+            },
+            "status": {},
+        }
+        self.put("jobs", ns, job, "ADDED")
+        return job
+
+    def finish(self, kind, ns, name):
+        """
+        The job is done, one way or another.
+        """
+        job = self.objects["jobs"].get((ns, name))
+        if job is None:
+            return
+        failed = random.random() < self.args.failure_rate
+        completions = job["spec"].get("completions") or 1
+        for pod in self.select("pods", ns, [("job-name", "in", {name})]):
+            pod["status"]["phase"] = "Failed" if failed else "Succeeded"
+            for container in pod["status"]["containerStatuses"]:
+                running = container["state"].pop("running", {})
+                container["state"]["terminated"] = {
+                    "exitCode": 1 if failed else 0,
+                    "startedAt": running.get("startedAt"),
+                    "finishedAt": now(),
+                }
+            self.put("pods", ns, pod)
+
+        status = {"active": 0, "ready": 0, "startTime": job["status"].get("startTime")}
+        indexes = f"0-{completions - 1}" if completions > 1 else "0"
+        if failed:
+            status["failed"] = 1
+            status["conditions"] = [
+                {"type": "Failed", "status": "True", "lastTransitionTime": now()}
+            ]
+            if job["spec"].get("completionMode") == "Indexed":
+                status["failedIndexes"] = indexes
+        else:
+            status["succeeded"] = completions
+            status["completionTime"] = now()
+            status["conditions"] = [
+                {"type": "Complete", "status": "True", "lastTransitionTime": now()}
+            ]
+            if job["spec"].get("completionMode") == "Indexed":
+                status["completedIndexes"] = indexes
+        job["status"] = status
+        self.put("jobs", ns, job)
+
+        workload = self.objects["workloads"].get((ns, f"job-{name}"))
+        if workload is not None:
+            workload["status"]["conditions"].append(
+                {"type": "Finished", "status": "True", "lastTransitionTime": now()}
+            )
+            self.put("workloads", ns, workload)
+        self.finished[name] = time.time()
+        if (ns, name) in self.running:
+            self.running.discard((ns, name))
+            self.release()
+
+    def pod_metrics(self, ns, checks):
+        """
+        Usage of the running pods, as the metrics server reports it.
+        """
+        items = [
+            {
+                "metadata": pod["metadata"],
+                "containers": [
+                    {"name": c["name"], "usage": dict(self.usage)}
+                    for c in pod["spec"]["containers"]
+                ],
+            }
+            for pod in self.select("pods", ns, checks)
+            if pod["status"]["phase"] == "Running"
+        ]
+        return {"kind": "PodMetricsList", "items": items}
+
+    def queue_status(self, name):
+        pending = len(self.waiting)
+        return {
+            "metadata": {"name": name},
+            "spec": {"clusterQueue": "cluster-queue"},
+            "status": {"pendingWorkloads": pending},
+        }
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    cluster = None
+
+    def setup(self):
+        super().setup()
+        with self.cluster.lock:
+            self.cluster.connections += 1
+
+        # Like the real API server, otherwise small writes wait on delayed ACKs
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, code, obj, headers=None):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_status(self, code, reason, message=""):
+        status = {
+            "kind": "Status",
+            "apiVersion": "v1",
+            "status": "Failure" if code >= 400 else "Success",
+            "reason": reason,
+            "message": message,
+            "code": code,
+        }
+        headers = {"Retry-After": "1"} if code == 429 else None
+        self.send_json(code, status, headers)
+
+    def send_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("utf-8") + data + b"\r\n")
+        self.wfile.flush()
+
+    def read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def route(self):
+        url = urllib.parse.urlparse(self.path)
+        query = {k: v[-1] for k, v in urllib.parse.parse_qs(url.query).items()}
+        for kind, pattern in routes:
+            match = pattern.match(url.path)
+            if match:
+                return kind, match.groupdict(), query, url.path
+        return None, {}, query, url.path
+
+    def handle_request(self, method):
+        kind, parts, query, path = self.route()
+        body = self.read_body()
+        cluster = self.cluster
+        args = cluster.args
+        watching = (query.get("watch") or "").lower() in ["true", "1"]
+
+        # The benchmark asks for stats (not counted as API requests)
+        if path == "/benchmark/stats":
+            with cluster.lock:
+                stats = {
+                    "requests": dict(cluster.requests),
+                    "finished": dict(cluster.finished),
+                }
+            return self.send_json(200, stats)
+        if kind is None:
+            return self.send_status(404, "NotFound", path)
+
+        verb = {
+            "GET": "get" if parts["name"] else "list",
+            "POST": "create",
+            "PUT": "update",
+            "PATCH": "patch",
+            "DELETE": "delete" if parts["name"] else "deletecollection",
+        }[method]
+        if watching:
+            verb = "watch"
+        if parts["sub"] in ["log", "exec"]:
+            verb = parts["sub"]
+        with cluster.lock:
+            cluster.requests[f"{verb} {kind}"] += 1
+
+        if args.latency:
+            time.sleep(random.uniform(0.5, 1.5) * args.latency / 1000)
+        if not watching and random.random() < args.throttle_rate:
+            return self.send_status(429, "TooManyRequests", "slow down")
+        if not watching and random.random() < args.error_rate:
+            return self.send_status(500, "InternalError", "injected failure")
+
+        ns, name = parts["ns"], parts["name"]
+        if kind in ["localqueues", "clusterqueues"]:
+            with cluster.lock:
+                return self.send_json(200, cluster.queue_status(name))
+        if kind == "podmetrics":
+            checks = parse_selector(query.get("labelSelector"))
+            with cluster.lock:
+                return self.send_json(200, cluster.pod_metrics(ns, checks))
+        if method == "POST":
+            obj = cluster.create(kind, ns, body)
+            if obj is None:
+                return self.send_status(409, "AlreadyExists")
+
+            # Created, but the client doesn't hear about it
+            if random.random() < args.lost_rate:
+                return self.send_status(504, "Timeout", "injected lost response")
+            return self.send_json(201, obj)
+        if method == "PUT" and name:
+            with cluster.lock:
+                existing = cluster.objects[kind].get((ns, name))
+                if existing is None:
+                    return self.send_status(404, "NotFound", name)
+                metadata = body.setdefault("metadata", {})
+                metadata.update(
+                    name=name,
+                    namespace=ns,
+                    uid=existing["metadata"].get("uid"),
+                    creationTimestamp=existing["metadata"].get("creationTimestamp"),
+                )
+                cluster.put(kind, ns, body)
+                return self.send_json(200, body)
+        if method == "DELETE":
+            with cluster.lock:
+                if name:
+                    obj = cluster.remove(kind, ns, name)
+                    if obj is None:
+                        return self.send_status(404, "NotFound", name)
+                    return self.send_json(200, obj)
+                checks = parse_selector(query.get("labelSelector"))
+                for obj in cluster.select(kind, ns, checks):
+                    cluster.remove(kind, ns, obj["metadata"]["name"])
+            return self.send_status(200, "Success")
+        if parts["sub"] == "log":
+            return self.send_log(ns, name, query)
+        if parts["sub"] == "exec":
+            return self.exec(ns, name)
+        if watching:
+            return self.watch(kind, ns, query)
+        with cluster.lock:
+            if name:
+                obj = cluster.objects[kind].get((ns, name))
+                if obj is None:
+                    return self.send_status(404, "NotFound", name)
+                return self.send_json(200, obj)
+            checks = parse_selector(query.get("labelSelector"))
+            items = cluster.select(kind, ns, checks)
+            result = {
+                "kind": "List",
+                "apiVersion": "v1",
+                "metadata": {"resourceVersion": str(cluster.resource_version)},
+                "items": items,
+            }
+        return self.send_json(200, result)
+
+    def send_log(self, ns, name, query):
+        with self.cluster.lock:
+            pod = self.cluster.objects["pods"].get((ns, name))
+        if pod is None:
+            return self.send_status(404, "NotFound", name)
+        prefix = (
+            now() + " " if (query.get("timestamps") or "").lower() == "true" else ""
+        )
+        lines = [
+            f"{prefix}line {i} of {name}\n" for i in range(self.cluster.args.log_lines)
+        ]
+        body = "".join(lines).encode("utf-8")
+        if query.get("limitBytes"):
+            body = body[: int(query["limitBytes"])]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def exec(self, ns, name):
+        """
+        Run a command in a pod with the exec handler, answering over a
+        websocket as the API server does: output on the stdout channel, and
+        the exit status on the error channel.
+        """
+        cluster = self.cluster
+        with cluster.lock:
+            pod = cluster.objects["pods"].get((ns, name))
+        if pod is None:
+            return self.send_status(404, "NotFound", name)
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+        try:
+            code, output = cluster.exec_handler(ns, name, query.get("command", []))
+        except Exception as e:
+            return self.send_status(500, "InternalError", str(e))
+
+        key = self.headers.get("Sec-WebSocket-Key", "") + websocket_guid
+        accept = base64.b64encode(hashlib.sha1(key.encode("utf-8")).digest())
+        protocol = self.headers.get("Sec-WebSocket-Protocol") or "v4.channel.k8s.io"
+        self.send_response(101, "Switching Protocols")
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept.decode("utf-8"))
+        self.send_header("Sec-WebSocket-Protocol", protocol.split(",")[0].strip())
+        self.end_headers()
+
+        status = {"metadata": {}, "status": "Success"}
+        if code != 0:
+            status = {
+                "metadata": {},
+                "status": "Failure",
+                "reason": "NonZeroExitCode",
+                "details": {"causes": [{"reason": "ExitCode", "message": str(code)}]},
+            }
+        if output:
+            self.send_frame(b"\x01" + output.encode("utf-8"))
+        self.send_frame(b"\x03" + json.dumps(status).encode("utf-8"))
+        self.send_frame(struct.pack("!H", 1000), opcode=0x8)
+        self.close_connection = True
+
+    def send_frame(self, data, opcode=0x2):
+        """
+        Send one (unmasked, final) websocket frame.
+        """
+        header = bytes([0x80 | opcode])
+        if len(data) < 126:
+            header += bytes([len(data)])
+        elif len(data) < 65536:
+            header += bytes([126]) + struct.pack("!H", len(data))
+        else:
+            header += bytes([127]) + struct.pack("!Q", len(data))
+        self.wfile.write(header + data)
+        self.wfile.flush()
+
+    def watch(self, kind, ns, query):
+        """
+        Stream events after resourceVersion until the timeout.
+        """
+        cluster = self.cluster
+        checks = parse_selector(query.get("labelSelector"))
+        since = int(query.get("resourceVersion") or 0)
+        deadline = time.time() + int(query.get("timeoutSeconds") or 300)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        events = cluster.events[kind]
+        position = 0
+        try:
+            while time.time() < deadline:
+                with cluster.lock:
+                    while position < len(events) and events[position][0] <= since:
+                        position += 1
+                    batch = events[position:]
+                    if not batch:
+                        cluster.lock.wait(min(1, deadline - time.time()))
+                        continue
+                    position = len(events)
+                lines = []
+                for version, namespace, event, obj in batch:
+                    since = version
+                    if namespace != ns or not matches(obj, checks):
+                        continue
+                    line = json.dumps({"type": event, "object": obj})
+                    lines.append(line.encode("utf-8") + b"\n")
+                if lines:
+                    self.send_chunk(b"".join(lines))
+            self.send_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_PUT(self):
+        self.handle_request("PUT")
+
+    def do_PATCH(self):
+        self.handle_request("PATCH")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Fake Kubernetes/Kueue API server")
+    parser.add_argument("--port", type=int, default=0, help="0 picks a free port")
+    parser.add_argument(
+        "--latency", type=float, default=0, help="Mean ms added to each request"
+    )
+    parser.add_argument(
+        "--admission-delay", type=float, default=0.5, help="Seconds before admission"
+    )
+    parser.add_argument(
+        "--capacity", type=int, default=0, help="Admitted workloads at once (0: any)"
+    )
+    parser.add_argument(
+        "--runtime", type=float, default=1, help="Mean seconds each job runs"
+    )
+    parser.add_argument(
+        "--failure-rate", type=float, default=0, help="Fraction of jobs that fail"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0, help="Fraction of requests with a 500"
+    )
+    parser.add_argument(
+        "--lost-rate",
+        type=float,
+        default=0,
+        help="Fraction of creates that go through but answer with a 504",
+    )
+    parser.add_argument(
+        "--throttle-rate", type=float, default=0, help="Fraction of requests with a 429"
+    )
+    parser.add_argument("--log-lines", type=int, default=20, help="Lines per pod log")
+    return parser
+
+
+def serve(args):
+    """
+    Start the server and controller, returning the server.
+    """
+    cluster = Cluster(args)
+    handler = type("ClusterHandler", (Handler,), {"cluster": cluster})
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=cluster.run, daemon=True).start()
+    return server
+
+
+def main():
+    args = get_parser().parse_args()
+    server = serve(args)
+    print(f"listening on {server.server_address[1]}", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
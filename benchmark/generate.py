@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+# Compare per-job generate + serialize time for a batchv1/Job, building
+# the full spec for every job vs. patching a per-rule template.
+#
+# pip install .
+# python benchmark/generate.py --jobs 10000
+
+import argparse
+import time
+
+from snakemake_executor_plugin_kueue import ExecutorSettings
+import snakemake_executor_plugin_kueue.clients as clients
+import snakemake_executor_plugin_kueue.custom_resource as cr
+
+
+class Job:
+    """
+    Just enough of a Snakemake job to generate a spec.
+    """
+
+    name = "hello_world"
+
+    def __init__(self, jobid):
+        self.jobid = jobid
+        self.resources = {"_cores": 1, "_nodes": 1, "kueue_memory": "200Mi"}
+
+
+def run(jobs, snakefile, templates=None):
+    settings = ExecutorSettings()
+    api = clients.ClientManager(settings)
+    start = time.perf_counter()
+    for jobid in range(jobs):
+        crd = cr.BatchJob(
+            Job(jobid),
+            snakefile=snakefile,
+            settings=settings,
+            workflow_uid="benchmark",
+            api=api,
+            templates=templates,
+        )
+        spec = crd.generate(
+            image="vanessa/snakemake:kueue",
+            command="/bin/bash",
+            args=["-c", f"echo {jobid} && python3 -m snakemake --target-jobs {jobid}"],
+            environment={"SNAKEMAKE_BENCHMARK": "1"},
+        )
+        api.api_client.sanitize_for_serialization(spec)
+    return (time.perf_counter() - start) / jobs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark job spec generation")
+    parser.add_argument("--jobs", type=int, default=10000)
+    parser.add_argument("--snakefile", default="example/hello-world/Snakefile")
+    args = parser.parse_args()
+
+    # A new (empty) template cache per job is the same as no cache
+    untemplated = run(args.jobs, args.snakefile)
+    templated = run(args.jobs, args.snakefile, templates={})
+    print(f"full spec per job:  {untemplated * 1e6:.1f} us/job")
+    print(f"per-rule template:  {templated * 1e6:.1f} us/job")
+    print(f"speedup:            {untemplated / templated:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
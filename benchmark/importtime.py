@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+# Compare the time to import the plugin (what --help, dry runs, and the
+# plugin registry pay) against importing everything the executor uses.
+# Each import runs in a fresh interpreter.
+#
+# pip install .
+# python benchmark/importtime.py --repeats 10
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+# Importing the plugin package (and with it, the Executor class)
+plugin = "import snakemake_executor_plugin_kueue"
+
+# What the executor loads once it runs, and what the plugin used to
+# load (and parse a kubeconfig for) on import
+eager = (
+    plugin
+    + "; import snakemake_executor_plugin_kueue.watcher"
+    + "; import snakemake_executor_plugin_kueue.cleanup"
+)
+
+
+def timed(code, repeats):
+    """
+    Median wall time of importing code in a new interpreter, minus startup.
+    """
+    times = []
+    for _ in range(repeats):
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "import time; start = time.perf_counter(); "
+                + code
+                + "; print(time.perf_counter() - start)",
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        times.append(float(result.stdout.strip().splitlines()[-1]))
+    return statistics.median(times)
+
+
+def kubernetes_loaded():
+    """
+    Check that importing the plugin does not import the Kubernetes client.
+    """
+    code = plugin + "; import sys; print('kubernetes' in sys.modules)"
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return result.stdout.strip() == "True"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark plugin import time")
+    parser.add_argument("--repeats", type=int, default=10)
+    args = parser.parse_args()
+
+    lazy = timed(plugin, args.repeats)
+    full = timed(eager, args.repeats)
+    print(f"import plugin:        {lazy * 1e3:.1f} ms")
+    print(f"import with client:   {full * 1e3:.1f} ms")
+    print(f"speedup:              {full / lazy:.1f}x")
+    print(f"kubernetes imported:  {kubernetes_loaded()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+
+# Run many synthetic jobs through the executor (run_jobs, and the status
+# checks of the wait thread) against the fake API server, and report the
+# overhead on the head node.
+#
+# pip install .
+# python benchmark/loadtest.py --jobs 10000 --latency 2
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+from snakemake_executor_plugin_kueue import ExecutorSettings
+from snakemake_executor_plugin_kueue.executor import KueueExecutor
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+kubeconfig = """apiVersion: v1
+kind: Config
+clusters:
+- name: fake
+  cluster:
+    server: http://127.0.0.1:{port}
+users:
+- name: fake
+  user:
+    token: fake
+contexts:
+- name: fake
+  context:
+    cluster: fake
+    user: fake
+current-context: fake
+"""
+
+
+class Job:
+    """
+    Just enough of a Snakemake job to run through the executor.
+    """
+
+    attempt = 1
+    is_updated = False
+
+    def __init__(self, jobid, name="hello_world"):
+        self.jobid = jobid
+        self.name = name
+        self.rules = [name]
+        self.resources = {"_cores": 1, "_nodes": 1, "kueue_memory": "200Mi"}
+
+    def is_group(self):
+        return False
+
+    def logfile_suggestion(self, prefix):
+        return os.path.join(prefix, f"{self.name}-{self.jobid}.log")
+
+    def register(self, external_jobid=None):
+        pass
+
+    def log_info(self):
+        pass
+
+    def log_error(self, msg=None, **kwargs):
+        pass
+
+
+class Scheduler:
+    """
+    Record what Snakemake would be told about each job.
+    """
+
+    def __init__(self):
+        self.submitted = set()
+        self.reported = set()
+        self.succeeded = 0
+        self.failed = 0
+        self.submitting = True
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+
+    def check(self):
+        if not self.submitting and self.submitted <= self.reported:
+            self.done.set()
+
+    def submissions_done(self):
+        with self.lock:
+            self.submitting = False
+            self.check()
+
+    def submit_callback(self, job):
+        with self.lock:
+            self.submitted.add(job.jobid)
+
+    def finish_callback(self, job):
+        with self.lock:
+            self.succeeded += 1
+            self.reported.add(job.jobid)
+            self.check()
+
+    def error_callback(self, job):
+        with self.lock:
+            self.failed += 1
+            self.reported.add(job.jobid)
+            self.check()
+
+    def executor_error_callback(self, error):
+        print(f"executor error: {error}", file=sys.stderr)
+        self.done.set()
+
+
+class Workflow:
+    """
+    The parts of the workflow the executor (and RemoteExecutor) use.
+    """
+
+    dag = None
+
+    def __init__(self, settings, snakefile, scheduler, check_interval):
+        self.executor_settings = settings
+        self.main_snakefile = snakefile
+        self.scheduler = scheduler
+        self.persistence = Namespace(path=".snakemake")
+        self.storage_settings = Namespace(shared_fs_usage=set())
+        self.remote_execution_settings = Namespace(
+            max_status_checks_per_second=100,
+            seconds_between_status_checks=check_interval,
+            jobname="snakejob.{name}.{jobid}.sh",
+            jobscript=None,
+            immediate_submit=False,
+        )
+        self.executor_plugin = Namespace(
+            common_settings=Namespace(init_seconds_before_status_checks=0)
+        )
+        self.spawned_job_args_factory = Namespace(envvars=lambda: {})
+
+
+class Namespace:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class Logger:
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+
+    def log(self, message):
+        if self.verbose:
+            print(message, file=sys.stderr)
+
+    info = debug = warning = error = log
+
+
+class BenchmarkExecutor(KueueExecutor):
+    """
+    The executor, recording when each job is reported.
+
+    We don't format a full Snakemake command per job (that needs a real
+    workflow), everything else is the executor as is.
+    """
+
+    def __post_init__(self):
+        self.reported = {}
+
+    def get_job_command(self, job):
+        return f"echo {job.jobid}"
+
+    def record(self, job_info):
+        self.reported[job_info.aux["crd"].jobname] = time.time()
+
+    def report_job_success(self, job_info):
+        self.record(job_info)
+        super().report_job_success(job_info)
+
+    def report_job_error(self, job_info, msg=None, **kwargs):
+        if "crd" in job_info.aux:
+            self.record(job_info)
+        super().report_job_error(job_info, msg=msg, **kwargs)
+
+
+def start_server(args):
+    """
+    Start the fake API server in its own process, so we only measure ours.
+    """
+    command = [
+        sys.executable,
+        os.path.join(here, "fakeapi.py"),
+        "--latency",
+        str(args.latency),
+        "--admission-delay",
+        str(args.admission_delay),
+        "--capacity",
+        str(args.capacity),
+        "--runtime",
+        str(args.runtime),
+        "--failure-rate",
+        str(args.failure_rate),
+        "--error-rate",
+        str(args.error_rate),
+        "--throttle-rate",
+        str(args.throttle_rate),
+        "--lost-rate",
+        str(args.lost_rate),
+    ]
+    server = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    port = int(server.stdout.readline().split()[-1])
+    return server, port
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run(args, workdir, port):
+    settings = ExecutorSettings(
+        kubeconfig=os.path.join(workdir, "kubeconfig"),
+        watch=not args.poll,
+        io_concurrency=args.io_concurrency,
+        submit_concurrency=args.submit_concurrency,
+        qps=args.qps,
+        burst=args.burst,
+        pack_size=args.pack_size,
+        track_workloads=not args.no_workloads,
+        max_pending=args.max_pending,
+        metrics_file=args.metrics_file,
+    )
+    with open(settings.kubeconfig, "w") as fd:
+        fd.write(kubeconfig.format(port=port))
+    snakefile = os.path.join(workdir, "Snakefile")
+    with open(snakefile, "w") as fd:
+        fd.write("rule hello_world:\n    shell: 'echo hello'\n")
+
+    scheduler = Scheduler()
+    workflow = Workflow(settings, snakefile, scheduler, args.check_interval)
+    cpu = cpu_seconds()
+    start = time.time()
+    executor = BenchmarkExecutor(workflow, Logger(args.verbose))
+
+    # Snakemake hands over ready jobs in batches (a failed submission
+    # would stop the workflow, here we count it and go on)
+    errors = 0
+    jobs = [Job(jobid) for jobid in range(args.jobs)]
+    for i in range(0, len(jobs), args.batch):
+        try:
+            executor.run_jobs(jobs[i : i + args.batch])
+        except Exception as e:
+            errors += 1
+            executor.logger.error(f"Submission failed: {e}")
+
+    # Wait for the last (partial) packs to go out
+    if args.pack_size:
+        time.sleep(executor.packer.window + 1)
+
+    # And for the submission pool to submit (or fail) every job
+    while time.time() - start < args.timeout:
+        with scheduler.lock:
+            if len(scheduler.submitted | scheduler.reported) >= args.jobs:
+                break
+        time.sleep(0.05)
+    submitted = time.time() - start
+    scheduler.submissions_done()
+
+    finished = scheduler.done.wait(args.timeout)
+    elapsed = time.time() - start
+    executor.shutdown()
+    return {
+        "executor": executor,
+        "scheduler": scheduler,
+        "submitted": submitted,
+        "errors": errors,
+        "elapsed": elapsed,
+        "finished": finished,
+        "cpu": cpu_seconds() - cpu,
+    }
+
+
+def report(args, result, stats):
+    executor = result["executor"]
+    scheduler = result["scheduler"]
+    requests = stats["requests"]
+    total = sum(requests.values())
+
+    delays = [
+        executor.reported[name] - done
+        for name, done in stats["finished"].items()
+        if name in executor.reported
+    ]
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    print(f"jobs:                 {args.jobs}")
+    print(
+        f"reported:             {scheduler.succeeded} succeeded, "
+        f"{scheduler.failed} failed" + ("" if result["finished"] else " (timed out)")
+    )
+    print(f"submission errors:    {result['errors']}")
+    print(f"jobs run by cluster:  {len(stats['finished'])}")
+    print(f"submissions/sec:      {args.jobs / result['submitted']:.1f}")
+    print(f"wall time:            {result['elapsed']:.1f}s")
+    print(f"api calls per job:    {total / args.jobs:.2f}")
+    for verb, count in sorted(requests.items(), key=lambda item: -item[1]):
+        print(f"  {verb + ':':<30}{count:>8} ({count / args.jobs:.2f}/job)")
+    print(f"head node cpu:        {result['cpu']:.1f}s")
+    print(f"head node max rss:    {rss:.0f} MiB")
+    if delays:
+        print(
+            f"finish to report:     {statistics.median(delays):.2f}s median, "
+            f"{percentile(delays, 0.95):.2f}s p95, {max(delays):.2f}s max"
+        )
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description="Load test against a fake cluster")
+    parser.add_argument("--jobs", type=int, default=10000)
+    parser.add_argument("--batch", type=int, default=100, help="Jobs per run_jobs")
+    parser.add_argument("--timeout", type=float, default=1800)
+    parser.add_argument("--check-interval", type=float, default=1)
+    parser.add_argument("--verbose", action="store_true", help="Show executor logs")
+
+    # The fake cluster
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--admission-delay", type=float, default=0.5)
+    parser.add_argument("--capacity", type=int, default=0)
+    parser.add_argument("--runtime", type=float, default=1)
+    parser.add_argument("--failure-rate", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--throttle-rate", type=float, default=0)
+    parser.add_argument("--lost-rate", type=float, default=0)
+
+    # The executor
+    parser.add_argument("--poll", action="store_true", help="Poll instead of watch")
+    parser.add_argument("--no-workloads", action="store_true")
+    parser.add_argument("--io-concurrency", type=int, default=16)
+    parser.add_argument("--submit-concurrency", type=int, default=16)
+    parser.add_argument("--qps", type=float, default=50)
+    parser.add_argument("--burst", type=int, default=100)
+    parser.add_argument("--pack-size", type=int, default=None)
+    parser.add_argument("--max-pending", type=int, default=None)
+    parser.add_argument(
+        "--metrics-file", default=None, help="Job timelines and API latency"
+    )
+    return parser
+
+
+def main():
+    args = get_parser().parse_args()
+    server, port = start_server(args)
+    cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            os.chdir(workdir)
+            os.makedirs(".snakemake")
+            result = run(args, workdir, port)
+            url = f"http://127.0.0.1:{port}/benchmark/stats"
+            with urllib.request.urlopen(url) as response:
+                stats = json.load(response)
+            os.chdir(cwd)
+        report(args, result, stats)
+    finally:
+        os.chdir(cwd)
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
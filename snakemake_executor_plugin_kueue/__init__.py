@@ -1,3 +1,4 @@
+import os
 from dataclasses import dataclass, field
 from typing import Optional
 from snakemake_interface_executor_plugins.settings import (
@@ -79,6 +80,316 @@ class ExecutorSettings(ExecutorSettingsBase):
             "required": False,
         },
     )
+    kubeconfig: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "Path to the kubeconfig (defaults to KUBECONFIG or ~/.kube/config, "
+            "then in-cluster config)",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    context: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "Kubeconfig context to use (defaults to the current context)",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    watch: Optional[bool] = field(
+        default=True,
+        metadata={
+            "help": "Track job status with one LIST+WATCH stream per run "
+            "instead of reading each job (defaults to True)",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    submit_concurrency: Optional[int] = field(
+        default=16,
+        metadata={
+            "help": "Jobs to generate and submit at once, off the scheduler "
+            "thread (1 submits one at a time, defaults to 16)",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    io_concurrency: Optional[int] = field(
+        default=16,
+        metadata={
+            "help": "Maximum concurrent Kubernetes requests for status checks, "
+            "logs, and cleanup (defaults to 16)",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    pool_size: Optional[int] = field(
+        default=None,
+        metadata={
+            "help": "Connections in the shared Kubernetes client pool "
+            "(defaults to submit plus io concurrency, plus room for watches)",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    keep_alive: Optional[int] = field(
+        default=60,
+        metadata={
+            "help": "Idle seconds before TCP keep-alive probes on pooled "
+            "connections (0 disables, defaults to 60)",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    request_timeout: Optional[int] = field(
+        default=60,
+        metadata={
+            "help": "Timeout in seconds for Kubernetes requests that are not "
+            "streams (defaults to 60)",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    qps: Optional[float] = field(
+        default=50,
+        metadata={
+            "help": "Maximum Kubernetes requests per second, with submissions and "
+            "status checks ahead of logs and cleanup (defaults to 50)",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    burst: Optional[int] = field(
+        default=100,
+        metadata={
+            "help": "Requests allowed in a burst above qps (defaults to 100)",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    pack_size: Optional[int] = field(
+        default=None,
+        metadata={
+            "help": "Pack up to this many ready jobs of the same rule and "
+            "resources into one Indexed Job (defaults to unset, no packing)",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    pack_window: Optional[float] = field(
+        default=2,
+        metadata={
+            "help": "Seconds to wait for more jobs before submitting a pack "
+            "that isn't full (defaults to 2)",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    track_workloads: Optional[bool] = field(
+        default=True,
+        metadata={
+            "help": "Read Kueue workloads to report admission and queue position "
+            "(defaults to True)",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    max_pending: Optional[int] = field(
+        default=None,
+        metadata={
+            "help": "Hold back submissions while this many workloads are pending "
+            "in the queue (defaults to unset)",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    metrics_file: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "Write job timelines and API latencies to this file at the end "
+            "(.json, or .csv)",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    metrics_port: Optional[int] = field(
+        default=None,
+        metadata={
+            "help": "Serve metrics for Prometheus on this port (defaults to unset)",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    follow_logs: Optional[bool] = field(
+        default=False,
+        metadata={
+            "help": "Stream pod logs to the job logfile while the job runs",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    log_limit: Optional[int] = field(
+        default=None,
+        metadata={
+            "help": "Maximum bytes of pod logs to keep per job (defaults to unset)",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    unschedulable_timeout: Optional[int] = field(
+        default=600,
+        metadata={
+            "help": "Fail a job whose pod can't be scheduled for this many seconds "
+            "(0 waits forever, defaults to 600)",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    shared_workdir: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "ReadWriteMany persistent volume claim with the working "
+            "directory, mounted at the same path in all jobs so outputs are "
+            "written in place. Set it as SNAKEMAKE_KUEUE_SHARED_WORKDIR, since "
+            "Snakemake decides what jobs share before reading arguments "
+            "(defaults to unset)",
+            "env_var": True,
+            "required": False,
+        },
+    )
+    checkpoint_claim: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "Mount this persistent volume claim in job pods, with a "
+            "directory per job in SNAKEMAKE_KUEUE_CHECKPOINT to resume from",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    prepull: Optional[bool] = field(
+        default=False,
+        metadata={
+            "help": "Pre-pull job containers on every node with a DaemonSet "
+            "(removed at the end), and run jobs by image digest",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    workers: Optional[int] = field(
+        default=None,
+        metadata={
+            "help": "Run small jobs on up to this many warm worker pods instead "
+            "of a pod per job (defaults to unset)",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    worker_cores: Optional[int] = field(
+        default=1,
+        metadata={
+            "help": "Cores for each worker, jobs that need more get their own "
+            "pod (defaults to 1)",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    worker_memory: Optional[str] = field(
+        default="1Gi",
+        metadata={
+            "help": "Memory for each worker, jobs that need more get their own "
+            "pod (defaults to 1Gi)",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    worker_idle: Optional[int] = field(
+        default=60,
+        metadata={
+            "help": "Seconds a worker waits for a job before it is removed "
+            "(defaults to 60)",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    flux_session: Optional[bool] = field(
+        default=False,
+        metadata={
+            "help": "Run flux-operator jobs in one MiniCluster of --kueue-nodes "
+            "nodes that lives for the whole run, with flux submit",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    journal: Optional[bool] = field(
+        default=True,
+        metadata={
+            "help": "Record submitted jobs under .snakemake, so a restarted run "
+            "adopts jobs that are still running (defaults to True)",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    rightsize: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "Record peak CPU and memory per rule, and suggest requests "
+            "(suggest) or use them (apply) (defaults to unset)",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    rightsize_percentile: Optional[int] = field(
+        default=95,
+        metadata={
+            "help": "Percentile of past peak usage to request (defaults to 95)",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    rightsize_headroom: Optional[int] = field(
+        default=20,
+        metadata={
+            "help": "Percent to add to past usage for requests (defaults to 20)",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    priority_classes: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "Kueue WorkloadPriorityClass by remaining critical path length, "
+            "highest first (e.g., high=10,medium=3,low=0)",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    cache_path: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "Cache storage inputs in this directory on each node (hostPath)",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    cache_claim: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": "Cache storage inputs in this (node local) persistent volume "
+            "claim instead of a hostPath",
+            "env_var": False,
+            "required": False,
+        },
+    )
+    cache_size: Optional[int] = field(
+        default=100,
+        metadata={
+            "help": "Evict least recently used inputs from the cache above this "
+            "many GiB (defaults to 100)",
+            "env_var": False,
+            "required": False,
+        },
+    )
 
 
 # Required:
@@ -91,5 +402,7 @@ common_settings = CommonSettings(
     # are expected to specify False here.
     job_deploy_sources=True,
     non_local_exec=True,
-    implies_no_shared_fs=True,
+    # Snakemake decides what jobs share before the executor exists, so a
+    # shared working directory can only come from the environment
+    implies_no_shared_fs=not os.environ.get("SNAKEMAKE_KUEUE_SHARED_WORKDIR"),
 )
@@ -0,0 +1,143 @@
+import queue
+import threading
+import time
+
+from snakemake.logging import logger
+
+import snakemake_executor_plugin_kueue.custom_resource as cr
+
+
+class CleanupQueue:
+    """
+    Delete finished jobs in the background, in batches.
+
+    Finished objects are grouped by kind and namespace, and each group is
+    removed with label selected delete_collection requests instead of
+    several requests per job. Failed batches are retried with backoff, and
+    on_cleanup (if given) is called with each batch that was deleted.
+    """
+
+    def __init__(
+        self,
+        api,
+        workflow_uid,
+        batch_size=100,
+        interval=2,
+        retries=5,
+        on_cleanup=None,
+    ):
+        self.api = api
+        self.workflow_uid = workflow_uid
+        self.on_cleanup = on_cleanup
+        self.batch_size = batch_size
+        self.interval = interval
+        self.retries = retries
+
+        self.queue = queue.Queue()
+        self.retrying = []
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, name="kueue-cleanup", daemon=True
+        )
+
+    def start(self):
+        self.thread.start()
+
+    def put(self, crd):
+        """
+        Queue a finished job for cleanup.
+        """
+        self.queue.put((0, crd))
+
+    def stop(self):
+        """
+        Stop the worker and make one last attempt at anything left.
+        """
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        self.flush(final=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.flush()
+
+    @property
+    def run_selector(self):
+        return self.selector(self.workflow_uid)
+
+    def selector(self, workflow_uid):
+        return f"{cr.workflow_label}={workflow_uid}"
+
+    def workflow_uid_of(self, crd):
+        """
+        The run a job is labeled with (an earlier run, if it was adopted)
+        """
+        return getattr(crd, "workflow_uid", None) or self.workflow_uid
+
+    def take(self, final=False):
+        """
+        Take queued jobs, and retries that are due (or all of them if final).
+        """
+        items = []
+        while True:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+
+        now = time.time()
+        due = [x for x in self.retrying if final or x[0] <= now]
+        self.retrying = [x for x in self.retrying if not final and x[0] > now]
+        return items + [(attempt, crd) for _, attempt, crd in due]
+
+    def flush(self, final=False):
+        """
+        Delete everything queued, one batch per kind and namespace.
+        """
+        groups = {}
+        for attempt, crd in self.take(final):
+            key = (type(crd), crd.settings.namespace, self.workflow_uid_of(crd))
+            groups.setdefault(key, []).append((attempt, crd))
+
+        for (kind, namespace, workflow_uid), items in groups.items():
+            for start in range(0, len(items), self.batch_size):
+                batch = items[start : start + self.batch_size]
+                crds = [crd for _, crd in batch]
+                submissions = ",".join(sorted({crd.submission for crd in crds}))
+                selector = (
+                    f"{self.selector(workflow_uid)},"
+                    f"{cr.submission_label} in ({submissions})"
+                )
+                try:
+                    kind.delete_batch(self.api, namespace, crds, selector)
+                except Exception as e:
+                    self.retry(batch, e, final)
+                    continue
+                if self.on_cleanup is not None:
+                    self.on_cleanup(crds)
+
+    def retry(self, batch, error, final=False):
+        """
+        Schedule a failed batch to be tried again later, with backoff.
+        """
+        for attempt, crd in batch:
+            if final or attempt + 1 >= self.retries:
+                logger.warning(f"Could not clean up {crd.jobname}: {error}")
+                continue
+            not_before = time.time() + min(2**attempt, 60)
+            self.retrying.append((not_before, attempt + 1, crd))
+
+    def delete_run(self, crds):
+        """
+        Delete everything from the workflow run, e.g., on cancel.
+
+        This is one request per kind and namespace (and run, for jobs
+        adopted from an earlier one), regardless of how many jobs are active.
+        """
+        groups = {}
+        for crd in crds:
+            key = (type(crd), crd.settings.namespace, self.workflow_uid_of(crd))
+            groups.setdefault(key, []).append(crd)
+        for (kind, namespace, workflow_uid), items in groups.items():
+            kind.delete_batch(self.api, namespace, items, self.selector(workflow_uid))
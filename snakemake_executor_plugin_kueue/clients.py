@@ -0,0 +1,251 @@
+import socket
+import threading
+import time
+
+import yaml
+from kubernetes import client, config
+from kubernetes.client.rest import ApiException
+from kubernetes.stream import stream
+from kubernetes.stream.ws_client import ERROR_CHANNEL
+from snakemake.logging import logger
+from urllib3.connection import HTTPConnection
+from urllib3.exceptions import HTTPError
+
+import snakemake_executor_plugin_kueue.metrics as metrics
+import snakemake_executor_plugin_kueue.ratelimit as ratelimit
+
+
+def load_configuration(kubeconfig=None, context=None):
+    """
+    Load client configuration from a kubeconfig, or from in-cluster config.
+
+    We only fall back to in-cluster config (e.g., when Snakemake itself runs
+    in a pod) if no kubeconfig or context was asked for.
+    """
+    configuration = client.Configuration()
+    try:
+        config.load_kube_config(
+            config_file=kubeconfig,
+            context=context,
+            client_configuration=configuration,
+        )
+    except config.ConfigException as e:
+        if kubeconfig or context:
+            raise
+        logger.debug(f"No kubeconfig found ({e}), trying in-cluster config")
+        config.load_incluster_config(client_configuration=configuration)
+    return configuration
+
+
+class PooledApiClient(client.ApiClient):
+    """
+    An ApiClient that applies a default timeout to (non streaming) requests,
+    and sends every request through the rate limiter.
+
+    Watches and followed logs are long lived streams, so they are not cut
+    off by the default. A 429 is retried after Retry-After. The latency of
+    each request (not counting time in the limiter) is recorded per endpoint.
+    """
+
+    def __init__(
+        self,
+        configuration,
+        request_timeout=None,
+        limiter=None,
+        retries=5,
+        latencies=None,
+    ):
+        super().__init__(configuration)
+        self.request_timeout = request_timeout
+        self.limiter = limiter or ratelimit.RateLimiter()
+        self.retries = retries
+        self.latencies = latencies or metrics.Latencies()
+
+    def call_api(self, resource_path, method, *args, **kwargs):
+        if kwargs.get("_request_timeout") is None and kwargs.get(
+            "_preload_content", True
+        ):
+            kwargs["_request_timeout"] = self.request_timeout
+
+        lane = ratelimit.request_lane(resource_path, method)
+        path = metrics.endpoint(resource_path, args[0] if args else None)
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire(lane)
+            start = time.monotonic()
+            try:
+                result = super().call_api(resource_path, method, *args, **kwargs)
+                self.latencies.observe(method, path, time.monotonic() - start)
+                return result
+            except ApiException as e:
+                elapsed = time.monotonic() - start
+                self.latencies.observe(method, path, elapsed, e.status)
+                if e.status != 429 or attempt == self.retries:
+                    raise
+                delay = ratelimit.retry_after(e, attempt)
+                logger.debug(f"Throttled on {method} {resource_path}, waiting {delay}s")
+                self.limiter.pause(delay)
+
+
+def is_transient(error):
+    """
+    Is a failed request worth retrying (server error, timeout, dropped connection)?
+    """
+    if isinstance(error, ApiException):
+        return error.status in [0, None, 500, 502, 503, 504]
+    return isinstance(error, (HTTPError, ConnectionError, TimeoutError))
+
+
+def is_missing(error):
+    """
+    Did a request fail because the object is not there?
+    """
+    return isinstance(error, ApiException) and error.status == 404
+
+
+def exit_code(error):
+    """
+    Get the exit code from the error channel of an exec.
+    """
+    try:
+        status = yaml.safe_load(error)
+        if status["status"] == "Success":
+            return 0
+        return int(status["details"]["causes"][0]["message"])
+    except Exception:
+        return 1
+
+
+class ClientManager:
+    """
+    One pooled Kubernetes API client, shared by the executor and all jobs.
+
+    Creating API objects per call means a new connection pool (and TLS
+    handshake) each time, so everything should use the APIs here.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self._api_client = None
+        self._exec_client = None
+        self.lock = threading.Lock()
+        self.limiter = ratelimit.RateLimiter(settings.qps, settings.burst)
+        self.latencies = metrics.Latencies()
+
+    # Long lived watches (jobs, pods and miniclusters), each holds a connection
+    watches = 3
+
+    # Room for the cleanup, log follower and other background threads
+    spare = 8
+
+    @property
+    def pool_size(self):
+        """
+        Leave room for the submit and io pools plus the long lived watches.
+        """
+        if self.settings.pool_size:
+            return self.settings.pool_size
+        return (
+            (self.settings.submit_concurrency or 1)
+            + (self.settings.io_concurrency or 1)
+            + self.watches
+            + self.spare
+        )
+
+    @property
+    def api_client(self):
+        with self.lock:
+            if self._api_client is None:
+                self._api_client = self.create_api_client()
+        return self._api_client
+
+    def create_api_client(self):
+        # Make sure your cluster is running!
+        configuration = load_configuration(
+            self.settings.kubeconfig, self.settings.context
+        )
+        configuration.connection_pool_maxsize = self.pool_size
+        api_client = PooledApiClient(
+            configuration,
+            request_timeout=self.settings.request_timeout,
+            limiter=self.limiter,
+            latencies=self.latencies,
+        )
+
+        # TCP keep-alive, so idle pooled connections aren't silently dropped
+        if self.settings.keep_alive:
+            socket_options = HTTPConnection.default_socket_options + [
+                (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            ]
+            if hasattr(socket, "TCP_KEEPIDLE"):
+                socket_options.append(
+                    (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, self.settings.keep_alive)
+                )
+            pool_manager = api_client.rest_client.pool_manager
+            pool_manager.connection_pool_kw["socket_options"] = socket_options
+        return api_client
+
+    @property
+    def apps_v1(self):
+        return client.AppsV1Api(self.api_client)
+
+    @property
+    def batch_v1(self):
+        return client.BatchV1Api(self.api_client)
+
+    @property
+    def core_v1(self):
+        return client.CoreV1Api(self.api_client)
+
+    @property
+    def custom_objects(self):
+        return client.CustomObjectsApi(self.api_client)
+
+    @property
+    def exec_client(self):
+        """
+        A client for exec only, created once.
+
+        The stream swaps the request function of its client, so exec can't
+        use the shared one. Execs running at once swap in the same websocket
+        request, so they can share this one.
+        """
+        configuration = self.api_client.configuration
+        with self.lock:
+            if self._exec_client is None:
+                self._exec_client = client.ApiClient(configuration)
+        return self._exec_client
+
+    def exec(self, namespace, pod, container, command, out):
+        """
+        Run a command in a pod, writing its output to out, and return the
+        exit code (it still takes a token).
+        """
+        self.limiter.acquire("submit")
+        core_api = client.CoreV1Api(self.exec_client)
+        response = stream(
+            core_api.connect_get_namespaced_pod_exec,
+            pod,
+            namespace,
+            container=container,
+            command=command,
+            stdout=True,
+            stderr=True,
+            stdin=False,
+            tty=False,
+            _preload_content=False,
+        )
+        error = ""
+        try:
+            while response.is_open():
+                response.update(timeout=5)
+                error += response.peek_channel(ERROR_CHANNEL)
+                out.write(response.read_all())
+        finally:
+            response.close()
+        return exit_code(error)
+
+    def close(self):
+        if self._api_client is not None:
+            self._api_client.close()
+        if self._exec_client is not None:
+            self._exec_client.close()
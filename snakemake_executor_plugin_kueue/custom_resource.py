@@ -1,11 +1,65 @@
+import abc
+import os
+import threading
 from enum import Enum
 
-from kubernetes import client, config
+from kubernetes import client
+from kubernetes.client.rest import ApiException
 from snakemake.logging import logger
 
+import snakemake_executor_plugin_kueue.clients as clients
+import snakemake_executor_plugin_kueue.inputcache as inputcache
+import snakemake_executor_plugin_kueue.logs as logs
+import snakemake_executor_plugin_kueue.priority as priority
 import snakemake_executor_plugin_kueue.utils as utils
 
-config.load_kube_config()
+# Labels stamped on every object so one selector finds a workflow run (or job)
+workflow_label = "snakemake-kueue/workflow-uid"
+jobid_label = "snakemake-kueue/jobid"
+
+# Snakemake retries a job with the same job id, so cleanup selects on this
+submission_label = "snakemake-kueue/submission"
+
+# Where the checkpoint volume is mounted in job pods
+checkpoint_path = "/snakemake_checkpoint"
+
+
+def shared_workdir(settings):
+    """
+    Where jobs mount the shared working directory, or None if they don't.
+
+    It is the working directory of the run, so the paths Snakemake gives
+    jobs are the same in their pods.
+    """
+    if not settings.shared_workdir:
+        return
+    return os.getcwd()
+
+
+def workdir_volume(settings):
+    """
+    The working directory volume: the shared claim, or a directory per pod.
+    """
+    if shared_workdir(settings):
+        return client.V1Volume(
+            name="workdir-mount",
+            persistent_volume_claim=client.V1PersistentVolumeClaimVolumeSource(
+                claim_name=settings.shared_workdir
+            ),
+        )
+    return client.V1Volume(
+        name="workdir-mount", empty_dir=client.V1EmptyDirVolumeSource()
+    )
+
+
+def minicluster_volumes(settings):
+    """
+    The shared working directory as a MiniCluster container volume, if any.
+    """
+    path = shared_workdir(settings)
+    if not path:
+        return {}
+    return {"workdir-mount": {"path": path, "claimName": settings.shared_workdir}}
 
 
 class JobStatus(Enum):
@@ -15,6 +69,7 @@ class JobStatus(Enum):
     SUCCEEDED = 4
     UNKNOWN = 5
     PENDING = 6
+    QUEUED = 7
 
 
 class KubernetesObject:
@@ -22,48 +77,128 @@ class KubernetesObject:
     Shared class and functions for Kubernetes object.
     """
 
-    def __init__(self, job, snakefile, settings):
+    def __init__(
+        self,
+        job,
+        snakefile,
+        settings,
+        workflow_uid=None,
+        api=None,
+        templates=None,
+        sizing=None,
+        priority_class=None,
+    ):
         self.job = job
         self.snakefile = snakefile
         self.settings = settings
+        self.workflow_uid = workflow_uid
+
+        # The job id we label with (from an earlier run, if adopted)
+        self.jobid = str(job.jobid)
+        self.attempt = job.attempt
+        self.submission = f"{self.jobid}-{self.attempt}"
+
+        # Failed pods seen, and how many of them Kueue evicted
+        self.last_failed = 0
+        self.failed_baseline = 0
+        self.api = api or clients.ClientManager(settings)
+
+        # Serialized specs shared across jobs (usually by the executor)
+        self.templates = templates if templates is not None else {}
         self.jobname = None
         self.snakefile_dir = "/snakemake_workdir"
 
-    def write_log(self, logfile):
+        # More files for the config map, next to the Snakefile
+        self.files = {}
+
+        # Past usage of the rule, to size requests (if enabled)
+        self.sizing = sizing
+
+        # Kueue WorkloadPriorityClass, if any
+        self.priority_class = priority_class
+
+    def resource_requests(self):
+        """
+        CPU and memory to request, from the job (or from past runs of the rule).
+        """
+        cores = self.job.resources.get("_cores")
+        memory = self.job.resources.get("kueue_memory", "200Mi") or "200Mi"
+        if self.sizing is not None:
+            cores, memory = self.sizing.requests(self.job, cores, memory)
+        return cores, memory
+
+    def write_log(self, logfile, pods=None):
         pass
 
     def cleanup(self):
         pass
 
+    def finished(self):
+        """
+        Mark the job finished, returning what should be cleaned up (if anything)
+        """
+        return self
+
     def delete_pods(self, name):
         """
         Delete namespaced pods.
         """
-        with client.ApiClient() as api_client:
-            api = client.CoreV1Api(api_client)
-            pods = api.list_namespaced_pod(
+        api = self.api.core_v1
+        pods = api.list_namespaced_pod(
+            namespace=self.settings.namespace,
+            label_selector=f"job-name={name}",
+        )
+        for pod in pods.items:
+            api.delete_namespaced_pod(
                 namespace=self.settings.namespace,
-                label_selector=f"job-name={name}",
+                name=pod.metadata.name,
             )
-            for pod in pods.items:
-                api.delete_namespaced_pod(
-                    namespace=self.settings.namespace,
-                    name=pod.metadata.name,
-                )
+
+    @property
+    def run_labels(self):
+        """
+        Labels that scope an object to the workflow run, job, and attempt.
+        """
+        if not self.workflow_uid:
+            return {}
+        return {
+            workflow_label: self.workflow_uid,
+            jobid_label: self.jobid,
+            submission_label: self.submission,
+        }
+
+    @property
+    def kueue_labels(self):
+        """
+        Labels Kueue reads from the job: the queue, and the priority class.
+        """
+        labels = {"kueue.x-k8s.io/queue-name": self.settings.queue_name}
+        if self.priority_class:
+            labels[priority.priority_label] = self.priority_class
+        return labels
+
+    @classmethod
+    def delete_batch(cls, api, namespace, crds, label_selector):
+        """
+        Delete a batch of finished objects selected by label.
+        """
+        pass
 
     @property
     def snakefile_configmap(self):
-        return self.jobprefix + "-snakefile"
+        """
+        One config map per submission, so attempts and runs don't share it.
+        """
+        return self.submission_name + "-snakefile"
 
     def delete_snakemake_configmap(self):
         """
         Delete the config map.
         """
-        with client.ApiClient() as api_client:
-            api = client.CoreV1Api(api_client)
-            api.delete_namespaced_config_map(
-                namespace=self.settings.namespace, name=self.snakefile_configmap
-            )
+        api = self.api.core_v1
+        api.delete_namespaced_config_map(
+            namespace=self.settings.namespace, name=self.snakefile_configmap
+        )
 
     def prepare_annotations(self):
         """
@@ -72,6 +207,12 @@ class KubernetesObject:
         annotations = {}
         return annotations
 
+    def configmap_data(self):
+        """
+        Files for the Snakefile config map.
+        """
+        return {"snakefile": utils.read_file(self.snakefile), **self.files}
+
     def create_snakemake_configmap(self):
         """
         Create a config map for the Snakefile
@@ -80,13 +221,31 @@ class KubernetesObject:
             api_version="v1",
             kind="ConfigMap",
             metadata=client.V1ObjectMeta(
-                name=self.snakefile_configmap, namespace=self.settings.namespace
+                name=self.snakefile_configmap,
+                namespace=self.settings.namespace,
+                labels=self.run_labels,
             ),
-            data={"snakefile": utils.read_file(self.snakefile)},
+            data=self.configmap_data(),
         )
-        with client.ApiClient() as api_client:
-            api = client.CoreV1Api(api_client)
+        api = self.api.core_v1
+        try:
             api.create_namespaced_config_map(namespace=self.settings.namespace, body=cm)
+        except ApiException as e:
+            if e.status != 409:
+                raise
+
+            # Left from a submission we retry, anything else is not ours
+            existing = api.read_namespaced_config_map(
+                self.snakefile_configmap, self.settings.namespace
+            )
+            labels = existing.metadata.labels or {}
+            if not self.run_labels or any(
+                labels.get(key) != value for key, value in self.run_labels.items()
+            ):
+                raise
+            api.replace_namespaced_config_map(
+                self.snakefile_configmap, self.settings.namespace, cm
+            )
 
     @property
     def jobprefix(self):
@@ -95,6 +254,17 @@ class KubernetesObject:
         """
         return ("snakejob-%s-%s" % (self.job.name, self.job.jobid)).replace("_", "-")
 
+    @property
+    def submission_name(self):
+        """
+        The object name, the same when a submission is retried.
+
+        A create that timed out may still have gone through, and a retry
+        with the same name gets a conflict instead of a second job.
+        """
+        suffix = f"-{(self.workflow_uid or '')[:8]}-{self.attempt}"
+        return self.jobprefix[: 63 - len(suffix)].rstrip("-") + suffix
+
     @property
     def job_artifact(self):
         """
@@ -111,24 +281,47 @@ class BatchJob(KubernetesObject):
     A default kubernetes batch job.
     """
 
-    def status(self):
+    @property
+    def shards(self):
         """
-        Get the status of the batch job.
+        Number of (Indexed) pods the job runs over, one unless sharded.
+        """
+        return max(1, int(self.job.resources.get("kueue_shards") or 1))
 
-        This should return one of four JobStatus. Note
-        that we likely need to tweak the logic here.
+    def fetch(self):
         """
-        batch_api = client.BatchV1Api()
+        Read the batch job, raising if we cannot (a 404 if it is gone).
+        """
+        return self.api.batch_v1.read_namespaced_job(
+            self.jobname, self.settings.namespace
+        )
 
-        # This is providing the name, and namespace
+    def read(self):
+        """
+        Read the batch job, or None if we cannot (yet).
+        """
         try:
-            job = batch_api.read_namespaced_job(self.jobname, self.settings.namespace)
+            return self.fetch()
         except Exception as e:
             logger.debug(str(e))
+
+    def status(self, job=None):
+        """
+        Get the status of the batch job.
+
+        This should return one of four JobStatus. Note
+        that we likely need to tweak the logic here. If the
+        job is provided (e.g., from the status cache) we don't read it.
+        """
+        # This is providing the name, and namespace
+        if job is None:
+            job = self.read()
+        if job is None:
             return JobStatus.PENDING
 
-        # Any failure consider the job a failure
-        if job.status.failed is not None and job.status.failed > 0:
+        # Any failure consider the job a failure (but not pods Kueue evicted)
+        self.last_failed = job.status.failed or 0
+        if self.last_failed > self.failed_baseline:
             return JobStatus.FAILED
 
         # Any jobs either active or ready, we aren't done yet
@@ -150,14 +343,55 @@ class BatchJob(KubernetesObject):
         We do an extra check for the pods, sometimes I don't
         see them deleted with the batch job.
         """
-        batch_api = client.BatchV1Api()
+        batch_api = self.api.batch_v1
         batch_api.delete_namespaced_job(
             name=self.jobname,
             namespace=self.settings.namespace,
+            propagation_policy="Background",
         )
         self.delete_pods(self.jobname)
         self.delete_snakemake_configmap()
 
+    @classmethod
+    def delete_batch(cls, api, namespace, crds, label_selector):
+        """
+        Delete jobs, pods, and config maps with one request per kind.
+
+        Pods are deleted with the job (background propagation), but we
+        also delete them by label since they sometimes linger.
+        """
+        batch_api = api.batch_v1
+        batch_api.delete_collection_namespaced_job(
+            namespace,
+            label_selector=label_selector,
+            propagation_policy="Background",
+        )
+        core_api = api.core_v1
+        core_api.delete_collection_namespaced_pod(
+            namespace, label_selector=label_selector
+        )
+        core_api.delete_collection_namespaced_config_map(
+            namespace, label_selector=label_selector
+        )
+
+    def cache_volume(self):
+        """
+        The input cache, a local persistent volume claim or a hostPath.
+        """
+        if self.settings.cache_claim:
+            return client.V1Volume(
+                name="cache-mount",
+                persistent_volume_claim=client.V1PersistentVolumeClaimVolumeSource(
+                    claim_name=self.settings.cache_claim
+                ),
+            )
+        return client.V1Volume(
+            name="cache-mount",
+            host_path=client.V1HostPathVolumeSource(
+                path=self.settings.cache_path, type="DirectoryOrCreate"
+            ),
+        )
+
     def submit(self, job):
         """
         Receive the job back and submit it.
@@ -165,40 +399,79 @@ class BatchJob(KubernetesObject):
         This could easily be one function, but instead we are allowing
         the user to get it back (and possibly inspect) and then submit.
         """
-        batch_api = client.BatchV1Api()
+        batch_api = self.api.batch_v1
 
         # Create a config map for the Snakefile
         self.create_snakemake_configmap()
-        result = batch_api.create_namespaced_job(self.settings.namespace, job)
+        try:
+            result = batch_api.create_namespaced_job(self.settings.namespace, job)
+        except ApiException as e:
+            # We are retrying a create that went through
+            if e.status != 409:
+                raise
+            result = batch_api.read_namespaced_job(
+                self.submission_name, self.settings.namespace
+            )
         self.jobname = result.metadata.name
         return result
 
-    def write_log(self, logfile):
+    def log_pods(self, pods=None):
         """
-        Write the job output to a logfile.
+        Get pods associated with the job (unless we already know them).
 
         Pods associated with a job will have a label for "jobname"
             metadata:
             labels:
                job-name: tacos46bqw
         """
-        with client.ApiClient() as api_client:
-            api = client.CoreV1Api(api_client)
-            pods = api.list_namespaced_pod(
-                namespace=self.settings.namespace,
-                label_selector=f"job-name={self.jobname}",
-            )
-            # Write new file for the job if existed
-            utils.write_file(f"==== Job {self.jobname}\n", logfile)
-            for pod in pods.items:
-                utils.append_file(f"==== Pod {pod.metadata.name}\n", logfile)
-                log = api.read_namespaced_pod_log(
-                    name=pod.metadata.name,
-                    namespace=self.settings.namespace,
-                    container=self.jobprefix,
-                )
-                logger.debug(f"Writing output for {pod.metadata.name} to {logfile}")
-                utils.append_file(log, logfile)
+        if pods is not None:
+            return pods
+        api = self.api.core_v1
+        return api.list_namespaced_pod(
+            namespace=self.settings.namespace,
+            label_selector=f"job-name={self.jobname}",
+        ).items
+
+    def write_pod_log(self, pod, filename, limit_bytes=None):
+        """
+        Stream the log for one pod to file, without holding it in memory.
+        """
+        logger.debug(f"Writing output for {pod.metadata.name} to {filename}")
+        api = self.api.core_v1
+        response = api.read_namespaced_pod_log(
+            name=pod.metadata.name,
+            namespace=self.settings.namespace,
+            container=self.jobprefix,
+            limit_bytes=limit_bytes,
+            _preload_content=False,
+        )
+        return logs.stream_log(response, filename)
+
+    def follow_pod_log(self, pod, filename, limit_bytes=None):
+        """
+        Start following the log for one (running) pod to file.
+        """
+        return logs.LogFollower(
+            self.api.core_v1,
+            self.settings.namespace,
+            pod.metadata.name,
+            self.jobprefix,
+            filename,
+            limit=limit_bytes,
+        ).start()
+
+    def write_log(self, logfile, pods=None):
+        """
+        Write the job output to a logfile.
+
+        If pods are provided (e.g., from the status cache) we don't list them.
+        """
+        limit = self.settings.log_limit
+        parts = {}
+        for pod in self.log_pods(pods):
+            parts[pod.metadata.name] = f"{logfile}.{pod.metadata.name}"
+            self.write_pod_log(pod, parts[pod.metadata.name], limit)
+        logs.concatenate(self.jobname, parts, logfile, limit)
 
     def generate(
         self,
@@ -209,23 +482,93 @@ class BatchJob(KubernetesObject):
         environment=None,
     ):
         """
-        Generate a CRD for a snakemake Job to run on Kubernetes.
+        Generate a (serialized) CRD for a snakemake Job to run on Kubernetes.
+
+        The full spec is built and serialized once per rule, operator, and
+        container. Each job then only patches in its own fields.
+        """
+        environment = environment or {}
+        key = (
+            self.job.name,
+            "job",
+            image,
+            command,
+            tuple(sorted(environment.items())),
+            self.shards,
+        )
+        template = self.templates.get(key)
+        if template is None:
+            spec = self.build(image, command, args, environment=environment)
+            template = self.api.api_client.sanitize_for_serialization(spec)
+            self.templates[key] = template
+        return self.patch(template, args)
+
+    def patch(self, template, args):
+        """
+        Copy a serialized template, replacing only the per job fields.
+
+        Everything we don't replace is shared with the template, so it
+        must not be changed in place.
+        """
+        cores, memory = self.resource_requests()
+
+        metadata = dict(template["metadata"])
+        metadata["name"] = self.submission_name
+        metadata["labels"] = {
+            **self.kueue_labels,
+            **self.run_labels,
+        }
+
+        container = dict(template["spec"]["template"]["spec"]["containers"][0])
+        container["name"] = self.jobprefix
+        container["args"] = args
+        container["resources"] = {"requests": {"cpu": cores, "memory": memory}}
+
+        # The first volume is the config map with the Snakefile
+        volumes = list(template["spec"]["template"]["spec"]["volumes"])
+        volumes[0] = dict(volumes[0])
+        volumes[0]["configMap"] = {
+            **volumes[0]["configMap"],
+            "name": self.snakefile_configmap,
+        }
+
+        pod = dict(template["spec"]["template"])
+        pod["metadata"] = {"labels": {"app": "registry", **self.run_labels}}
+        pod["spec"] = {
+            **pod["spec"],
+            "containers": [container],
+            "volumes": volumes,
+        }
+
+        spec = {**template["spec"], "template": pod}
+        return {**template, "metadata": metadata, "spec": spec}
+
+    def build(
+        self,
+        image,
+        command,
+        args,
+        deadline=None,
+        environment=None,
+    ):
+        """
+        Build a CRD for a snakemake Job to run on Kubernetes.
 
         This function is intended for batchv1/Job, and we will eventually
         support others for the MPI Operator and Flux Operator.
         """
         deadline = self.job.resources.get("runtime")
-        nodes = self.job.resources.get("_nodes")
-        cores = self.job.resources.get("_cores")
-        memory = self.job.resources.get("kueue_memory", "200Mi") or "200Mi"
+        cores, memory = self.resource_requests()
+        shards = self.shards
 
         # Prepare annotations for the job spec
         annotations = self.prepare_annotations()
 
         metadata = client.V1ObjectMeta(
-            generate_name=self.jobprefix,
+            name=self.submission_name,
             labels={
-                "kueue.x-k8s.io/queue-name": self.settings.queue_name,
+                **self.kueue_labels,
+                **self.run_labels,
             },
             annotations=annotations,
         )
@@ -235,20 +578,24 @@ class BatchJob(KubernetesObject):
         for key, value in environment.items():
             environ.append({"name": key, "value": value})
 
+        # Each shard also gets JOB_COMPLETION_INDEX from Kubernetes
+        if shards > 1:
+            environ.append({"name": "SNAKEMAKE_KUEUE_SHARDS", "value": str(shards)})
+
         # Job container
         container = client.V1Container(
             image=image,
             name=self.jobprefix,
             command=[command],
             args=args,
-            working_dir=self.settings.working_dir,
+            working_dir=shared_workdir(self.settings) or self.settings.working_dir,
             volume_mounts=[
                 client.V1VolumeMount(
                     mount_path=self.snakefile_dir,
                     name="snakefile-mount",
                 ),
                 client.V1VolumeMount(
-                    mount_path="/workdir",
+                    mount_path=shared_workdir(self.settings) or "/workdir",
                     name="workdir-mount",
                     read_only=False,
                 ),
@@ -267,28 +614,48 @@ class BatchJob(KubernetesObject):
 
         # Prepare volumes (with config map)
         # TODO add volume to minicluster
+        items = [client.V1KeyToPath(key="snakefile", path="Snakefile")]
+        items += [client.V1KeyToPath(key=key, path=key) for key in self.files]
         volumes = [
             client.V1Volume(
                 name="snakefile-mount",
                 config_map=client.V1ConfigMapVolumeSource(
                     name=self.snakefile_configmap,
-                    items=[
-                        client.V1KeyToPath(
-                            key="snakefile",
-                            path="Snakefile",
-                        )
-                    ],
+                    items=items,
                 ),
             ),
-            client.V1Volume(
-                name="workdir-mount", empty_dir=client.V1EmptyDirVolumeSource()
-            ),
+            workdir_volume(self.settings),
         ]
 
+        # Node local cache for storage inputs, shared by pods on the node
+        if inputcache.enabled(self.settings):
+            container.volume_mounts.append(
+                client.V1VolumeMount(
+                    mount_path=inputcache.mount_path, name="cache-mount"
+                )
+            )
+            volumes.append(self.cache_volume())
+
+        # Shared volume for jobs to checkpoint to, that outlives their pods
+        if self.settings.checkpoint_claim:
+            container.volume_mounts.append(
+                client.V1VolumeMount(
+                    mount_path=checkpoint_path, name="checkpoint-mount"
+                )
+            )
+            volumes.append(
+                client.V1Volume(
+                    name="checkpoint-mount",
+                    persistent_volume_claim=client.V1PersistentVolumeClaimVolumeSource(
+                        claim_name=self.settings.checkpoint_claim
+                    ),
+                )
+            )
+
         # Job template (this has the selector hard coded, should be a variable)
         template = {
             "metadata": {
-                "labels": {"app": "registry"},
+                "labels": {"app": "registry", **self.run_labels},
             },
             "spec": {
                 "containers": [container],
@@ -299,15 +666,210 @@ class BatchJob(KubernetesObject):
             },
         }
 
+        # One run of the job, or one Indexed pod per shard (spread over nodes)
+        spec = client.V1JobSpec(
+            parallelism=shards, completions=shards, suspend=False, template=template
+        )
+        if shards > 1:
+            spec.completion_mode = "Indexed"
+            if self.workflow_uid:
+                template["spec"]["topologySpreadConstraints"] = [
+                    client.V1TopologySpreadConstraint(
+                        max_skew=1,
+                        topology_key="kubernetes.io/hostname",
+                        when_unsatisfiable="ScheduleAnyway",
+                        label_selector=client.V1LabelSelector(
+                            match_labels={workflow_label: self.workflow_uid}
+                        ),
+                        match_label_keys=["batch.kubernetes.io/job-name"],
+                    )
+                ]
+
         return client.V1Job(
             api_version="batch/v1",
             kind="Job",
             metadata=metadata,
-            spec=client.V1JobSpec(
-                parallelism=nodes, completions=3, suspend=False, template=template
-            ),
+            spec=spec,
+        )
+
+
+class PackedBatchJob(BatchJob):
+    """
+    Many small jobs of the same rule and resources, as one Indexed Job.
+
+    Each index runs the command for one job (from the config map), and each
+    job is tracked (and reported to Snakemake) by its own PackedJob.
+    """
+
+    # Annotation on the pods of an Indexed Job
+    index_annotation = "batch.kubernetes.io/job-completion-index"
+
+    def __init__(self, jobs, snakefile, settings, **kwargs):
+        super().__init__(jobs[0], snakefile, settings, **kwargs)
+        self.jobs = jobs
+        self.commands = []
+        self.done = set()
+        self.lock = threading.Lock()
+        self.members = [PackedJob(self, index) for index in range(len(jobs))]
+
+    @property
+    def jobprefix(self):
+        return super().jobprefix + "-pack"
+
+    def configmap_data(self):
+        """
+        Add a script with the command for each index.
+        """
+        data = super().configmap_data()
+        for index, command in enumerate(self.commands):
+            data[f"job-{index}"] = command
+        return data
+
+    def finish(self, index):
+        """
+        Mark one index finished, returning True when all of them are.
+        """
+        with self.lock:
+            self.done.add(index)
+            return len(self.done) == len(self.jobs)
+
+    def generate(self, image, command, commands, environment=None):
+        """
+        Generate an Indexed Job that runs one command per index.
+
+        A failed index doesn't fail the others (backoffLimitPerIndex).
+        """
+        self.commands = commands
+        script = f"{self.snakefile_dir}/job-$JOB_COMPLETION_INDEX.sh"
+        spec = self.build(
+            image, command, ["-c", f"bash {script}"], environment=environment
+        )
+
+        config_map = spec.spec.template["spec"]["volumes"][0].config_map
+        for index in range(len(commands)):
+            config_map.items.append(
+                client.V1KeyToPath(key=f"job-{index}", path=f"job-{index}.sh")
+            )
+
+        spec.spec.completions = len(commands)
+        spec.spec.parallelism = len(commands)
+        spec.spec.completion_mode = "Indexed"
+        spec.spec.backoff_limit_per_index = 0
+        return spec
+
+
+class TrackedJob(abc.ABC):
+    """
+    A job without a Kubernetes object of its own (it is packed in an Indexed
+    Job, or runs on a warm worker or in the Flux session), with the
+    interface the executor expects of a CRD.
+
+    Subclasses have a jobname and settings, and say how to get the status
+    and log, and what is cleaned up when the job finishes or is cancelled.
+    Pods they give without a status are not followed.
+    """
+
+    def __init__(self, job):
+        self.job = job
+
+    @classmethod
+    @abc.abstractmethod
+    def delete_batch(cls, api, namespace, crds, label_selector):
+        pass
+
+    @abc.abstractmethod
+    def status(self, job=None):
+        pass
+
+    @abc.abstractmethod
+    def log_pods(self, pods=None):
+        pass
+
+    @abc.abstractmethod
+    def write_pod_log(self, pod, filename, limit_bytes=None):
+        pass
+
+    @abc.abstractmethod
+    def finished(self):
+        pass
+
+
+class PackedJob(TrackedJob):
+    """
+    One job in a pack, tracked by its index in the Indexed Job.
+    """
+
+    def __init__(self, pack, index):
+        super().__init__(pack.jobs[index])
+        self.pack = pack
+        self.index = index
+
+    @property
+    def jobname(self):
+        return self.pack.jobname
+
+    @property
+    def settings(self):
+        return self.pack.settings
+
+    @property
+    def workflow_uid(self):
+        return self.pack.workflow_uid
+
+    @property
+    def submission(self):
+        return self.pack.submission
+
+    @classmethod
+    def delete_batch(cls, api, namespace, crds, label_selector):
+        """
+        Delete the packs of these jobs (e.g., on cancel), each one once.
+        """
+        packs = {id(crd.pack): crd.pack for crd in crds}
+        PackedBatchJob.delete_batch(
+            api, namespace, list(packs.values()), label_selector
         )
 
+    def status(self, job=None):
+        """
+        Get the status of this index from the Indexed Job.
+        """
+        if job is None:
+            job = self.pack.read()
+        if job is None:
+            return JobStatus.PENDING
+        if self.index in utils.parse_indexes(job.status.completed_indexes):
+            return JobStatus.SUCCEEDED
+        if self.index in utils.parse_indexes(job.status.failed_indexes):
+            return JobStatus.FAILED
+
+        # Without backoffLimitPerIndex we only know that the job failed
+        for condition in job.status.conditions or []:
+            if condition.type == "Failed" and condition.status == "True":
+                return JobStatus.FAILED
+        return JobStatus.ACTIVE
+
+    def log_pods(self, pods=None):
+        return [
+            pod
+            for pod in self.pack.log_pods(pods)
+            if (pod.metadata.annotations or {}).get(self.pack.index_annotation)
+            == str(self.index)
+        ]
+
+    def write_pod_log(self, pod, filename, limit_bytes=None):
+        return self.pack.write_pod_log(pod, filename, limit_bytes)
+
+    def follow_pod_log(self, pod, filename, limit_bytes=None):
+        return self.pack.follow_pod_log(pod, filename, limit_bytes)
+
+    def finished(self):
+        """
+        The pack is cleaned up once every job in it is finished.
+        """
+        if self.pack.finish(self.index):
+            return self.pack
+
 
 class FluxMiniCluster(BatchJob):
     """
@@ -327,15 +889,27 @@ class FluxMiniCluster(BatchJob):
         """
         Receive the job back and submit it.
         """
-        crd_api = client.CustomObjectsApi()
+        crd_api = self.api.custom_objects
         self.create_snakemake_configmap()
-        result = crd_api.create_namespaced_custom_object(
-            group=self.group,
-            version=self.version,
-            namespace=self.settings.namespace,
-            plural=self.plural,
-            body=job,
-        )
+        try:
+            result = crd_api.create_namespaced_custom_object(
+                group=self.group,
+                version=self.version,
+                namespace=self.settings.namespace,
+                plural=self.plural,
+                body=job,
+            )
+        except ApiException as e:
+            # We are retrying a create that went through
+            if e.status != 409:
+                raise
+            result = crd_api.get_namespaced_custom_object(
+                group=self.group,
+                version=self.version,
+                namespace=self.settings.namespace,
+                plural=self.plural,
+                name=self.submission_name,
+            )
         self.jobname = result["metadata"]["name"]
         return result
 
@@ -343,7 +917,7 @@ class FluxMiniCluster(BatchJob):
         """
         Cleanup the minicluster
         """
-        crd_api = client.CustomObjectsApi()
+        crd_api = self.api.custom_objects
         result = crd_api.delete_namespaced_custom_object(
             name=self.jobname,
             group=self.group,
@@ -354,6 +928,33 @@ class FluxMiniCluster(BatchJob):
         self.delete_snakemake_configmap()
         return result
 
+    @classmethod
+    def delete_batch(cls, api, namespace, crds, label_selector):
+        """
+        Delete MiniClusters and their config maps.
+
+        The custom objects client can't delete a collection by label,
+        so MiniClusters (usually few) are deleted by name.
+        """
+        crd_api = api.custom_objects
+        for crd in crds:
+            try:
+                crd_api.delete_namespaced_custom_object(
+                    name=crd.jobname,
+                    group=cls.group,
+                    version=cls.version,
+                    namespace=namespace,
+                    plural=cls.plural,
+                    propagation_policy="Background",
+                )
+            except ApiException as e:
+                if e.status != 404:
+                    raise
+        core_api = api.core_v1
+        core_api.delete_collection_namespaced_config_map(
+            namespace, label_selector=label_selector
+        )
+
     def generate(
         self,
         image,
@@ -368,7 +969,9 @@ class FluxMiniCluster(BatchJob):
         deadline = self.job.resources.get("runtime")
         cores = self.job.resources.get("_cores")
         nodes = self.job.resources.get("_nodes")
-        memory = self.job.resources.get("kueue_memory", "200Mi") or "200Mi"
+
+        # Flux needs whole cores, so only memory is sized from history
+        memory = self.resource_requests()[1]
         tasks = self.job.resources.get("kueue_tasks", 1) or 1
 
         # For the minicluster we split the command into sections
@@ -392,7 +995,7 @@ class FluxMiniCluster(BatchJob):
             "command": f"/bin/bash {filename}",
             "pullAlways": self.settings.pull_always is not None,
             "commands": {"pre": "\n".join(parts)},
-            "working_dir": self.settings.working_dir,
+            "working_dir": shared_workdir(self.settings) or self.settings.working_dir,
             "environment": environment,
             "launcher": True,
             "image": image,
@@ -401,7 +1004,8 @@ class FluxMiniCluster(BatchJob):
                     "path": self.snakefile_dir,
                     "configMapName": self.snakefile_configmap,
                     "items": {"snakefile": "Snakefile"},
-                }
+                },
+                **minicluster_volumes(self.settings),
             },
             "resources": {
                 "limits": {
@@ -418,11 +1022,15 @@ class FluxMiniCluster(BatchJob):
             "apiVersion": self.api_version,
             "kind": self.kind,
             "metadata": {
-                "generateName": self.jobprefix,
+                "name": self.submission_name,
                 "namespace": self.settings.namespace,
+                "labels": self.run_labels,
             },
             "spec": {
-                "job_labels": {"kueue.x-k8s.io/queue-name": self.settings.queue_name},
+                "job_labels": {
+                    **self.kueue_labels,
+                    **self.run_labels,
+                },
                 "flux": {"container": {"image": self.settings.flux_container}},
                 "containers": [container],
                 "interactive": self.settings.interactive is not None,
@@ -431,7 +1039,7 @@ class FluxMiniCluster(BatchJob):
                 "logging": {"quiet": False},
                 "pod": {
                     "annotations": self.prepare_annotations(),
-                    "labels": {"app": "registry"},
+                    "labels": {"app": "registry", **self.run_labels},
                 },
             },
         }
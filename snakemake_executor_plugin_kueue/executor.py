@@ -1,10 +1,13 @@
+import asyncio
+import copy
+import functools
 import os
+import threading
+import time
 from typing import Generator, List
 
-import time
 import hashlib
-from kubernetes import client, config
-from kubernetes.client.api import core_v1_api
+from concurrent.futures import ThreadPoolExecutor
 from snakemake.common import get_container_image
 from snakemake_interface_common.exceptions import WorkflowError  # noqa
 
@@ -12,6 +15,7 @@ from snakemake_interface_executor_plugins.executors.base import SubmittedJobInfo
 from snakemake_interface_executor_plugins.executors.remote import RemoteExecutor
 from snakemake_interface_executor_plugins.jobs import JobExecutorInterface
 from snakemake_interface_executor_plugins.logging import LoggerExecutorInterface
+from snakemake_interface_executor_plugins.settings import SharedFSUsage
 from snakemake_interface_executor_plugins.workflow import WorkflowExecutorInterface
 from snakemake_interface_executor_plugins.utils import (
     encode_target_jobs_cli_args,
@@ -19,31 +23,196 @@ from snakemake_interface_executor_plugins.utils import (
     join_cli_args,
 )
 
-import snakemake_executor_plugin_kueue.custom_resource as cr
+import snakemake_executor_plugin_kueue.failures as failures
+import snakemake_executor_plugin_kueue.inputcache as inputcache
+import snakemake_executor_plugin_kueue.journal as journal
+import snakemake_executor_plugin_kueue.metrics as metrics
+import snakemake_executor_plugin_kueue.packing as packing
+import snakemake_executor_plugin_kueue.priority as priority
+import snakemake_executor_plugin_kueue.utils as utils
+import snakemake_executor_plugin_kueue.workloads as workloads
 
 # import snakemake_executor_plugin_kueue.oras as oras
 
-# Make sure your cluster is running!
-config.load_kube_config()
-crd_api = client.CustomObjectsApi()
-api_client = crd_api.api_client
+# These import the Kubernetes client, which is slow, so we don't load
+# them until the executor runs (not for --help, dry runs, or plugin scans)
+cleanup = utils.lazy_import("snakemake_executor_plugin_kueue.cleanup")
+clients = utils.lazy_import("snakemake_executor_plugin_kueue.clients")
+cr = utils.lazy_import("snakemake_executor_plugin_kueue.custom_resource")
+fluxsession = utils.lazy_import("snakemake_executor_plugin_kueue.fluxsession")
+logs = utils.lazy_import("snakemake_executor_plugin_kueue.logs")
+prepull = utils.lazy_import("snakemake_executor_plugin_kueue.prepull")
+sizing = utils.lazy_import("snakemake_executor_plugin_kueue.sizing")
+watcher = utils.lazy_import("snakemake_executor_plugin_kueue.watcher")
+workers = utils.lazy_import("snakemake_executor_plugin_kueue.workers")
 
 
 class KueueExecutor(RemoteExecutor):
+    # Retries for a submission that fails with a server or connection error
+    submit_retries = 3
+
+    # Seconds between attempts to write the log of a job that isn't ready
+    log_retry_delay = 5
+
     def __init__(
         self,
         workflow: WorkflowExecutorInterface,
         logger: LoggerExecutorInterface,
     ):
+        # Snakemake decides what jobs share before the executor exists
+        if (
+            workflow.executor_settings.shared_workdir
+            and workflow.executor_plugin.common_settings.implies_no_shared_fs
+        ):
+            raise WorkflowError(
+                "Snakemake decided that jobs share no filesystem before "
+                "--kueue-shared-workdir was read, set it as "
+                "SNAKEMAKE_KUEUE_SHARED_WORKDIR instead"
+            )
+
+        # The wait thread starts in super().__init__, and sleeps with this
+        self._status_cache = None
+        self._status_lock = threading.Lock()
         super().__init__(workflow, logger)
 
         # Attach variables for easy access
         self.workdir = os.path.realpath(os.path.dirname(self.workflow.persistence.path))
         # self.envvars = list(self.workflow.envvars) or []
-        self._core_v1 = None
+
+        # One pooled client, shared by the executor and all jobs
+        self.api = clients.ClientManager(self.executor_settings)
+
+        # Jobs mount this claim at our working directory, and write in place
+        if self.executor_settings.shared_workdir:
+            self.logger.info(
+                f"Jobs share the working directory {os.getcwd()} "
+                f"(claim {self.executor_settings.shared_workdir})"
+            )
+
+        # Serialized job specs, per rule, operator, and container
+        self.spec_templates = {}
 
         # Upload the working directory to the oras cache
         self._workflow_uid = None
+
+        # Kueue's view of our jobs (admission) and of the queue (backpressure)
+        self.workloads = workloads.WorkloadTracker(
+            self.api,
+            self.executor_settings.namespace,
+            self.executor_settings.queue_name,
+            self.workflow_uid,
+            max_pending=self.executor_settings.max_pending,
+        )
+
+        # Small jobs of the same rule and resources can share an Indexed Job
+        self.packer = packing.JobPacker(
+            self.submit_pack,
+            size=self.executor_settings.pack_size,
+            window=self.executor_settings.pack_window,
+        )
+
+        # Jobs are generated and submitted in parallel, off the scheduler thread
+        self.submit_pool = None
+        if (self.executor_settings.submit_concurrency or 1) > 1:
+            self.submit_pool = ThreadPoolExecutor(
+                max_workers=self.executor_settings.submit_concurrency,
+                thread_name_prefix="kueue-submit",
+            )
+
+        # Bounded pool for blocking Kubernetes requests (status, logs, cleanup)
+        self.io_pool = ThreadPoolExecutor(
+            max_workers=self.executor_settings.io_concurrency or 1,
+            thread_name_prefix="kueue-io",
+        )
+
+        # When each job was submitted, admitted, started, finished, etc.
+        self.timelines = metrics.Timelines()
+        self.metrics_server = None
+        if self.executor_settings.metrics_port:
+            self.metrics_server = metrics.MetricsServer(
+                self.executor_settings.metrics_port, self.render_metrics
+            ).start()
+
+        # What we submitted, so a restarted run can adopt what is still running
+        self.journal = None
+        if self.executor_settings.journal:
+            self.journal = journal.SubmissionJournal(
+                os.path.join(".snakemake", "kueue_journal.jsonl")
+            )
+
+        # Peak usage of finished jobs, per rule, to size requests
+        self.sizing = None
+        self.usage = None
+        rightsize = self.executor_settings.rightsize
+        if rightsize:
+            if rightsize not in ["suggest", "apply"]:
+                raise WorkflowError("--kueue-rightsize must be suggest or apply")
+            self.sizing = sizing.ResourceHistory(
+                os.path.join(".snakemake", "kueue_resources.json"),
+                percent=self.executor_settings.rightsize_percentile or 95,
+                headroom=self.executor_settings.rightsize_headroom or 0,
+                apply=rightsize == "apply",
+            )
+            self.usage = sizing.UsageTracker(
+                self.api, self.executor_settings.namespace, self.workflow_uid
+            )
+
+        # Kueue priority classes, by how much of the workflow waits on a job
+        try:
+            classes = priority.parse_classes(self.executor_settings.priority_classes)
+        except ValueError as e:
+            raise WorkflowError(f"--kueue-priority-classes: {e}")
+        self.priorities = priority.CriticalPath(
+            getattr(self.workflow, "dag", None), classes
+        )
+        if classes:
+            self.priorities.check(self.api)
+
+        # Pull the images the workflow needs on every node, ahead of the jobs
+        self.prepuller = None
+        if self.executor_settings.prepull:
+            self.prepuller = prepull.ImagePrepuller(
+                self.api, self.executor_settings.namespace, self.workflow_uid
+            )
+            self.prepuller.add(self.workflow_images())
+
+        # Warm worker pods that run small jobs without a pod per job
+        self.worker_pool = None
+        if self.executor_settings.workers:
+            image = self.default_container
+            if self.prepuller is not None:
+                self.prepuller.add([image])
+            self.worker_pool = workers.WorkerPool(
+                self.api,
+                self.executor_settings,
+                snakefile=self.get_original_snakefile(),
+                workflow_uid=self.workflow_uid,
+                image=self.prepuller.pinned(image) if self.prepuller else image,
+                container=image,
+                environment=self.workflow.spawned_job_args_factory.envvars(),
+                timelines=self.timelines,
+            )
+
+        # One MiniCluster for the run, that flux-operator jobs are submitted to
+        self.flux_session = None
+        if self.executor_settings.flux_session:
+            image = self.default_container
+            if self.prepuller is not None:
+                self.prepuller.add([image])
+            self.flux_session = fluxsession.FluxSession(
+                self.api,
+                self.executor_settings,
+                snakefile=self.get_original_snakefile(),
+                workflow_uid=self.workflow_uid,
+                image=self.prepuller.pinned(image) if self.prepuller else image,
+                environment=self.workflow.spawned_job_args_factory.envvars(),
+            )
+
+        # Finished jobs are deleted in the background, in batches
+        self.cleanup_queue = cleanup.CleanupQueue(
+            self.api, self.workflow_uid, on_cleanup=self.cleaned
+        )
+        self.cleanup_queue.start()
         # self.oras = oras.OrasRegistry(self.executor_settings, self.workdir)
         self.last_job = None
         # if not self.executor_settings.disable_oras_cache:
@@ -52,24 +221,42 @@ class KueueExecutor(RemoteExecutor):
     @property
     def core_v1(self):
         """
-        Instantiate a core_v1 api (if not done yet)
+        A core_v1 api from the shared client.
 
         We have this here to interact with Kubernetes.
         """
-        if self._core_v1 is not None:
-            return self._core_v1
+        return self.api.core_v1
 
-        self.c = client.Configuration.get_default_copy()
-        self.c.assert_hostname = False
-        client.Configuration.set_default(self.c)
-        self._core_v1 = core_v1_api.CoreV1Api()
-        return self._core_v1
+    def start_status_cache(self):
+        """
+        Start the shared status cache for the run (if enabled and not done yet)
+        """
+        if self._status_cache is not None or not self.executor_settings.watch:
+            return self._status_cache
+
+        # Jobs are submitted from many threads
+        with self._status_lock:
+            if self._status_cache is None:
+                status_cache = watcher.StatusCache(
+                    self.api, self.executor_settings.namespace, self.workflow_uid
+                )
+                status_cache.start()
+                self._status_cache = status_cache
+        return self._status_cache
 
     def get_snakefile(self):
         """
         This gets called by format_job_exec, so we want to return
         the relative path in the container.
+
+        If jobs share the sources with us, they use the real Snakefile, so
+        its includes and scripts are found next to it.
         """
+        if (
+            self.executor_settings.shared_workdir
+            and SharedFSUsage.SOURCES in self.workflow.storage_settings.shared_fs_usage
+        ):
+            return self.workflow.main_snakefile
         return "/snakemake_workdir/Snakefile"
 
     def format_job_exec(self, job: JobExecutorInterface) -> str:
@@ -106,7 +293,7 @@ class KueueExecutor(RemoteExecutor):
                 format_cli_arg("--snakefile", self.get_snakefile()),
                 self.get_job_args(job),
                 general_args,
-                self.additional_general_args(),
+                *self.additional_general_args(),
                 # format_cli_arg("--mode", self.get_exec_mode().item_to_choice()),
                 format_cli_arg(
                     "--local-groupid",
@@ -130,6 +317,16 @@ class KueueExecutor(RemoteExecutor):
             args = args.replace(remove, "")
         return args
 
+    def additional_general_args(self):
+        """
+        Jobs keep local copies of storage inputs for the input cache to save.
+
+        The pod (and its copies) is thrown away after the job anyway.
+        """
+        if inputcache.enabled(self.executor_settings):
+            return ["--keep-storage-local-copies"]
+        return []
+
     def get_job_args(self, job: JobExecutorInterface, **kwargs):
         return join_cli_args(
             [
@@ -167,57 +364,335 @@ class KueueExecutor(RemoteExecutor):
         assert os.path.exists(self.workflow.main_snakefile)
         return self.workflow.main_snakefile
 
-    def run_job(self, job: JobExecutorInterface):
-        """
-        Run the job. This is a terrible docstring.
-        """
+    def get_logfile(self, job: JobExecutorInterface):
         logfile = job.logfile_suggestion(os.path.join(".snakemake", "kueue_logs"))
         os.makedirs(os.path.dirname(logfile), exist_ok=True)
+        return logfile
 
-        # The entire snakemake command to run, etc
+    def get_container(self, job: JobExecutorInterface):
+        """
+        First preference to job container, then executor settings, then default
+
+        Hard coding in custom build as default for compatibility issues
+        """
+        return job.resources.get("container") or self.default_container
+
+    @property
+    def default_container(self):
+        return (
+            self.executor_settings.container
+            or "vanessa/snakemake:kueue"
+            or get_container_image()
+        )
+
+    def get_image(self, job: JobExecutorInterface):
+        """
+        The container for a job, by digest if it is pre-pulled.
+        """
+        image = self.get_container(job)
+        if self.prepuller is None:
+            return image
+        self.prepuller.add([image])
+        return self.prepuller.pinned(image)
+
+    def workflow_images(self):
+        """
+        Containers for the jobs Snakemake still has to run.
+        """
+        needrun_jobs = getattr(self.workflow.dag, "needrun_jobs", None)
+        if needrun_jobs is None:
+            return set()
+        images = set()
+        for job in needrun_jobs():
+            if job.is_local:
+                continue
+
+            # Resources can depend on input that doesn't exist yet
+            try:
+                images.add(self.get_container(job))
+            except Exception as e:
+                self.logger.debug(f"Cannot get container for {job}: {e}")
+        return images
+
+    def get_job_command(self, job: JobExecutorInterface):
+        """
+        The entire snakemake command to run, echoed first.
+        """
         command = self.format_job_exec(job)
 
         # Not sure what this is, but doesn't exist in container
         # command = command.replace(" --mode 'remote'", "")
         self.logger.debug(command)
 
-        # First preference to job container, then executor settings, then default
-        # Hard coding in custom build as default for compatibility issues
-        container = (
-            job.resources.get("container")
-            or self.executor_settings.container
-            or "vanessa/snakemake:kueue"
-            or get_container_image()
+        # Add the run and push command
+        return " && ".join(
+            [
+                f"echo '{command}'",
+                command,
+            ]
         )
 
+    def log_kubectl_hint(self):
+        """
+        Tell the user how to debug or interact with kubectl
+        """
+        namespace = (
+            " "
+            if self.executor_settings.namespace == "default"
+            else f" --namespace {self.executor_settings.namespace} "
+        )
+        self.logger.info(
+            f"Use:\n'kubectl get{namespace}queue' to see queue assignment "
+            f"'kubectl get{namespace}jobs' to see jobs'"
+        )
+
+    def run_jobs(self, jobs: List[JobExecutorInterface]):
+        """
+        Run ready jobs, packing small ones together if enabled.
+        """
+        for job in jobs:
+            self.run_job_pre(job)
+            if self.worker_pool is not None and self.worker_pool.accepts(
+                job, self.get_container(job)
+            ):
+                self.run_on_worker(job)
+                continue
+            key = self.pack_key(job)
+            if key is None:
+                self.submit_job(job)
+            else:
+                self.packer.add(key, job)
+
+    def submit_job(self, job: JobExecutorInterface):
+        """
+        Submit a job with the submission pool (if enabled), or right here.
+        """
+        if self.submit_pool is None:
+            return self.run_job(job)
+        try:
+            self.submit_pool.submit(self.run_submission, job)
+        except RuntimeError:
+            # The pool is shut down, we are stopping
+            pass
+
+    def submit_pack(self, jobs: List[JobExecutorInterface]):
+        """
+        Submit a full (or timed out) pack with the submission pool, if enabled.
+        """
+        if self.submit_pool is None:
+            return self.run_pack(jobs)
+        try:
+            self.submit_pool.submit(self.run_pack, jobs)
+        except RuntimeError:
+            pass
+
+    def run_submission(self, job: JobExecutorInterface):
+        """
+        Submit one job from the pool, retrying transient errors.
+
+        Jobs are submitted off the scheduler thread, so report the error here.
+        """
+        for attempt in range(self.submit_retries + 1):
+            try:
+                return self.run_job(job)
+            except Exception as e:
+                if attempt < self.submit_retries and clients.is_transient(e):
+                    self.logger.debug(f"Retrying submission of {job}: {e}")
+                    time.sleep(2**attempt)
+                    continue
+                self.report_job_error(
+                    SubmittedJobInfo(job), msg=f"Kueue submission failed: {e}"
+                )
+                return
+
+    def submit_retrying(self, crd, spec):
+        """
+        Create a job, retrying transient errors (its name doesn't change).
+        """
+        for attempt in range(self.submit_retries + 1):
+            try:
+                return crd.submit(spec)
+            except Exception as e:
+                if attempt < self.submit_retries and clients.is_transient(e):
+                    self.logger.debug(
+                        f"Retrying submission of {crd.submission_name}: {e}"
+                    )
+                    time.sleep(2**attempt)
+                    continue
+                raise
+
+    def run_on_worker(self, job: JobExecutorInterface):
+        """
+        Queue a job for a warm worker.
+        """
+        logfile = self.get_logfile(job)
+        crd = self.worker_pool.submit(job, self.get_job_command(job), logfile)
+        self.timelines.record(crd.jobname, "submitted")
+        aux = {"crd": crd, "kueue_logfile": logfile}
+        self.report_job_submission(
+            SubmittedJobInfo(job, external_jobid=crd.jobname, aux=aux)
+        )
+
+    def run_in_session(self, job: JobExecutorInterface, command):
+        """
+        Submit a flux-operator job to the Flux session.
+        """
+        crd = self.flux_session.submit(job, command)
+        self.timelines.record(crd.jobname, "submitted")
+        aux = {"crd": crd, "kueue_logfile": self.get_logfile(job)}
+        self.report_job_submission(
+            SubmittedJobInfo(job, external_jobid=crd.jobname, aux=aux)
+        )
+
+    def pack_key(self, job: JobExecutorInterface):
+        """
+        Jobs with the same key can share an Indexed Job (None means no packing)
+        """
+        if (self.executor_settings.pack_size or 0) < 2 or job.is_group():
+            return
+        if (job.resources.get("kueue_operator") or "job") != "job":
+            return
+        if int(job.resources.get("kueue_shards") or 1) > 1:
+            return
+        return (
+            job.name,
+            self.get_container(job),
+            job.resources.get("_cores"),
+            job.resources.get("_nodes"),
+            job.resources.get("kueue_memory"),
+        )
+
+    def run_pack(self, jobs: List[JobExecutorInterface]):
+        """
+        Submit a pack of jobs as one Indexed Job, reporting each job on its own.
+        """
+        if len(jobs) == 1:
+            return self.run_job(jobs[0])
+        try:
+            pack = cr.PackedBatchJob(
+                jobs,
+                settings=self.executor_settings,
+                snakefile=self.get_original_snakefile(),
+                workflow_uid=self.workflow_uid,
+                api=self.api,
+                sizing=self.sizing,
+                priority_class=self.priorities.assign(jobs),
+            )
+            commands = [
+                self.use_input_cache(
+                    pack,
+                    job,
+                    self.use_checkpoint(job, self.get_job_command(job)),
+                    index,
+                )
+                for index, job in enumerate(jobs)
+            ]
+            spec = pack.generate(
+                image=self.get_image(jobs[0]),
+                command="/bin/bash",
+                commands=commands,
+                environment=self.workflow.spawned_job_args_factory.envvars(),
+            )
+            self.start_status_cache()
+            if not self.workloads.wait_for_capacity():
+                raise WorkflowError("cancelled while waiting for Kueue capacity")
+            try:
+                result = self.submit_retrying(pack, spec)
+            except Exception:
+                self.workloads.release()
+                raise
+            self.timelines.record(pack.jobname, "submitted")
+
+        # Packs are submitted off the scheduler thread, so report the error here
+        except Exception as e:
+            for job in jobs:
+                self.report_job_error(
+                    SubmittedJobInfo(job), msg=f"Kueue pack submission failed: {e}"
+                )
+            return
+
+        self.log_kubectl_hint()
+        for member in pack.members:
+            aux = {
+                "crd": member,
+                "kueue_logfile": self.get_logfile(member.job),
+                "spec": spec,
+                "result": result,
+            }
+            self.report_job_submission(
+                SubmittedJobInfo(
+                    member.job,
+                    external_jobid=f"{pack.jobname}:{member.index}",
+                    aux=aux,
+                )
+            )
+
+    def run_job(self, job: JobExecutorInterface):
+        """
+        Run the job. This is a terrible docstring.
+        """
+        logfile = self.get_logfile(job)
+
+        # The entire snakemake command to run, etc
+        command = self.get_job_command(job)
+        container = self.get_image(job)
+
         # Determine which CRD / operator to generate
         operator_type = job.resources.get("kueue_operator") or "job"
+        if (
+            operator_type == "flux-operator"
+            and self.flux_session is not None
+            and self.get_container(job) == self.default_container
+        ):
+            return self.run_in_session(job, command)
+        priority_class = self.priorities.assign([job])
         if operator_type == "job":
             crd = cr.BatchJob(
                 job,
                 settings=self.executor_settings,
                 snakefile=self.get_original_snakefile(),
+                workflow_uid=self.workflow_uid,
+                api=self.api,
+                templates=self.spec_templates,
+                sizing=self.sizing,
+                priority_class=priority_class,
             )
         elif operator_type == "flux-operator":
             crd = cr.FluxMiniCluster(
                 job,
                 settings=self.executor_settings,
                 snakefile=self.get_original_snakefile(),
+                workflow_uid=self.workflow_uid,
+                api=self.api,
+                templates=self.spec_templates,
+                sizing=self.sizing,
+                priority_class=priority_class,
             )
         else:
             raise WorkflowError(
                 "Currently only kueue_operator: job or flux-operator are supported."
             )
 
-        # Add the run and push command
-        command = " && ".join(
-            [
-                f"echo '{command}'",
-                command,
-            ]
-        )
+        if operator_type == "job":
+            command = self.use_input_cache(crd, job, self.use_checkpoint(job, command))
+
         envars = self.workflow.spawned_job_args_factory.envvars()
 
+        # A job from an earlier run with the same spec may still be running
+        key = journal.spec_hash(
+            job.name,
+            operator_type,
+            container,
+            command,
+            self.executor_settings.namespace,
+            envars,
+            crd.resource_requests(),
+            dict(job.resources.items()),
+            crd.configmap_data(),
+        )
+        if self.adopt(job, crd, key, logfile):
+            return
+
         # Generate the job first
         spec = crd.generate(
             image=container,
@@ -226,20 +701,23 @@ class KueueExecutor(RemoteExecutor):
             environment=envars,
         )
 
+        # Make sure the cache is watching before the first submit
+        self.start_status_cache()
+
+        # Hold back if Kueue already has too much pending
+        if not self.workloads.wait_for_capacity():
+            raise WorkflowError("cancelled while waiting for Kueue capacity")
+
         # We don't technically need to get it back, but
         # now we can explicitly submit it
-        result = crd.submit(spec)
-
-        # Tell the user how to debug or interact with kubectl
-        namespace = (
-            " "
-            if self.executor_settings.namespace == "default"
-            else f" --namespace {self.executor_settings.namespace} "
-        )
-        self.logger.info(
-            f"Use:\n'kubectl get{namespace}queue' to see queue assignment "
-            f"'kubectl get{namespace}jobs' to see jobs'"
-        )
+        try:
+            result = crd.submit(spec)
+        except Exception:
+            self.workloads.release()
+            raise
+        self.timelines.record(crd.jobname, "submitted")
+        self.record_submission(crd, operator_type, key)
+        self.log_kubectl_hint()
 
         # Save aux metadata and report job submission
         aux = {
@@ -252,6 +730,117 @@ class KueueExecutor(RemoteExecutor):
             SubmittedJobInfo(job, external_jobid=crd.jobname, aux=aux)
         )
 
+    def record_submission(self, crd, operator_type, key):
+        if self.journal is None:
+            return
+        self.journal.submitted(
+            jobid=crd.jobid,
+            submission=crd.submission,
+            name=crd.jobname,
+            namespace=crd.settings.namespace,
+            operator=operator_type,
+            spec_hash=key,
+            workflow_uid=crd.workflow_uid,
+            rule=crd.job.name,
+        )
+
+    def journal_finished(self, crd):
+        """
+        Mark a journaled job finished (packs, workers, and the session are not)
+        """
+        if self.journal is not None and isinstance(crd, cr.KubernetesObject):
+            self.journal.finished(crd.jobname)
+
+    def adopt(self, job: JobExecutorInterface, crd, key, logfile):
+        """
+        Track a job that an earlier run submitted (and that is still there)
+        instead of submitting it again, returning True if we did.
+        """
+        if self.journal is None:
+            return False
+        entry = self.journal.adopt(key)
+        if entry is None:
+            return False
+        adopted = copy.copy(crd)
+        adopted.jobname = entry["name"]
+        adopted.jobid = entry["jobid"]
+        adopted.submission = entry.get("submission", adopted.jobid)
+        adopted.workflow_uid = entry["workflow_uid"]
+        self.workloads.track(adopted.workflow_uid)
+
+        # Only a job we know is gone is submitted again, other errors (retried
+        # by run_submission if transient) could mean running it twice
+        try:
+            existing = adopted.fetch()
+        except Exception as e:
+            if not clients.is_missing(e):
+                raise
+            self.journal.finished(adopted.jobname)
+            return False
+
+        # A suspended job is waiting for Kueue to admit it
+        status = adopted.status(existing)
+        if status == cr.JobStatus.UNKNOWN and existing.spec.suspend:
+            status = cr.JobStatus.QUEUED
+
+        # A job that succeeded since is reported as it is, not run again
+        if status == cr.JobStatus.SUCCEEDED:
+            self.logger.info(
+                f"Kueue job '{adopted.jobname}' from an earlier run has succeeded"
+            )
+
+        # A job that failed (or we can't tell) is submitted again
+        elif status not in [
+            cr.JobStatus.ACTIVE,
+            cr.JobStatus.READY,
+            cr.JobStatus.PENDING,
+            cr.JobStatus.QUEUED,
+        ]:
+            self.cleanup_finished(adopted)
+            return False
+
+        crd = adopted
+        self.logger.info(
+            f"Adopting Kueue job '{crd.jobname}' from an earlier run ({status.name})"
+        )
+        self.timelines.record(crd.jobname, "submitted")
+        self.record_submission(crd, entry["operator"], key)
+        aux = {"crd": crd, "kueue_logfile": logfile, "kueue_adopted": True}
+        self.report_job_submission(
+            SubmittedJobInfo(job, external_jobid=crd.jobname, aux=aux)
+        )
+        return True
+
+    def use_checkpoint(self, job: JobExecutorInterface, command):
+        """
+        Give a job a directory on the checkpoint volume, removed on success.
+
+        It is the same for every attempt (and requeue) of the job.
+        """
+        if not self.executor_settings.checkpoint_claim:
+            return command
+        hasher = hashlib.md5()
+        hasher.update(str(job.get_target_spec()).encode("utf-8"))
+        path = f"{cr.checkpoint_path}/{job.name}-{hasher.hexdigest()[:12]}"
+        return (
+            f"export SNAKEMAKE_KUEUE_CHECKPOINT={path} && "
+            f"mkdir -p $SNAKEMAKE_KUEUE_CHECKPOINT && {command} && "
+            "rm -rf $SNAKEMAKE_KUEUE_CHECKPOINT"
+        )
+
+    def use_input_cache(self, crd, job, command, index=None):
+        """
+        Restore and save the storage inputs of a job with the node cache.
+
+        The script and a manifest of inputs go in the job config map.
+        """
+        if not inputcache.enabled(self.executor_settings):
+            return command
+        name = "cache-inputs" if index is None else f"cache-inputs-{index}"
+        crd.files["nodecache.py"] = inputcache.read_script()
+        crd.files[name] = inputcache.manifest(job, self.workflow.storage_settings)
+        return inputcache.wrap(command, self.executor_settings, crd.snakefile_dir, name)
+
     @property
     def workflow_uid(self):
         """
@@ -263,56 +852,470 @@ class KueueExecutor(RemoteExecutor):
             self._workflow_uid = hasher.hexdigest()
         return self._workflow_uid
 
-    async def check_active_jobs(
-        self, active_jobs: List[SubmittedJobInfo]
-    ) -> Generator[SubmittedJobInfo, None, None]:
-        # Loop through active jobs and act on status
+    def status_snapshots(self, active_jobs):
+        """
+        List the status of all active jobs, once per namespace.
+
+        This is used when we are not watching. If a list fails, the jobs
+        in that namespace fall back to being read one at a time.
+        """
+        namespaces = {}
         for j in active_jobs:
-            # Unwrap variables from auxiliary metadata
             crd = j.aux["crd"]
-            logfile = j.aux["kueue_logfile"]
-            aux_logs = [logfile]
-
-            self.logger.debug(f"Checking status for job {crd.jobname}")
-            status = crd.status()
-            print(status)
-
-            if status == cr.JobStatus.FAILED:
-                # Retrieve the job log and write to file
-                # An error usually means it's not done creating yet
-                # We can likely better handle this under custom resources
-                try:
-                    crd.write_log(logfile)
-                except Exception:
-                    time.sleep(5)
-                crd.cleanup()
-
-                # Tell the user about it
-                msg = f"Kueue job '{j.external_jobid}' failed.\n    See {logfile}. "
-                self.report_job_error(j, msg=msg, aux_logs=aux_logs)
+            is_minicluster = isinstance(crd, cr.FluxMiniCluster)
+            namespace = crd.settings.namespace
+            namespaces[namespace] = namespaces.get(namespace, False) or is_minicluster
+
+        snapshots = {}
+        for namespace, miniclusters in namespaces.items():
+            try:
+                snapshots[namespace] = watcher.StatusSnapshot(
+                    self.api, namespace, self.workflow_uid, miniclusters=miniclusters
+                )
+            except Exception as e:
+                self.logger.debug(f"Cannot list jobs in {namespace}: {e}")
+        return snapshots
+
+    def job_status(self, crd, statuses=None):
+        """
+        Get job status from the cache or a snapshot, falling back to a direct read.
+        """
+        if statuses is not None:
+            if isinstance(crd, cr.FluxMiniCluster) and statuses.minicluster_deleted(
+                crd.jobname
+            ):
+                return cr.JobStatus.FAILED
+            job = statuses.get_job(crd.jobname)
+            if job is not None:
+                return crd.status(job)
+        return crd.status()
+
+    def job_pods(self, crd, statuses=None):
+        """
+        Get known pods for a job (None means we need to list them).
+        """
+        if statuses is None:
+            return
+        return statuses.get_pods(crd.jobname) or None
+
+    async def sleep(self):
+        """
+        Wait for the next status check, waking early on a job event.
+
+        A burst of events still leaves max_status_checks_per_second between
+        checks, so the loop doesn't turn into polling.
+        """
+        if self._status_cache is None:
+            return await super().sleep()
+        interval = self.next_seconds_between_status_checks
+        floor = min(interval, 1 / self.max_status_checks_per_second)
+        started = time.monotonic()
+        await asyncio.to_thread(self._status_cache.wait, interval)
+        rest = floor - (time.monotonic() - started)
+        if rest > 0:
+            await asyncio.sleep(rest)
+
+    async def run_io(self, func, *args, **kwargs):
+        """
+        Run a blocking Kubernetes call without blocking the event loop.
+
+        The pool is bounded, so many jobs share a fixed number of requests
+        in flight.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.io_pool, functools.partial(func, *args, **kwargs)
+        )
+
+    async def fetch_log(self, j, statuses=None, retries=3):
+        """
+        Write the job log, retrying (without blocking) if it isn't ready yet.
+
+        Pod logs are streamed to parts concurrently (or finished by the
+        followers) and then concatenated. An error usually means it's not
+        done creating yet.
+        """
+        crd = j.aux["crd"]
+        logfile = j.aux["kueue_logfile"]
+        followers = j.aux.get("log_followers", {})
+        limit = self.executor_settings.log_limit
+
+        for attempt in range(retries):
+            try:
+                pods = await self.run_io(crd.log_pods, self.job_pods(crd, statuses))
+                self.timelines.observe_pods(crd.jobname, pods)
+                parts = {}
+                tasks = []
+                for name, follower in followers.items():
+                    parts[name] = follower.filename
+                    tasks.append(self.run_io(follower.join, 30))
+                for pod in pods:
+                    name = pod.metadata.name
+                    if name in parts:
+                        continue
+                    parts[name] = f"{logfile}.{name}"
+                    tasks.append(
+                        self.run_io(crd.write_pod_log, pod, parts[name], limit)
+                    )
+                await asyncio.gather(*tasks)
+                for follower in followers.values():
+                    follower.stop()
+                return await self.run_io(
+                    logs.concatenate, crd.jobname, parts, logfile, limit
+                )
+            except Exception as e:
+                self.logger.debug(f"Cannot write log for {crd.jobname}: {e}")
+                if attempt < retries - 1:
+                    await asyncio.sleep(self.log_retry_delay)
+
+    async def follow_logs(self, j, statuses=None):
+        """
+        Start following logs for the pods of a running job.
+        """
+        followers = j.aux.setdefault("log_followers", {})
+        if followers:
+            return
+        crd = j.aux["crd"]
+        try:
+            pods = await self.run_io(crd.log_pods, self.job_pods(crd, statuses))
+        except Exception as e:
+            self.logger.debug(f"Cannot follow logs for {crd.jobname}: {e}")
+            return
+        for pod in pods:
+            if pod.status is None or pod.status.phase == "Pending":
                 continue
+            name = pod.metadata.name
+            followers[name] = crd.follow_pod_log(
+                pod,
+                f"{j.aux['kueue_logfile']}.{name}",
+                self.executor_settings.log_limit,
+            )
+
+    async def check_active_job(self, j, snapshots):
+        """
+        Check and act on the status of one job, returning it if still active.
+        """
+        # Unwrap variables from auxiliary metadata
+        crd = j.aux["crd"]
+        logfile = j.aux["kueue_logfile"]
+        aux_logs = [logfile]
+        statuses = self._status_cache or snapshots.get(crd.settings.namespace)
+
+        # Adopted jobs are labeled for an earlier run, so we read them directly
+        if j.aux.get("kueue_adopted"):
+            statuses = None
+
+        self.logger.debug(f"Checking status for job {crd.jobname}")
+        status = await self.run_io(self.job_status, crd, statuses)
+        status = self.check_admission(j, status)
+
+        # Pods tell us when a job won't recover, long before the Job does
+        failure = await self.run_io(self.pod_failure, crd, status, statuses)
+        if failure is not None and (
+            status == cr.JobStatus.FAILED or not failure.retryable
+        ):
+            j.aux["kueue_failure"] = failure
+            await self.run_io(self.failure_events, crd, failure)
+            status = cr.JobStatus.FAILED
+
+        if status in [cr.JobStatus.FAILED, cr.JobStatus.SUCCEEDED]:
+            self.timelines.record(crd.jobname, "detected")
+            if statuses is not None:
+                self.timelines.observe_job(crd.jobname, statuses.get_job(crd.jobname))
+
+        if status in [cr.JobStatus.FAILED, cr.JobStatus.SUCCEEDED]:
+            await self.record_usage(j, status, statuses)
+
+        if status == cr.JobStatus.FAILED:
+            # Retrieve the job log and write to file (a broken pod may have none)
+            await self.fetch_log(j, statuses, retries=1 if failure else 3)
+            self.timelines.record(crd.jobname, "logs")
+
+            # Tell the user about it (and why, if Kueue or the pods say)
+            msg = f"Kueue job '{j.external_jobid}' failed"
+            if j.aux.get("kueue_deactivated"):
+                msg += f": {j.aux['kueue_deactivated']}"
+            elif failure is not None:
+                msg += f": {failure}"
+                msg += "".join(f"\n    {event}" for event in failure.events)
+            msg += f".\n    See {logfile}. "
+            self.report_job_error(j, msg=msg, aux_logs=aux_logs)
+            self.timelines.record(crd.jobname, "reported")
+            self.cleanup_finished(crd)
+            return
+
+        # Finished and success!
+        elif status == cr.JobStatus.SUCCEEDED:
+            await self.fetch_log(j, statuses)
+            self.timelines.record(crd.jobname, "logs")
+            self.last_job = j
 
             # Finished and success!
-            elif status == cr.JobStatus.SUCCEEDED:
-                try:
-                    crd.write_log(logfile)
-                except Exception:
-                    time.sleep(5)
-                self.last_job = j
-
-                # Finished and success!
-                self.report_job_success(j)
-                crd.cleanup()
-
-            # Otherwise, we are still running
-            else:
+            self.report_job_success(j)
+            self.timelines.record(crd.jobname, "reported")
+            self.cleanup_finished(crd)
+            return
+
+        # Pods from the status cache tell us when the job was scheduled and started
+        self.timelines.observe_pods(crd.jobname, self.job_pods(crd, statuses))
+
+        # Otherwise, we are still running
+        if self.executor_settings.follow_logs and status in [
+            cr.JobStatus.ACTIVE,
+            cr.JobStatus.READY,
+        ]:
+            await self.follow_logs(j, statuses)
+        return j
+
+    def pod_failure(self, crd, status, statuses=None):
+        """
+        Look at the pods of a job for a failure.
+
+        Pods come from the status cache (or snapshot) while the job runs,
+        and are listed only for a job that already failed.
+        """
+        if status == cr.JobStatus.SUCCEEDED:
+            return
+        pods = self.job_pods(crd, statuses)
+        if pods is None and status != cr.JobStatus.FAILED:
+            return
+        try:
+            return failures.classify(
+                crd.log_pods(pods), self.executor_settings.unschedulable_timeout
+            )
+        except Exception as e:
+            self.logger.debug(f"Cannot check pods for {crd.jobname}: {e}")
+
+    def failure_events(self, crd, failure):
+        """
+        Add the warning events of the failed pod (e.g., why a pull failed).
+        """
+        try:
+            failure.events = failures.warning_events(
+                self.api, crd.settings.namespace, failure.pod
+            )
+        except Exception as e:
+            self.logger.debug(f"Cannot list events for {failure.pod}: {e}")
+
+    async def record_usage(self, j, status, statuses=None):
+        """
+        Add the peak usage of a finished job to the history of its rule.
+
+        A failed job is checked for pods killed for running out of memory.
+        """
+        if self.sizing is None or j.job.is_group():
+            return
+        crd = j.aux["crd"]
+        index = getattr(crd, "index", None)
+        jobid = crd.pack.job.jobid if index is not None else j.job.jobid
+        peak = self.usage.pop(jobid, None if index is None else str(index))
+        if peak is not None:
+            self.sizing.record(j.job.name, cpu=peak[0], memory=peak[1])
+        if status != cr.JobStatus.FAILED:
+            return
+        try:
+            pods = await self.run_io(crd.log_pods, self.job_pods(crd, statuses))
+        except Exception as e:
+            self.logger.debug(f"Cannot list pods for {crd.jobname}: {e}")
+            return
+        if sizing.oom_killed(pods):
+            self.sizing.oom(j.job)
+
+    def check_admission(self, j, status):
+        """
+        Report when Kueue admits a job, and tell queued jobs from running ones.
+        """
+        if not self.executor_settings.track_workloads:
+            return status
+        state, position = self.workloads.admission(j.aux["crd"].jobname)
+        if state is None:
+            return status
+
+        # Deactivated jobs are never admitted again, so they have failed
+        if state == "deactivated":
+            j.aux["kueue_deactivated"] = workloads.deactivation_reason(
+                self.workloads.get(j.aux["crd"].jobname)
+            )
+            return cr.JobStatus.FAILED
+
+        # Preempted (or otherwise evicted) jobs wait to be admitted again
+        if state == "evicted":
+            self.requeue(j)
+            return cr.JobStatus.QUEUED
+
+        if state != "pending":
+            self.timelines.observe_workload(
+                j.aux["crd"].jobname, self.workloads.get(j.aux["crd"].jobname)
+            )
+
+        # Tell the user when the admission state changes
+        if state != j.aux.get("kueue_admission"):
+            j.aux["kueue_admission"] = state
+            where = f" (position {position} in queue)" if position else ""
+            self.logger.info(f"Kueue job '{j.external_jobid}' is {state}{where}")
+        j.aux["kueue_position"] = position
+
+        if state == "pending" and status in [
+            cr.JobStatus.PENDING,
+            cr.JobStatus.UNKNOWN,
+        ]:
+            return cr.JobStatus.QUEUED
+        return status
+
+    def requeue(self, j):
+        """
+        Keep tracking a job that Kueue evicted, instead of failing it.
+
+        Pods killed by the eviction don't count as failures when the job
+        is admitted again, and runs from where it checkpointed (if it does).
+        """
+        crd = j.aux["crd"]
+        if isinstance(crd, cr.BatchJob):
+            crd.failed_baseline = max(crd.failed_baseline, crd.last_failed)
+        if j.aux.get("kueue_admission") == "evicted":
+            return
+        j.aux["kueue_admission"] = "evicted"
+        j.aux["kueue_requeues"] = j.aux.get("kueue_requeues", 0) + 1
+        reason = workloads.eviction_reason(self.workloads.get(crd.jobname))
+        self.logger.info(
+            f"Kueue job '{j.external_jobid}' was evicted ({reason}), and is queued "
+            f"again (requeue {j.aux['kueue_requeues']})"
+        )
+
+    def cleaned(self, crds):
+        """
+        Called by the cleanup queue when finished jobs were deleted.
+        """
+        for crd in crds:
+            self.timelines.record(crd.jobname, "cleaned")
+
+    def save_sizing(self):
+        """
+        Save the resource history, and tell the user what it suggests.
+        """
+        try:
+            self.sizing.save()
+        except Exception as e:
+            self.logger.warning(f"Cannot save resource history: {e}")
+        summary = self.sizing.summary()
+        if summary:
+            self.logger.info(f"Suggested Kueue requests per rule:\n{summary}")
+
+    def render_metrics(self):
+        return metrics.prometheus(self.timelines, self.api.latencies)
+
+    def cleanup_finished(self, crd):
+        """
+        Queue what a finished job leaves behind for cleanup (if anything yet)
+        """
+        self.journal_finished(crd)
+        finished = crd.finished()
+        if finished is not None:
+            self.cleanup_queue.put(finished)
+
+    async def check_active_jobs(
+        self, active_jobs: List[SubmittedJobInfo]
+    ) -> Generator[SubmittedJobInfo, None, None]:
+        if not active_jobs:
+            return
+
+        # Without the watch, we ask for everything in one go
+        snapshots = {}
+        if self._status_cache is None:
+            snapshots = await self.run_io(self.status_snapshots, active_jobs)
+
+        # Kueue workloads tell us what is admitted and what is queued
+        if self.executor_settings.track_workloads:
+            try:
+                await self.run_io(self.workloads.refresh)
+            except Exception as e:
+                self.logger.debug(f"Cannot list Kueue workloads: {e}")
+
+        # Usage of running pods, for sizing requests
+        if self.usage is not None:
+            try:
+                await self.run_io(self.usage.refresh)
+            except Exception as e:
+                self.logger.debug(f"Cannot list pod metrics: {e}")
+
+        # Jobs in the Flux session, with one flux jobs
+        if self.flux_session is not None and self.flux_session.lead is not None:
+            try:
+                await self.run_io(self.flux_session.refresh)
+            except Exception as e:
+                self.logger.debug(f"Cannot list Flux session jobs: {e}")
+
+        # Check all active jobs concurrently (bounded by the io pool)
+        # A job we couldn't check (e.g., a dropped request) is checked again next time
+        checked = await asyncio.gather(
+            *[self.check_active_job(j, snapshots) for j in active_jobs],
+            return_exceptions=True,
+        )
+        for j, result in zip(active_jobs, checked):
+            if isinstance(result, Exception):
+                self.logger.debug(f"Cannot check job {j.external_jobid}: {result}")
                 yield j
+            elif result is not None:
+                yield result
 
     def cancel_jobs(self, active_jobs: List[SubmittedJobInfo]):
         """
         cancel execution, usually by way of control+c.
         """
-        for job in self.active_jobs:
-            crd = job.aux["crd"]
-            crd.cleanup()
-        self.shutdown()
+        self.stop_submissions()
+        crds = [job.aux["crd"] for job in active_jobs]
+        try:
+            self.cleanup_queue.delete_run(crds)
+        except Exception as e:
+            self.logger.warning(f"Cannot delete the jobs of this run: {e}")
+        for crd in crds:
+            self.journal_finished(crd)
+
+    def stop_submissions(self):
+        """
+        Drop jobs not yet submitted, and wait for those being submitted.
+
+        Submissions held back for capacity give up instead of waiting.
+        """
+        self.workloads.stop()
+        self.packer.cancel()
+        if self.submit_pool is not None:
+            self.submit_pool.shutdown(wait=True, cancel_futures=True)
+
+    def shutdown(self):
+        self.stop_submissions()
+        self.cleanup_queue.stop()
+        if self._status_cache is not None:
+            self._status_cache.stop()
+        super().shutdown()
+        self.io_pool.shutdown(wait=False, cancel_futures=True)
+        if self.worker_pool is not None:
+            self.worker_pool.stop()
+        if self.flux_session is not None:
+            self.flux_session.stop()
+        if self.prepuller is not None:
+            self.prepuller.delete()
+        if self.journal is not None:
+            self.journal.close()
+        self.api.close()
+
+        # Report how long requests waited, to help size the limits
+        summary = self.api.limiter.summary()
+        if summary:
+            self.logger.info(f"Kubernetes API requests:\n{summary}")
+
+        # Where the time went, for jobs and for requests
+        summary = self.timelines.summary()
+        if summary:
+            self.logger.info(f"Kueue job phases:\n{summary}")
+        summary = self.api.latencies.summary()
+        if summary:
+            self.logger.info(f"Kubernetes API latency:\n{summary}")
+        if self.sizing is not None:
+            self.save_sizing()
+        if self.executor_settings.metrics_file:
+            metrics.export(
+                self.executor_settings.metrics_file, self.timelines, self.api.latencies
+            )
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
@@ -0,0 +1,130 @@
+import datetime
+
+# Waiting reasons a container does not get out of on its own
+permanent_waiting = [
+    "ImagePullBackOff",
+    "ErrImageNeverPull",
+    "InvalidImageName",
+    "CreateContainerConfigError",
+    "CreateContainerError",
+]
+
+# The kubelet retries ErrImagePull, unless the image isn't there (or isn't ours)
+missing_image = [
+    "not found",
+    "manifest unknown",
+    "repository does not exist",
+    "unauthorized",
+    "denied",
+]
+
+# Pods that failed with their node, or were evicted, can work elsewhere
+retryable_reasons = [
+    "Evicted",
+    "NodeLost",
+    "NodeShutdown",
+    "Shutdown",
+    "Terminated",
+    "UnexpectedAdmissionError",
+    "OutOfcpu",
+    "OutOfmemory",
+]
+
+
+class Failure:
+    """
+    Why the pod of a job failed, and if running it again could help.
+    """
+
+    def __init__(self, pod, reason, message=None, retryable=False):
+        self.pod = pod
+        self.reason = reason
+        self.message = message
+        self.retryable = retryable
+        self.events = []
+
+    def __str__(self):
+        kind = "retryable" if self.retryable else "permanent"
+        message = f": {self.message}" if self.message else ""
+        return f"{self.reason} in pod {self.pod} ({kind}){message}"
+
+
+def container_failure(name, status):
+    """
+    A failure from a container status (waiting or terminated), if any.
+    """
+    waiting = status.state.waiting if status.state else None
+    if waiting is not None:
+        message = waiting.message or ""
+        if waiting.reason in permanent_waiting:
+            return Failure(name, waiting.reason, message)
+        if waiting.reason == "ErrImagePull" and any(
+            text in message.lower() for text in missing_image
+        ):
+            return Failure(name, waiting.reason, message)
+    for state in [status.state, status.last_state]:
+        terminated = state.terminated if state else None
+        if terminated is not None and terminated.reason == "OOMKilled":
+            return Failure(name, "OOMKilled", f"container {status.name}")
+
+
+def pod_failure(pod, unschedulable_timeout=None, now=None):
+    """
+    Classify what is wrong with one pod, or None if nothing (yet).
+    """
+    name = pod.metadata.name
+    status = pod.status
+    if status is None:
+        return
+
+    # Evicted, or lost with the node
+    if status.reason in retryable_reasons:
+        return Failure(name, status.reason, status.message, retryable=True)
+    for condition in status.conditions or []:
+        if condition.type == "DisruptionTarget" and condition.status == "True":
+            return Failure(name, condition.reason, condition.message, retryable=True)
+
+    containers = (status.init_container_statuses or []) + (
+        status.container_statuses or []
+    )
+    for container in containers:
+        failure = container_failure(name, container)
+        if failure is not None:
+            return failure
+
+    # Unschedulable for longer than the cluster could scale up
+    if not unschedulable_timeout:
+        return
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    for condition in status.conditions or []:
+        if (
+            condition.type == "PodScheduled"
+            and condition.status == "False"
+            and condition.reason == "Unschedulable"
+            and condition.last_transition_time is not None
+            and (now - condition.last_transition_time).total_seconds()
+            > unschedulable_timeout
+        ):
+            return Failure(name, "Unschedulable", condition.message)
+
+
+def classify(pods, unschedulable_timeout=None):
+    """
+    The first failure among the pods of a job, permanent ones first.
+    """
+    failures = [pod_failure(pod, unschedulable_timeout) for pod in pods or []]
+    failures = [failure for failure in failures if failure is not None]
+    failures.sort(key=lambda failure: failure.retryable)
+    if failures:
+        return failures[0]
+
+
+def warning_events(api, namespace, pod, limit=3):
+    """
+    The last warning events for a pod, for the error message.
+    """
+    events = api.core_v1.list_namespaced_event(
+        namespace, field_selector=f"involvedObject.name={pod},type=Warning"
+    ).items
+    events.sort(key=lambda event: str(event.last_timestamp or ""))
+    return [f"{event.reason}: {event.message}" for event in events[-limit:]]
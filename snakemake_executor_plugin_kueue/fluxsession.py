@@ -0,0 +1,373 @@
+import io
+import shlex
+import threading
+
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+from snakemake.logging import logger
+
+import snakemake_executor_plugin_kueue.custom_resource as cr
+import snakemake_executor_plugin_kueue.utils as utils
+
+# Label on the session MiniCluster (and its config map)
+session_label = "snakemake-kueue/flux-session"
+
+# Where the Flux view puts the broker socket
+flux_uri = "local:///mnt/flux/view/run/flux/local"
+
+# Flux job status to job status
+statuses = {
+    "DEPEND": cr.JobStatus.QUEUED,
+    "PRIORITY": cr.JobStatus.QUEUED,
+    "SCHED": cr.JobStatus.QUEUED,
+    "RUN": cr.JobStatus.ACTIVE,
+    "CLEANUP": cr.JobStatus.ACTIVE,
+    "COMPLETED": cr.JobStatus.SUCCEEDED,
+    "FAILED": cr.JobStatus.FAILED,
+    "CANCELED": cr.JobStatus.FAILED,
+    "TIMEOUT": cr.JobStatus.FAILED,
+}
+
+
+class FluxSessionJob(cr.TrackedJob):
+    """
+    A job submitted to the session, tracked by Flux job id.
+    """
+
+    def __init__(self, session, job, command):
+        super().__init__(job)
+        self.session = session
+        self.command = command
+        self.jobname = f"{session.name}-job-{job.jobid}"
+        self.fluxid = None
+        self.state = cr.JobStatus.QUEUED
+
+    @property
+    def settings(self):
+        return self.session.settings
+
+    @classmethod
+    def delete_batch(cls, api, namespace, crds, label_selector):
+        """
+        Nothing to delete, the session deletes its MiniCluster when it stops.
+        """
+        pass
+
+    def status(self, job=None):
+        return self.state
+
+    def log_pods(self, pods=None):
+        """
+        The lead broker, where we ask Flux for the job output.
+        """
+        if self.session.lead is None or self.fluxid is None:
+            return []
+        return [client.V1Pod(metadata=client.V1ObjectMeta(name=self.session.lead))]
+
+    def write_pod_log(self, pod, filename, limit_bytes=None):
+        return self.session.write_log(self, filename)
+
+    def finished(self):
+        """
+        Nothing to clean up, the jobs go with the MiniCluster of the session.
+        """
+        pass
+
+    def submit_line(self):
+        """
+        The flux submit for this job, printing our name and the Flux job id.
+        """
+        resources = self.job.resources
+        nodes = resources.get("_nodes") or 1
+        tasks = int(resources.get("kueue_tasks", 1) or 1)
+        cores = max(1, int(resources.get("_cores") or 1) // tasks)
+        workdir = cr.shared_workdir(self.settings) or (
+            f"/tmp/snakemake/job-{self.job.jobid}-{self.job.attempt}"
+        )
+        script = f"mkdir -p {workdir} && cd {workdir} && {self.command}"
+        return (
+            f"echo {self.jobname} $(flux submit -N{nodes} -n{tasks} "
+            f"--cores-per-task={cores} --job-name={self.jobname} "
+            f"bash -c {shlex.quote(script)})"
+        )
+
+
+class FluxSession:
+    """
+    One Flux MiniCluster for the whole run, that flux-operator jobs are
+    submitted to with flux submit.
+
+    The MiniCluster is interactive, so the broker stays up without a
+    command of its own. Jobs wait until it is up, and are then submitted
+    in batches (one exec for many jobs). Status for all jobs comes from one
+    flux jobs per status check, and Flux's scheduler packs jobs onto the
+    nodes of the MiniCluster. It is deleted at shutdown.
+    """
+
+    version = "v1alpha2"
+    group = "flux-framework.org"
+    plural = "miniclusters"
+    container = "snakemake"
+
+    # Seconds between checks on the MiniCluster coming up, and on new jobs
+    poll_interval = 5
+
+    def __init__(self, api, settings, snakefile, workflow_uid, image, environment):
+        self.api = api
+        self.settings = settings
+        self.snakefile = snakefile
+        self.workflow_uid = workflow_uid
+        self.image = image
+        self.environment = environment or {}
+        self.name = f"snakemake-flux-{workflow_uid[:10]}"
+
+        # The MiniCluster (once created) and its lead broker pod (once up)
+        self.minicluster = None
+        self.lead = None
+        self.error = None
+        self.jobs = {}
+        self.waiting = []
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, name="kueue-flux-session", daemon=True
+        )
+
+    @property
+    def labels(self):
+        return {cr.workflow_label: self.workflow_uid, session_label: "true"}
+
+    @property
+    def started(self):
+        return self.thread.is_alive()
+
+    def submit(self, job, command):
+        """
+        Queue a job for the session, starting it on the first job.
+        """
+        crd = FluxSessionJob(self, job, command)
+        with self.lock:
+            if self.error is not None:
+                crd.state = cr.JobStatus.FAILED
+                return crd
+            self.waiting.append(crd)
+            if not self.thread.is_alive() and not self.stopped.is_set():
+                self.thread.start()
+        self.wake.set()
+        return crd
+
+    def run(self):
+        """
+        Bring up the MiniCluster, then submit jobs as they come in.
+        """
+        try:
+            self.create()
+            self.wait_until_up()
+        except Exception as e:
+            logger.error(f"Cannot start the Flux session: {e}")
+            self.error = e
+            self.fail_waiting(f"{e}")
+            return
+        while not self.stopped.is_set():
+            self.wake.wait(self.poll_interval)
+            self.wake.clear()
+            with self.lock:
+                batch, self.waiting = self.waiting, []
+            if not batch:
+                continue
+
+            # A failed exec fails this batch, not the session
+            try:
+                self.submit_batch(batch)
+            except Exception as e:
+                logger.warning(f"Cannot submit {len(batch)} jobs to Flux: {e}")
+                for crd in batch:
+                    if crd.fluxid is None:
+                        crd.state = cr.JobStatus.FAILED
+
+    def create(self):
+        cm = client.V1ConfigMap(
+            metadata=client.V1ObjectMeta(
+                name=f"{self.name}-snakefile",
+                namespace=self.settings.namespace,
+                labels=self.labels,
+            ),
+            data={"snakefile": utils.read_file(self.snakefile)},
+        )
+        try:
+            self.api.core_v1.create_namespaced_config_map(self.settings.namespace, cm)
+        except ApiException as e:
+            if e.status != 409:
+                raise
+        result = self.api.custom_objects.create_namespaced_custom_object(
+            group=self.group,
+            version=self.version,
+            namespace=self.settings.namespace,
+            plural=self.plural,
+            body=self.generate(),
+        )
+        self.minicluster = result["metadata"]["name"]
+        logger.info(
+            f"Started Flux session {self.minicluster} with "
+            f"{self.settings.nodes or 1} nodes"
+        )
+
+    def generate(self):
+        """
+        The MiniCluster, like FluxMiniCluster but interactive and without a job.
+        """
+        container = {
+            "name": self.container,
+            "image": self.image,
+            "pullAlways": self.settings.pull_always is not None,
+            "working_dir": cr.shared_workdir(self.settings)
+            or self.settings.working_dir,
+            "environment": self.environment,
+            "launcher": True,
+            "volumes": {
+                f"{self.name}-snakefile": {
+                    "path": "/snakemake_workdir",
+                    "configMapName": f"{self.name}-snakefile",
+                    "items": {"snakefile": "Snakefile"},
+                },
+                **cr.minicluster_volumes(self.settings),
+            },
+        }
+        return {
+            "apiVersion": f"{self.group}/{self.version}",
+            "kind": "MiniCluster",
+            "metadata": {
+                "generateName": f"{self.name}-",
+                "namespace": self.settings.namespace,
+                "labels": self.labels,
+            },
+            "spec": {
+                "job_labels": {
+                    "kueue.x-k8s.io/queue-name": self.settings.queue_name,
+                    **self.labels,
+                },
+                "flux": {"container": {"image": self.settings.flux_container}},
+                "containers": [container],
+                "interactive": True,
+                "size": self.settings.nodes or 1,
+                "logging": {"quiet": False},
+                "pod": {"labels": self.labels},
+            },
+        }
+
+    def flux(self, command, out=None):
+        """
+        Run a Flux command on the lead broker, returning exit code and output.
+        """
+        out = out or io.StringIO()
+        script = f". /mnt/flux/flux-view.sh && export FLUX_URI={flux_uri} && {command}"
+        code = self.api.exec(
+            self.settings.namespace,
+            self.lead,
+            self.container,
+            ["/bin/bash", "-c", script],
+            out,
+        )
+        return code, out.getvalue() if isinstance(out, io.StringIO) else None
+
+    def find_lead(self):
+        """
+        Get the lead broker pod (index 0) once it is running.
+        """
+        pods = self.api.core_v1.list_namespaced_pod(
+            self.settings.namespace, label_selector=f"job-name={self.minicluster}"
+        ).items
+        for pod in pods:
+            annotations = pod.metadata.annotations or {}
+            index = annotations.get(cr.PackedBatchJob.index_annotation)
+            phase = pod.status.phase if pod.status else None
+            if index == "0" and phase == "Running":
+                return pod.metadata.name
+
+    def wait_until_up(self):
+        """
+        Wait for Kueue to admit the MiniCluster, and for Flux to come up.
+        """
+        while not self.stopped.is_set():
+            try:
+                self.lead = self.lead or self.find_lead()
+                if self.lead is not None and self.flux("flux uptime")[0] == 0:
+                    logger.info(f"Flux session {self.minicluster} is up")
+                    return
+            except Exception as e:
+                logger.debug(f"Flux session is not up yet: {e}")
+            self.stopped.wait(self.poll_interval)
+
+    def submit_batch(self, batch):
+        """
+        Submit waiting jobs with one exec, recording their Flux job ids.
+        """
+        code, output = self.flux("\n".join(crd.submit_line() for crd in batch))
+        by_name = {crd.jobname: crd for crd in batch}
+        for line in output.splitlines():
+            name, _, fluxid = line.strip().partition(" ")
+            crd = by_name.get(name)
+            if crd is None or not fluxid:
+                continue
+            crd.fluxid = fluxid.strip()
+            with self.lock:
+                self.jobs[crd.fluxid] = crd
+        for crd in batch:
+            if crd.fluxid is None:
+                logger.warning(f"Cannot submit {crd.jobname} to Flux: {output}")
+                crd.state = cr.JobStatus.FAILED
+
+    def fail_waiting(self, reason):
+        with self.lock:
+            batch, self.waiting = self.waiting, []
+        for crd in batch:
+            crd.state = cr.JobStatus.FAILED
+
+    def refresh(self):
+        """
+        Update the status of all jobs with one flux jobs.
+        """
+        with self.lock:
+            if not self.jobs:
+                return
+        code, output = self.flux(
+            'flux jobs -a --no-header --format="{id.f58} {status}"'
+        )
+        if code != 0:
+            raise RuntimeError(f"flux jobs failed: {output}")
+        for line in output.splitlines():
+            fluxid, _, status = line.strip().partition(" ")
+            with self.lock:
+                crd = self.jobs.get(fluxid)
+            if crd is not None and status.strip() in statuses:
+                crd.state = statuses[status.strip()]
+
+    def write_log(self, crd, filename):
+        """
+        Write the job output (kept by Flux) to file.
+        """
+        with open(filename, "w") as fd:
+            self.flux(f"flux job attach {crd.fluxid}", fd)
+
+    def stop(self):
+        """
+        Delete the MiniCluster and its config map.
+        """
+        self.stopped.set()
+        self.wake.set()
+        if self.minicluster is None:
+            return
+        try:
+            self.api.custom_objects.delete_namespaced_custom_object(
+                name=self.minicluster,
+                group=self.group,
+                version=self.version,
+                namespace=self.settings.namespace,
+                plural=self.plural,
+            )
+            self.api.core_v1.delete_namespaced_config_map(
+                f"{self.name}-snakefile", self.settings.namespace
+            )
+        except Exception as e:
+            logger.warning(f"Cannot delete the Flux session: {e}")
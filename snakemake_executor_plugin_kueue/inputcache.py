@@ -0,0 +1,72 @@
+import functools
+import os
+
+import snakemake_executor_plugin_kueue.utils as utils
+
+# Where the cache volume is mounted in job pods
+mount_path = "/snakemake_cache"
+
+# The script that restores and saves inputs in the pod (see nodecache.py)
+script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nodecache.py")
+
+
+def enabled(settings):
+    return bool(settings.cache_path or settings.cache_claim)
+
+
+@functools.lru_cache
+def read_script():
+    return utils.read_file(script)
+
+
+def storage_inputs(job, storage_settings):
+    """
+    Get (query, path in the pod) for the storage inputs of a job.
+
+    Jobs keep local copies under the remote job prefix, in the same place
+    relative to it as on the head node.
+    """
+    local_prefix = str(storage_settings.local_storage_prefix)
+    remote_prefix = str(
+        getattr(storage_settings, "remote_job_local_storage_prefix", None)
+        or local_prefix
+    )
+    inputs = []
+    for f in job.input:
+        if not getattr(f, "is_storage", False):
+            continue
+        local_path = str(f.storage_object.local_path())
+        path = os.path.join(remote_prefix, os.path.relpath(local_path, local_prefix))
+        inputs.append((f.storage_object.query, path))
+    return inputs
+
+
+def manifest(job, storage_settings):
+    """
+    The storage inputs of a job, one query<tab>path per line.
+    """
+    return "".join(
+        f"{query}\t{path}\n" for query, path in storage_inputs(job, storage_settings)
+    )
+
+
+def wrap(command, settings, directory, manifest_name):
+    """
+    Restore cached inputs before the command, and save new ones after.
+
+    The cache never changes the exit code of the job.
+    """
+    base = f"python3 {directory}/nodecache.py"
+    manifest_file = f"{directory}/{manifest_name}"
+    size = ""
+    if settings.cache_size:
+        size = f" --size {int(settings.cache_size * 1024**3)}"
+    return "; ".join(
+        [
+            f"{base} restore {mount_path} {manifest_file} || true",
+            command,
+            "status=$?",
+            f"{base} save {mount_path} {manifest_file}{size} || true",
+            "exit $status",
+        ]
+    )
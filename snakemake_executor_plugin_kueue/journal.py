@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from snakemake.logging import logger
+
+
+def spec_hash(*parts):
+    """
+    Hash what makes a job the same job across runs (rule, image, command,
+    resources, config map, etc.)
+    """
+    data = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class SubmissionJournal:
+    """
+    An append-only record of submitted jobs, under .snakemake.
+
+    Each submission is written (and flushed) as a line when it is created,
+    and another line when it finishes. If the head process dies, the next
+    run reads what never finished, and can adopt a job that is still
+    running instead of submitting it again. The file is compacted to the
+    unfinished jobs when a run starts.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+
+        # Unfinished jobs from earlier runs, by spec hash
+        self.previous = {}
+        for entry in self.load().values():
+            self.previous.setdefault(entry["spec_hash"], []).append(entry)
+        self.compact()
+        self.fd = open(self.filename, "a")
+
+    def load(self):
+        """
+        Unfinished submissions, by external name.
+        """
+        entries = {}
+        if not os.path.exists(self.filename):
+            return entries
+        with open(self.filename) as fd:
+            for line in fd:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A line cut short when the head process died
+                    continue
+                if entry.get("event") == "submitted":
+                    entries[entry["name"]] = entry
+                elif entry.get("event") == "finished":
+                    entries.pop(entry.get("name"), None)
+        return entries
+
+    def compact(self):
+        os.makedirs(os.path.dirname(self.filename) or ".", exist_ok=True)
+        lines = [
+            json.dumps(entry) + "\n"
+            for entries in self.previous.values()
+            for entry in entries
+        ]
+        with open(self.filename + ".tmp", "w") as fd:
+            fd.writelines(lines)
+        os.replace(self.filename + ".tmp", self.filename)
+        if lines:
+            logger.info(f"Found {len(lines)} unfinished Kueue jobs from earlier runs")
+
+    def write(self, entry):
+        with self.lock:
+            if self.fd.closed:
+                return
+            self.fd.write(json.dumps({**entry, "time": time.time()}) + "\n")
+
+            # Flushed lines survive the head process, syncing each one is slow
+            self.fd.flush()
+
+    def submitted(self, **entry):
+        """
+        Record a submission (jobid, name, namespace, operator, spec_hash, etc.)
+        """
+        self.write({"event": "submitted", **entry})
+
+    def finished(self, name):
+        self.write({"event": "finished", "name": name})
+
+    def adopt(self, spec_hash):
+        """
+        Take an unfinished job from an earlier run with the same spec, if any.
+        """
+        with self.lock:
+            entries = self.previous.get(spec_hash)
+            if entries:
+                return entries.pop(0)
+
+    def close(self):
+        """
+        Forget earlier jobs this run did not need, and stop writing.
+        """
+        with self.lock:
+            left = [entry for entries in self.previous.values() for entry in entries]
+            self.previous = {}
+        for entry in left:
+            self.finished(entry["name"])
+        with self.lock:
+            os.fsync(self.fd.fileno())
+            self.fd.close()
@@ -0,0 +1,198 @@
+import datetime
+import math
+import os
+import threading
+
+from kubernetes.client.rest import ApiException
+from snakemake.logging import logger
+
+# Read and write logs in chunks so memory use is bounded
+chunk_size = 64 * 1024
+
+
+def stream_log(response, filename):
+    """
+    Stream a (not preloaded) log response to file, chunk by chunk.
+    """
+    written = 0
+    try:
+        with open(filename, "wb") as fd:
+            for chunk in response.stream(chunk_size):
+                fd.write(chunk)
+                written += len(chunk)
+    finally:
+        response.release_conn()
+    return written
+
+
+def concatenate(jobname, parts, logfile, limit=None):
+    """
+    Write the job log from per-pod parts, keeping at most limit bytes of output.
+
+    Parts are removed after they are written.
+    """
+    remaining = limit
+    with open(logfile, "wb") as out:
+        out.write(f"==== Job {jobname}\n".encode("utf-8"))
+        for name, part in parts.items():
+            out.write(f"==== Pod {name}\n".encode("utf-8"))
+            if not os.path.exists(part):
+                continue
+            with open(part, "rb") as fd:
+                while remaining is None or remaining > 0:
+                    size = (
+                        chunk_size if remaining is None else min(chunk_size, remaining)
+                    )
+                    chunk = fd.read(size)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+                    if remaining is not None:
+                        remaining -= len(chunk)
+                if remaining == 0 and fd.read(1):
+                    out.write(
+                        f"\n==== Log truncated at {limit} bytes\n".encode("utf-8")
+                    )
+            os.remove(part)
+
+
+def parse_timestamp(timestamp):
+    """
+    Parse an RFC3339 (nano) log timestamp, truncated to microseconds.
+    """
+    try:
+        timestamp = timestamp.decode("utf-8")[:26].rstrip("Z")
+        return datetime.datetime.fromisoformat(timestamp).replace(
+            tzinfo=datetime.timezone.utc
+        )
+    except ValueError:
+        return
+
+
+class LogFollower:
+    """
+    Follow a pod log to file while the pod runs.
+
+    Lines are requested with timestamps, so if the connection drops we
+    reconnect with logs since the last line we saw (and skip any we
+    already have). The server can also end a follow cleanly (e.g., on its
+    own timeout), so we only stop once the container has.
+    """
+
+    def __init__(self, api, namespace, pod, container, filename, limit=None):
+        self.api = api
+        self.namespace = namespace
+        self.pod = pod
+        self.container = container
+        self.filename = filename
+        self.limit = limit
+        self.written = 0
+        self.last = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(
+            target=self.run, name=f"kueue-log-{pod}", daemon=True
+        )
+
+    def start(self):
+        open(self.filename, "wb").close()
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def join(self, timeout=None):
+        self.thread.join(timeout)
+
+    @property
+    def since_seconds(self):
+        """
+        Seconds since the last line we saw, the closest we can ask for.
+        """
+        if self.last is None:
+            return
+        now = datetime.datetime.now(datetime.timezone.utc)
+        return max(1, math.ceil((now - self.last).total_seconds()) + 1)
+
+    def lines(self, response):
+        """
+        Yield lines from a streamed response.
+        """
+        buffer = b""
+        for chunk in response.stream(chunk_size):
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            yield from lines
+        if buffer:
+            yield buffer
+
+    def write(self, fd, line):
+        """
+        Write a line without its timestamp, skipping lines we already have.
+        """
+        timestamp, _, text = line.partition(b" ")
+        timestamp = parse_timestamp(timestamp)
+        if timestamp is not None:
+            if self.last is not None and timestamp <= self.last:
+                return
+            self.last = timestamp
+        text += b"\n"
+        if self.limit is not None:
+            text = text[: self.limit - self.written]
+        fd.write(text)
+        self.written += len(text)
+
+    def finished(self):
+        """
+        Has the container stopped (or the pod gone away)?
+        """
+        try:
+            pod = self.api.read_namespaced_pod(self.pod, self.namespace)
+        except ApiException as e:
+            return e.status == 404
+        except Exception as e:
+            logger.debug(f"Cannot read pod {self.pod}: {e}")
+            return False
+        if pod.status is None:
+            return False
+        if pod.status.phase in ["Succeeded", "Failed"]:
+            return True
+        for status in pod.status.container_statuses or []:
+            if status.name == self.container and status.state.terminated:
+                return True
+        return False
+
+    def run(self):
+        delay = 1
+        while not self.stopped.is_set():
+            try:
+                response = self.api.read_namespaced_pod_log(
+                    name=self.pod,
+                    namespace=self.namespace,
+                    container=self.container,
+                    follow=True,
+                    timestamps=True,
+                    since_seconds=self.since_seconds,
+                    _preload_content=False,
+                )
+                try:
+                    with open(self.filename, "ab") as fd:
+                        for line in self.lines(response):
+                            self.write(fd, line)
+                            if self.stopped.is_set() or self.written == self.limit:
+                                return
+                finally:
+                    response.release_conn()
+                if self.finished():
+                    return
+                delay = 1
+
+            # The pod is gone, nothing more to follow
+            except ApiException as e:
+                if e.status == 404:
+                    return
+                logger.debug(f"Log stream for {self.pod} failed: {e}")
+            except Exception as e:
+                logger.debug(f"Log stream for {self.pod} dropped: {e}")
+            self.stopped.wait(delay)
+            delay = min(delay * 2, 30)
@@ -0,0 +1,353 @@
+import csv
+import datetime
+import json
+import math
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Job lifecycle events, in the order they (usually) happen
+events = [
+    "submitted",
+    "admitted",
+    "scheduled",
+    "started",
+    "finished",
+    "detected",
+    "logs",
+    "reported",
+    "cleaned",
+]
+
+# Phases of a job, as the time between two events
+phases = {
+    "queued": ("submitted", "admitted"),
+    "scheduling": ("admitted", "scheduled"),
+    "starting": ("scheduled", "started"),
+    "running": ("started", "finished"),
+    "detection": ("finished", "detected"),
+    "logs": ("detected", "logs"),
+    "cleanup": ("reported", "cleaned"),
+}
+
+# Upper bounds (seconds) for API latency buckets
+buckets = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, math.inf]
+
+
+def timestamp(value):
+    """
+    Seconds since the epoch for a datetime (typed objects) or an RFC3339
+    string (custom objects), or None.
+    """
+    if value is None:
+        return
+    if isinstance(value, str):
+        try:
+            value = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.timestamp()
+
+
+def endpoint(resource_path, path_params=None):
+    """
+    The path template of a request, with the custom resource filled in
+    (so Workloads and MiniClusters are different endpoints).
+    """
+    for key in ["group", "version", "plural"]:
+        if path_params and key in path_params:
+            resource_path = resource_path.replace(f"{{{key}}}", str(path_params[key]))
+    return resource_path
+
+
+def quantile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def seconds(value):
+    if value == math.inf:
+        return "+Inf"
+    return f"{value:.3f}s" if value < 1 else f"{value:.1f}s"
+
+
+class Timelines:
+    """
+    When each job went through each lifecycle event.
+
+    Times come from object status where we have it (workload conditions,
+    pod conditions and container states, job completion) and otherwise
+    from when the executor saw it. The first time for an event wins.
+    Jobs in a pack share the timeline of the pack.
+    """
+
+    def __init__(self):
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def record(self, name, event, when=None):
+        if name is None:
+            return
+        with self.lock:
+            timeline = self.jobs.setdefault(name, {})
+            if event not in timeline:
+                timeline[event] = when or time.time()
+
+    def observe_workload(self, name, workload):
+        """
+        Admission time from the workload conditions.
+        """
+        if workload is None:
+            return
+        conditions = (workload.get("status") or {}).get("conditions") or []
+        for condition in conditions:
+            if condition.get("type") in ["QuotaReserved", "Admitted"]:
+                if condition.get("status") == "True":
+                    when = timestamp(condition.get("lastTransitionTime"))
+                    self.record(name, "admitted", when)
+
+    def observe_job(self, name, job):
+        """
+        Finish time from the job status (completion, or failure condition).
+        """
+        if job is None or job.status is None:
+            return
+        finished = timestamp(job.status.completion_time)
+        for condition in job.status.conditions or []:
+            if condition.type == "Failed" and condition.status == "True":
+                finished = finished or timestamp(condition.last_transition_time)
+        if finished:
+            self.record(name, "finished", finished)
+
+    def observe_pods(self, name, pods):
+        """
+        Scheduling, start, and finish times from pod status.
+
+        We take the first pod scheduled and started, and the last finished.
+        """
+        scheduled, started, finished = [], [], []
+        for pod in pods or []:
+            if pod.status is None:
+                continue
+            for condition in pod.status.conditions or []:
+                if condition.type == "PodScheduled" and condition.status == "True":
+                    scheduled.append(timestamp(condition.last_transition_time))
+            for container in pod.status.container_statuses or []:
+                state = container.state
+                if state is None:
+                    continue
+                if state.running is not None:
+                    started.append(timestamp(state.running.started_at))
+                if state.terminated is not None:
+                    started.append(timestamp(state.terminated.started_at))
+                    finished.append(timestamp(state.terminated.finished_at))
+        scheduled = [x for x in scheduled if x]
+        started = [x for x in started if x]
+        finished = [x for x in finished if x]
+        if scheduled:
+            self.record(name, "scheduled", min(scheduled))
+        if started:
+            self.record(name, "started", min(started))
+        if finished:
+            self.record(name, "finished", max(finished))
+
+    def durations(self):
+        """
+        Seconds spent in each phase, for jobs that went through it.
+        """
+        with self.lock:
+            timelines = list(self.jobs.values())
+        durations = {phase: [] for phase in phases}
+        for timeline in timelines:
+            for phase, (start, end) in phases.items():
+                if start in timeline and end in timeline:
+                    durations[phase].append(max(0, timeline[end] - timeline[start]))
+        return durations
+
+    def summary(self):
+        lines = []
+        for phase, values in self.durations().items():
+            if not values:
+                continue
+            median = quantile(values, 0.5)
+            p95 = quantile(values, 0.95)
+            lines.append(
+                f"{phase}: {len(values)} jobs, median {seconds(median)}, "
+                f"p95 {seconds(p95)}, max {seconds(max(values))}"
+            )
+        return "\n".join(lines)
+
+    def to_dict(self):
+        with self.lock:
+            return {name: dict(timeline) for name, timeline in self.jobs.items()}
+
+
+class Latencies:
+    """
+    Latency histograms for Kubernetes API requests, per endpoint.
+
+    An endpoint is the method and path template, e.g.,
+    GET /apis/batch/v1/namespaces/{namespace}/jobs/{name}
+    """
+
+    def __init__(self):
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def observe(self, method, path, elapsed, status=None):
+        with self.lock:
+            endpoint = self.endpoints.setdefault(
+                (method, path),
+                {"counts": [0] * len(buckets), "sum": 0, "max": 0, "errors": 0},
+            )
+            for i, bound in enumerate(buckets):
+                if elapsed <= bound:
+                    endpoint["counts"][i] += 1
+                    break
+            endpoint["sum"] += elapsed
+            endpoint["max"] = max(endpoint["max"], elapsed)
+            if status is not None:
+                endpoint["errors"] += 1
+
+    def quantile(self, counts, fraction):
+        """
+        Upper bound of the bucket the quantile falls in.
+        """
+        target = sum(counts) * fraction
+        seen = 0
+        for bound, count in zip(buckets, counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return math.inf
+
+    def summary(self):
+        with self.lock:
+            endpoints = sorted(self.endpoints.items(), key=lambda item: -item[1]["sum"])
+            lines = []
+            for (method, path), endpoint in endpoints:
+                count = sum(endpoint["counts"])
+                p95 = self.quantile(endpoint["counts"], 0.95)
+                lines.append(
+                    f"{method} {path}: {count} calls, "
+                    f"mean {seconds(endpoint['sum'] / count)}, p95 <= {seconds(p95)}, "
+                    f"max {seconds(endpoint['max'])}, {endpoint['errors']} errors"
+                )
+            return "\n".join(lines)
+
+    def to_dict(self):
+        with self.lock:
+            return [
+                {
+                    "method": method,
+                    "path": path,
+                    "count": sum(endpoint["counts"]),
+                    "sum": endpoint["sum"],
+                    "max": endpoint["max"],
+                    "errors": endpoint["errors"],
+                    "buckets": {
+                        "+Inf" if bound == math.inf else str(bound): count
+                        for bound, count in zip(buckets, endpoint["counts"])
+                    },
+                }
+                for (method, path), endpoint in self.endpoints.items()
+            ]
+
+
+def prometheus(timelines, latencies):
+    """
+    Render metrics in the Prometheus text format.
+    """
+    lines = [
+        "# HELP snakemake_kueue_api_request_duration_seconds Kubernetes API latency",
+        "# TYPE snakemake_kueue_api_request_duration_seconds histogram",
+    ]
+    name = "snakemake_kueue_api_request_duration_seconds"
+    for endpoint in latencies.to_dict():
+        labels = f'method="{endpoint["method"]}",path="{endpoint["path"]}"'
+        total = 0
+        for bound, count in endpoint["buckets"].items():
+            total += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {total}')
+        lines.append(f"{name}_sum{{{labels}}} {endpoint['sum']}")
+        lines.append(f"{name}_count{{{labels}}} {endpoint['count']}")
+
+    name = "snakemake_kueue_job_phase_duration_seconds"
+    lines += [
+        f"# HELP {name} Time jobs spent in each lifecycle phase",
+        f"# TYPE {name} summary",
+    ]
+    for phase, values in timelines.durations().items():
+        if not values:
+            continue
+        for fraction in [0.5, 0.95]:
+            value = quantile(values, fraction)
+            lines.append(f'{name}{{phase="{phase}",quantile="{fraction}"}} {value}')
+        lines.append(f'{name}_sum{{phase="{phase}"}} {sum(values)}')
+        lines.append(f'{name}_count{{phase="{phase}"}} {len(values)}')
+    return "\n".join(lines) + "\n"
+
+
+def export(filename, timelines, latencies):
+    """
+    Write timelines and latencies to JSON, or to CSV (latencies go to a
+    second file, with -api added to the name).
+    """
+    if not filename.endswith(".csv"):
+        with open(filename, "w") as fd:
+            json.dump({"jobs": timelines.to_dict(), "api": latencies.to_dict()}, fd)
+        return
+
+    with open(filename, "w", newline="") as fd:
+        writer = csv.writer(fd)
+        writer.writerow(["job"] + events)
+        for name, timeline in timelines.to_dict().items():
+            writer.writerow([name] + [timeline.get(event, "") for event in events])
+
+    root, ext = os.path.splitext(filename)
+    with open(f"{root}-api{ext}", "w", newline="") as fd:
+        writer = csv.writer(fd)
+        writer.writerow(["method", "path", "count", "sum", "max", "errors"])
+        for endpoint in latencies.to_dict():
+            writer.writerow(
+                [
+                    endpoint[key]
+                    for key in ["method", "path", "count", "sum", "max", "errors"]
+                ]
+            )
+
+
+class MetricsServer:
+    """
+    Serve metrics for Prometheus to scrape, from a background thread.
+    """
+
+    def __init__(self, port, render):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("", port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name="kueue-metrics", daemon=True
+        )
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
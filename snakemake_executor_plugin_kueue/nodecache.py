@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+# Node-local input cache, run in the job pod around the Snakemake command.
+# This is shipped to the pod in the config map, so it only uses the standard
+# library (and must not import the plugin).
+#
+# The cache directory is shared by pods on a node (a hostPath or a local
+# volume). Inputs are stored once per content hash, with an index from the
+# storage query to the hash:
+#
+#   objects/ab/abcdef...       the file content
+#   objects/ab/abcdef....used  touched whenever the object is used (for LRU)
+#   keys/<sha256 of query>     the content hash for a query
+#
+# python3 nodecache.py restore <cache> <manifest>
+# python3 nodecache.py save <cache> <manifest> [--size <bytes>]
+
+import argparse
+import fcntl
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+
+
+def read_manifest(filename):
+    """
+    Read (query, local path) pairs for the storage inputs of a job.
+    """
+    inputs = []
+    with open(filename) as fd:
+        for line in fd:
+            query, _, path = line.rstrip("\n").partition("\t")
+            if query and path:
+                inputs.append((query, path))
+    return inputs
+
+
+def key_path(cache, query):
+    return os.path.join(cache, "keys", hashlib.sha256(query.encode()).hexdigest())
+
+
+def object_path(cache, digest):
+    return os.path.join(cache, "objects", digest[:2], digest)
+
+
+def lookup(cache, query):
+    """
+    Get the cached object for a query, if we have it.
+    """
+    try:
+        with open(key_path(cache, query)) as fd:
+            digest = fd.read().strip()
+    except FileNotFoundError:
+        return
+    path = object_path(cache, digest)
+    if os.path.exists(path):
+        return path
+
+
+def touch(path):
+    with open(path + ".used", "a"):
+        os.utime(path + ".used")
+
+
+def link_or_copy(src, dest):
+    """
+    Hard link src to dest, or copy it (keeping the mtime) across filesystems.
+    """
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+
+
+def write_atomic(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "w") as handle:
+        handle.write(content)
+    os.replace(tmp, path)
+
+
+def file_digest(path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as fd:
+        for chunk in iter(lambda: fd.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def restore(cache, inputs):
+    """
+    Put cached inputs where Snakemake expects its local copies.
+
+    The copy keeps the mtime of the download that filled the cache, so
+    Snakemake only retrieves the input again if it changed in storage since.
+    """
+    for query, path in inputs:
+        if os.path.exists(path):
+            continue
+        cached = lookup(cache, query)
+        if cached is None:
+            print(f"Input cache miss: {query}")
+            continue
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            link_or_copy(cached, path)
+            touch(cached)
+            print(f"Input cache hit: {query}")
+        except OSError as e:
+            # Evicted under us, Snakemake will download it
+            print(f"Cannot restore {query} from the input cache: {e}")
+
+
+def save(cache, inputs):
+    """
+    Add inputs Snakemake downloaded to the cache.
+    """
+    for query, path in inputs:
+        if not os.path.isfile(path) or os.path.islink(path):
+            continue
+
+        # Restored from the cache (linked, or copied with the same mtime)
+        cached = lookup(cache, query)
+        if cached is not None:
+            stat, cached_stat = os.stat(path), os.stat(cached)
+            if (stat.st_ino == cached_stat.st_ino) or (
+                stat.st_size == cached_stat.st_size
+                and stat.st_mtime == cached_stat.st_mtime
+            ):
+                continue
+
+        digest = file_digest(path)
+        target = object_path(cache, digest)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp = os.path.join(os.path.dirname(target), f".{digest}.{os.getpid()}")
+            link_or_copy(path, tmp)
+            os.replace(tmp, target)
+        touch(target)
+        write_atomic(key_path(cache, query), digest)
+        print(f"Input cache saved: {query}")
+
+
+def evict(cache, size):
+    """
+    Remove least recently used objects until the cache is under size (bytes).
+    """
+    objects = []
+    total = 0
+    root = os.path.join(cache, "objects")
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.startswith(".") or filename.endswith(".used"):
+                continue
+            path = os.path.join(dirpath, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            try:
+                used = os.stat(path + ".used").st_mtime
+            except FileNotFoundError:
+                used = 0
+            objects.append((used, stat.st_size, path))
+            total += stat.st_size
+
+    objects.sort()
+    for used, nbytes, path in objects:
+        if total <= size:
+            break
+        for remove in [path, path + ".used"]:
+            try:
+                os.remove(remove)
+            except FileNotFoundError:
+                pass
+        total -= nbytes
+        print(f"Input cache evicted: {os.path.basename(path)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Node-local input cache")
+    parser.add_argument("action", choices=["restore", "save"])
+    parser.add_argument("cache", help="Cache directory (shared on the node)")
+    parser.add_argument("manifest", help="Storage inputs, as query<tab>path")
+    parser.add_argument("--size", type=int, help="Cache size limit in bytes")
+    args = parser.parse_args()
+
+    inputs = read_manifest(args.manifest)
+    if args.action == "restore":
+        return restore(args.cache, inputs)
+
+    save(args.cache, inputs)
+    if args.size:
+        # One pod on the node evicts at a time
+        with open(os.path.join(args.cache, "lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            evict(args.cache, args.size)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        # The cache is an optimization, it never fails the job
+        print(f"Input cache error: {e}", file=sys.stderr)
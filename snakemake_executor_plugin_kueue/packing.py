@@ -0,0 +1,56 @@
+import threading
+
+
+class JobPacker:
+    """
+    Gather ready jobs with the same rule and resources into packs.
+
+    A pack is submitted when it is full, or when the window after its
+    first job has passed.
+    """
+
+    def __init__(self, submit, size, window):
+        self.submit = submit
+        self.size = size
+        self.window = window
+        self.packs = {}
+        self.timers = {}
+        self.lock = threading.Lock()
+
+    def add(self, key, job):
+        with self.lock:
+            pack = self.packs.setdefault(key, [])
+            pack.append(job)
+            if len(pack) < self.size:
+                if key not in self.timers:
+                    timer = threading.Timer(self.window, self.flush, [key, pack])
+                    timer.daemon = True
+                    self.timers[key] = timer
+                    timer.start()
+                return
+            del self.packs[key]
+            timer = self.timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        self.submit(pack)
+
+    def flush(self, key, pack):
+        """
+        Submit a pack when its window is up (if it wasn't submitted full).
+        """
+        with self.lock:
+            if self.packs.get(key) is not pack:
+                return
+            del self.packs[key]
+            del self.timers[key]
+        self.submit(pack)
+
+    def cancel(self):
+        """
+        Drop anything not yet submitted.
+        """
+        with self.lock:
+            for timer in self.timers.values():
+                timer.cancel()
+            self.packs = {}
+            self.timers = {}
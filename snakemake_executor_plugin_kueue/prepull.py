@@ -0,0 +1,240 @@
+import os
+import re
+import threading
+
+import requests
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+from snakemake.logging import logger
+
+import snakemake_executor_plugin_kueue.custom_resource as cr
+
+# Accept manifest lists / indexes, so the digest is the same on every platform
+manifest_types = ", ".join(
+    [
+        "application/vnd.oci.image.index.v1+json",
+        "application/vnd.docker.distribution.manifest.list.v2+json",
+        "application/vnd.oci.image.manifest.v1+json",
+        "application/vnd.docker.distribution.manifest.v2+json",
+    ]
+)
+
+
+def parse_image(image):
+    """
+    Split an image into registry, repository, and tag (or digest).
+    """
+    name, _, digest = image.partition("@")
+    tag = "latest"
+    if ":" in name.rsplit("/", 1)[-1]:
+        name, tag = name.rsplit(":", 1)
+
+    # Docker Hub is the default registry, and has a library/ namespace
+    registry, _, repository = name.partition("/")
+    if not repository or not (
+        "." in registry or ":" in registry or registry == "localhost"
+    ):
+        registry, repository = "registry-1.docker.io", name
+        if "/" not in repository:
+            repository = f"library/{repository}"
+    if registry == "docker.io":
+        registry = "registry-1.docker.io"
+    return registry, repository, digest or tag
+
+
+def parse_challenge(header):
+    """
+    Parse a Bearer WWW-Authenticate header into its parameters.
+    """
+    return dict(re.findall(r'(\w+)="([^"]*)"', header or ""))
+
+
+def resolve_digest(image, timeout=10):
+    """
+    Resolve an image tag to a digest with the registry API (anonymously).
+
+    Returns None if we can't, e.g., for a private registry.
+    """
+    if "@" in image:
+        return image.split("@", 1)[1]
+    registry, repository, tag = parse_image(image)
+    url = f"https://{registry}/v2/{repository}/manifests/{tag}"
+    headers = {"Accept": manifest_types}
+    response = requests.head(url, headers=headers, timeout=timeout)
+    if response.status_code == 401:
+        challenge = parse_challenge(response.headers.get("WWW-Authenticate"))
+        if "realm" not in challenge:
+            return
+        params = {"service": challenge.get("service")}
+        params["scope"] = challenge.get("scope") or f"repository:{repository}:pull"
+        token = requests.get(challenge["realm"], params=params, timeout=timeout)
+        token.raise_for_status()
+        token = token.json()
+        headers["Authorization"] = "Bearer " + (
+            token.get("token") or token.get("access_token")
+        )
+        response = requests.head(url, headers=headers, timeout=timeout)
+    response.raise_for_status()
+    return response.headers.get("Docker-Content-Digest")
+
+
+def pin(image, digest):
+    """
+    Reference an image by digest instead of tag.
+    """
+    name = image.split("@", 1)[0]
+    if ":" in name.rsplit("/", 1)[-1]:
+        name = name.rsplit(":", 1)[0]
+    return f"{name}@{digest}"
+
+
+class ImagePrepuller:
+    """
+    Pull the images a workflow needs on every node ahead of time.
+
+    A DaemonSet has one init container per image (that does nothing), so
+    each node pulls them all as soon as it can run a pod. Images need not
+    have a shell: the first init container copies a static busybox into a
+    volume, and the others run it as true. Jobs then use
+    the same images by digest, so the pull is a cache hit with
+    IfNotPresent, even for a tag like latest that moves. The DaemonSet is
+    updated when a new image comes along, and deleted at shutdown.
+    """
+
+    pause_image = "registry.k8s.io/pause:3.9"
+    true_image = "busybox:1.36.1-musl"
+    true_path = "/snakemake_prepull/true"
+
+    def __init__(self, api, namespace, workflow_uid):
+        self.api = api
+        self.namespace = namespace
+        self.workflow_uid = workflow_uid
+        self.name = f"snakemake-prepull-{workflow_uid[:10]}"
+
+        # Pinned images by image, and if the DaemonSet exists
+        self.images = {}
+        self.created = False
+        self.lock = threading.Lock()
+
+    def add(self, images):
+        """
+        Resolve new images and add them to the DaemonSet.
+        """
+        with self.lock:
+            new = [image for image in images if image not in self.images]
+            if not new:
+                return
+            for image in new:
+                self.images[image] = self.resolve(image)
+            try:
+                self.apply()
+            except Exception as e:
+                logger.warning(f"Cannot update image pre-pull DaemonSet: {e}")
+
+    def resolve(self, image):
+        try:
+            digest = resolve_digest(image)
+        except Exception as e:
+            logger.debug(f"Cannot resolve {image} to a digest: {e}")
+            digest = None
+        if not digest:
+            return image
+        pinned = pin(image, digest)
+        logger.info(f"Pre-pulling {image} as {pinned}")
+        return pinned
+
+    def pinned(self, image):
+        """
+        Get the image by digest (if we resolved it).
+        """
+        with self.lock:
+            return self.images.get(image) or image
+
+    def generate(self):
+        labels = {"app": self.name, cr.workflow_label: self.workflow_uid}
+        resources = {"requests": {"cpu": "1m", "memory": "8Mi"}}
+        mount = client.V1VolumeMount(
+            name="true", mount_path=os.path.dirname(self.true_path)
+        )
+        init_containers = [
+            client.V1Container(
+                name="true",
+                image=self.true_image,
+                image_pull_policy="IfNotPresent",
+                command=["/bin/cp", "/bin/busybox", self.true_path],
+                resources=resources,
+                volume_mounts=[mount],
+            )
+        ]
+        init_containers += [
+            client.V1Container(
+                name=f"pull-{i}",
+                image=image,
+                image_pull_policy="IfNotPresent",
+                command=[self.true_path],
+                resources=resources,
+                volume_mounts=[mount],
+            )
+            for i, image in enumerate(sorted(set(self.images.values())))
+        ]
+        pause = client.V1Container(
+            name="pause",
+            image=self.pause_image,
+            image_pull_policy="IfNotPresent",
+            resources=resources,
+        )
+        return client.V1DaemonSet(
+            api_version="apps/v1",
+            kind="DaemonSet",
+            metadata=client.V1ObjectMeta(
+                name=self.name, namespace=self.namespace, labels=labels
+            ),
+            spec=client.V1DaemonSetSpec(
+                selector=client.V1LabelSelector(match_labels={"app": self.name}),
+                template=client.V1PodTemplateSpec(
+                    metadata=client.V1ObjectMeta(labels=labels),
+                    spec=client.V1PodSpec(
+                        init_containers=init_containers,
+                        containers=[pause],
+                        volumes=[
+                            client.V1Volume(
+                                name="true", empty_dir=client.V1EmptyDirVolumeSource()
+                            )
+                        ],
+                        termination_grace_period_seconds=0,
+                    ),
+                ),
+            ),
+        )
+
+    def apply(self):
+        """
+        Create the DaemonSet, or replace its pod template.
+        """
+        apps_api = self.api.apps_v1
+        body = self.generate()
+        if not self.created:
+            try:
+                apps_api.create_namespaced_daemon_set(self.namespace, body)
+                self.created = True
+                return
+            except ApiException as e:
+                if e.status != 409:
+                    raise
+                self.created = True
+        apps_api.replace_namespaced_daemon_set(self.name, self.namespace, body)
+
+    def delete(self):
+        """
+        Delete the DaemonSet (and its pods).
+        """
+        if not self.created:
+            return
+        try:
+            self.api.apps_v1.delete_namespaced_daemon_set(
+                self.name, self.namespace, propagation_policy="Background"
+            )
+        except ApiException as e:
+            if e.status != 404:
+                logger.warning(f"Cannot delete image pre-pull DaemonSet: {e}")
+        self.created = False
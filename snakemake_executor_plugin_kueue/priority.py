@@ -0,0 +1,126 @@
+import threading
+
+from snakemake.logging import logger
+
+# Label Kueue takes the WorkloadPriorityClass of a job from
+priority_label = "kueue.x-k8s.io/priority-class"
+
+
+def parse_classes(spec):
+    """
+    Parse "name=length,..." into (minimum path length, name), highest first.
+    """
+    classes = []
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        name, _, length = item.partition("=")
+        try:
+            classes.append((int(length or 0), name.strip()))
+        except ValueError:
+            raise ValueError(f"Invalid priority class {item}, expected name=length")
+    return sorted(classes, reverse=True)
+
+
+class CriticalPath:
+    """
+    Kueue priority classes for jobs, from what still depends on them.
+
+    The remaining critical path of a job is the longest chain of jobs that
+    have to run after it (itself included). A job on a long chain holds up
+    more of the workflow than a leaf, so it gets a higher class, and Kueue
+    admits (and may preempt for) it first instead of in submission order.
+    Jobs of rules with a priority, or a kueue_priority_class resource, get
+    the highest class (or the class they ask for).
+    """
+
+    group = "kueue.x-k8s.io"
+    version = "v1beta1"
+    plural = "workloadpriorityclasses"
+
+    def __init__(self, dag, classes=None):
+        self.dag = dag
+        self.classes = classes or []
+
+        # Remaining critical path length, by job (the DAG doesn't change much)
+        self.lengths = {}
+        self.lock = threading.Lock()
+
+    @property
+    def names(self):
+        return [name for _, name in self.classes]
+
+    def check(self, api):
+        """
+        Warn about classes that don't exist, Kueue won't admit their jobs.
+        """
+        for name in self.names:
+            try:
+                api.custom_objects.get_cluster_custom_object(
+                    self.group, self.version, self.plural, name
+                )
+            except Exception as e:
+                logger.warning(f"Cannot get WorkloadPriorityClass {name}: {e}")
+
+    def dependants(self, job):
+        """
+        Jobs that depend on a job and still have to run.
+        """
+        depending = getattr(self.dag, "depending", None) or {}
+        needrun = getattr(self.dag, "needrun", None)
+        return [
+            dependant
+            for dependant in depending.get(job, {})
+            if needrun is None or needrun(dependant)
+        ]
+
+    def length(self, job):
+        """
+        Remaining critical path length of a job, without recursion.
+        """
+        with self.lock:
+            stack = [job]
+            while stack:
+                current = stack[-1]
+                if current in self.lengths:
+                    stack.pop()
+                    continue
+                dependants = self.dependants(current)
+                pending = [dep for dep in dependants if dep not in self.lengths]
+                if pending:
+                    stack.extend(pending)
+                    continue
+                self.lengths[current] = 1 + max(
+                    (self.lengths[dep] for dep in dependants), default=0
+                )
+                stack.pop()
+            return self.lengths[job]
+
+    def job_class(self, job):
+        override = job.resources.get("kueue_priority_class")
+        if override:
+            return override
+        if not self.classes:
+            return
+        if (getattr(job, "priority", 0) or 0) > 0:
+            return self.classes[0][1]
+        jobs = list(job.jobs) if job.is_group() else [job]
+        length = max(self.length(member) for member in jobs)
+        for minimum, name in self.classes:
+            if length >= minimum:
+                return name
+
+    def assign(self, jobs):
+        """
+        The priority class for jobs submitted together (the highest of them).
+
+        A class asked for by a job that is not one of ours ranks below ours,
+        we can't tell how it compares.
+        """
+        found = [name for name in map(self.job_class, jobs) if name]
+        if not found:
+            return
+        names = self.names
+        return min(
+            found, key=lambda name: names.index(name) if name in names else len(names)
+        )
@@ -0,0 +1,130 @@
+import heapq
+import itertools
+import threading
+import time
+
+# Lower numbers go first: submissions and status checks are on the
+# critical path, logs and cleanup can wait.
+lanes = {"submit": 0, "status": 0, "logs": 1, "cleanup": 1}
+
+
+def request_lane(resource_path, method):
+    """
+    Derive the lane for a request from its method and path.
+    """
+    if method == "DELETE":
+        return "cleanup"
+    if method in ["POST", "PUT", "PATCH"]:
+        return "submit"
+    if resource_path.endswith("/log"):
+        return "logs"
+    return "status"
+
+
+def retry_after(error, attempt):
+    """
+    Seconds to wait after a 429, from Retry-After or exponential backoff.
+    """
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return max(float(headers.get("Retry-After")), 0)
+    except (TypeError, ValueError):
+        return min(2**attempt, 30)
+
+
+class RateLimiter:
+    """
+    A token bucket shared by all requests, with priority lanes.
+
+    Requests wait in priority order (then first come, first served), and
+    a 429 from the server pauses every lane until Retry-After passes. We
+    keep track of how long each lane waited to help size the limits.
+    """
+
+    def __init__(self, qps=None, burst=None):
+        self.qps = qps
+        self.burst = burst or max(1, int(qps or 1))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0
+
+        self.condition = threading.Condition()
+        self.waiting = []
+        self.counter = itertools.count()
+        self.stats = {lane: {"requests": 0, "waited": 0, "max": 0} for lane in lanes}
+
+    def refill(self, now):
+        if not self.qps:
+            self.tokens = self.burst
+        else:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.qps)
+        self.updated = now
+
+    def delay(self, now):
+        """
+        Seconds until the next token (or the end of a pause).
+        """
+        delay = self.paused_until - now
+        if self.qps and self.tokens < 1:
+            delay = max(delay, (1 - self.tokens) / self.qps)
+        return max(delay, 0.001)
+
+    def acquire(self, lane="status"):
+        """
+        Block until the lane may send a request.
+        """
+        start = time.monotonic()
+        ticket = (lanes.get(lane, 1), next(self.counter))
+        with self.condition:
+            heapq.heappush(self.waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self.refill(now)
+                    if (
+                        self.waiting[0] == ticket
+                        and self.tokens >= 1
+                        and now >= self.paused_until
+                    ):
+                        break
+                    self.condition.wait(
+                        self.delay(now) if self.waiting[0] == ticket else None
+                    )
+            except BaseException:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+                self.condition.notify_all()
+                raise
+            heapq.heappop(self.waiting)
+            self.tokens -= 1
+            self.record(lane, time.monotonic() - start)
+            self.condition.notify_all()
+
+    def pause(self, seconds):
+        """
+        Hold back every lane, e.g., after a 429 with Retry-After.
+        """
+        with self.condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.condition.notify_all()
+
+    def record(self, lane, waited):
+        stats = self.stats.setdefault(lane, {"requests": 0, "waited": 0, "max": 0})
+        stats["requests"] += 1
+        stats["waited"] += waited
+        stats["max"] = max(stats["max"], waited)
+
+    def summary(self):
+        """
+        Describe how many requests each lane made and how long they waited.
+        """
+        with self.condition:
+            lines = []
+            for lane, stats in self.stats.items():
+                if not stats["requests"]:
+                    continue
+                lines.append(
+                    f"{lane}: {stats['requests']} requests, waited "
+                    f"{stats['waited']:.2f}s total, {stats['max']:.2f}s max"
+                )
+            return "\n".join(lines)
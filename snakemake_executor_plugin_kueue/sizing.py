@@ -0,0 +1,214 @@
+import json
+import math
+import os
+import threading
+
+from snakemake.logging import logger
+
+import snakemake_executor_plugin_kueue.custom_resource as cr
+import snakemake_executor_plugin_kueue.utils as utils
+
+# Label on the pods of an Indexed Job (Kubernetes 1.28+)
+index_label = "batch.kubernetes.io/job-completion-index"
+
+
+def percentile(values, percent):
+    """
+    Nearest rank percentile of a list of values.
+    """
+    values = sorted(values)
+    rank = math.ceil(percent / 100 * len(values))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+def format_memory(nbytes):
+    return f"{math.ceil(nbytes / 2**20)}Mi"
+
+
+def format_cpu(cores):
+    return f"{math.ceil(cores * 1000)}m"
+
+
+def oom_killed(pods):
+    """
+    Was a container in one of these pods killed for running out of memory?
+    """
+    for pod in pods or []:
+        for status in (pod.status and pod.status.container_statuses) or []:
+            for state in [status.state, status.last_state]:
+                terminated = state.terminated if state else None
+                if terminated is not None and terminated.reason == "OOMKilled":
+                    return True
+    return False
+
+
+class UsageTracker:
+    """
+    Peak CPU and memory of running pods, from the metrics API.
+
+    One LIST of pod metrics for the run per status check, so the peak is
+    the highest usage seen at a status check (not between them).
+    """
+
+    group = "metrics.k8s.io"
+    version = "v1beta1"
+
+    def __init__(self, api, namespace, workflow_uid):
+        self.api = api
+        self.namespace = namespace
+        self.workflow_uid = workflow_uid
+
+        # Peak (cpu cores, memory bytes) by job id and completion index
+        self.peaks = {}
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        result = self.api.custom_objects.list_namespaced_custom_object(
+            group=self.group,
+            version=self.version,
+            namespace=self.namespace,
+            plural="pods",
+            label_selector=f"{cr.workflow_label}={self.workflow_uid}",
+        )
+        for item in result.get("items", []):
+            labels = item["metadata"].get("labels") or {}
+            key = (labels.get(cr.jobid_label), labels.get(index_label))
+            cpu = memory = 0
+            for container in item.get("containers") or []:
+                usage = container.get("usage") or {}
+                cpu += utils.parse_cpu(usage.get("cpu", 0)) or 0
+                memory += utils.parse_quantity(usage.get("memory", 0)) or 0
+            with self.lock:
+                peak = self.peaks.get(key, (0, 0))
+                self.peaks[key] = (max(peak[0], cpu), max(peak[1], memory))
+
+    def pop(self, jobid, index=None):
+        """
+        Take the peak for a job (over all its pods, or for one index).
+        """
+        cpu = memory = 0
+        with self.lock:
+            for key in list(self.peaks):
+                if key[0] != str(jobid) or (index is not None and key[1] != index):
+                    continue
+                peak = self.peaks.pop(key)
+                cpu, memory = max(cpu, peak[0]), max(memory, peak[1])
+        if not cpu and not memory:
+            return
+        return cpu, memory
+
+
+class ResourceHistory:
+    """
+    CPU and memory used by past jobs of each rule, to size new ones.
+
+    Samples are kept per rule in a file under .snakemake, across runs.
+    A request is a percentile of the samples plus headroom, and a job
+    that was killed for memory gets twice the memory when it is retried.
+    """
+
+    max_samples = 50
+    min_samples = 3
+
+    def __init__(self, filename, percent=95, headroom=20, apply=True):
+        self.filename = filename
+        self.percent = percent
+        self.headroom = headroom
+        self.apply = apply
+        self.rules = self.load()
+
+        # Memory a job was killed with, by job id
+        self.killed = {}
+        self.requested = {}
+        self.lock = threading.Lock()
+
+    def load(self):
+        if not os.path.exists(self.filename):
+            return {}
+        try:
+            return json.loads(utils.read_file(self.filename))
+        except Exception as e:
+            logger.warning(f"Cannot read resource history {self.filename}: {e}")
+            return {}
+
+    def save(self):
+        with self.lock:
+            content = json.dumps(self.rules, indent=4)
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        utils.write_file(content, self.filename + ".tmp")
+        os.replace(self.filename + ".tmp", self.filename)
+
+    def record(self, rule, cpu=None, memory=None):
+        with self.lock:
+            samples = self.rules.setdefault(rule, {"cpu": [], "memory": []})
+            for name, value in [("cpu", cpu), ("memory", memory)]:
+                if value:
+                    samples[name] = (samples[name] + [value])[-self.max_samples :]
+
+    def oom(self, job):
+        """
+        Remember that a job ran out of memory, so its retry gets more.
+
+        What it asked for also goes in the history, it needed at least that.
+        """
+        memory = self.requested.get(job.jobid)
+        if memory is None:
+            return
+        logger.info(f"Job {job.jobid} ({job.name}) was killed for memory")
+        with self.lock:
+            self.killed[job.jobid] = memory
+        self.record(job.name, memory=memory)
+
+    def suggest(self, rule):
+        """
+        Suggested (cpu cores, memory bytes) for a rule with enough samples.
+        """
+        with self.lock:
+            samples = self.rules.get(rule) or {}
+            cpu, memory = samples.get("cpu") or [], samples.get("memory") or []
+            scale = 1 + self.headroom / 100
+            cpu = percentile(cpu, self.percent) * scale
+            memory = percentile(memory, self.percent) * scale
+        return max(cpu, 0.1), max(memory, 64 * 2**20)
+
+    def requests(self, job, cores, memory):
+        """
+        CPU and memory to request for a job, given what the job asks for.
+
+        History only lowers the CPU request (the job still uses its cores),
+        and only replaces the memory default, not a memory the rule sets.
+        """
+        if self.apply and self.enough(job.name):
+            cpu, nbytes = self.suggest(job.name)
+            if cores:
+                cores = format_cpu(min(float(cores), cpu))
+            if not job.resources.get("kueue_memory"):
+                memory = format_memory(nbytes)
+
+        killed = self.killed.get(job.jobid) if self.apply else None
+        if killed is not None:
+            memory = format_memory(max(utils.parse_quantity(memory) or 0, killed * 2))
+        self.requested[job.jobid] = utils.parse_quantity(memory)
+        return cores, memory
+
+    def enough(self, rule):
+        with self.lock:
+            samples = self.rules.get(rule) or {}
+            return all(
+                len(samples.get(name) or []) >= self.min_samples
+                for name in ["cpu", "memory"]
+            )
+
+    def summary(self):
+        """
+        Suggested requests per rule, for the log.
+        """
+        lines = []
+        for rule in sorted(self.rules):
+            if not self.enough(rule):
+                continue
+            cpu, memory = self.suggest(rule)
+            lines.append(
+                f"    {rule}: cpu {format_cpu(cpu)}, memory {format_memory(memory)}"
+            )
+        return "\n".join(lines)
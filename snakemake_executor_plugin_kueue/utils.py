@@ -1,3 +1,7 @@
+import importlib.util
+import sys
+
+
 def write_file(content, filename, mode="w"):
     """
     Write content to file.
@@ -30,3 +34,65 @@ def write_script(content, path, hashbang="#!/bin/bash"):
 {content}
 EOF
 """
+
+
+def parse_indexes(indexes):
+    """
+    Parse completed or failed indexes of an Indexed Job, e.g., "1,3-5,7"
+    """
+    parsed = set()
+    for part in (indexes or "").split(","):
+        if not part:
+            continue
+        start, _, end = part.partition("-")
+        parsed.update(range(int(start), int(end or start) + 1))
+    return parsed
+
+
+def lazy_import(name):
+    """
+    Import a module on first attribute access, instead of right now.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def parse_quantity(quantity):
+    """
+    Parse a Kubernetes memory quantity (e.g., 200Mi, 1G) to bytes, or None.
+    """
+    units = {"Ki": 2**10, "Mi": 2**20, "Gi": 2**30, "Ti": 2**40}
+    units.update({"k": 10**3, "K": 10**3, "M": 10**6, "G": 10**9, "T": 10**12})
+    quantity = str(quantity).strip()
+    for suffix in sorted(units, key=len, reverse=True):
+        if quantity.endswith(suffix):
+            quantity, factor = quantity[: -len(suffix)], units[suffix]
+            break
+    else:
+        factor = 1
+    try:
+        return float(quantity) * factor
+    except ValueError:
+        return
+
+
+def parse_cpu(quantity):
+    """
+    Parse a Kubernetes CPU quantity (e.g., 250m, 12345n, 2) to cores, or None.
+    """
+    units = {"n": 1e-9, "u": 1e-6, "m": 1e-3}
+    quantity = str(quantity).strip()
+    factor = units.get(quantity[-1:], 1)
+    if factor != 1:
+        quantity = quantity[:-1]
+    try:
+        return float(quantity) * factor
+    except ValueError:
+        return
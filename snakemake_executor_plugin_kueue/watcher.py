@@ -0,0 +1,298 @@
+import threading
+
+from kubernetes import watch
+from kubernetes.client.rest import ApiException
+from snakemake.logging import logger
+
+import snakemake_executor_plugin_kueue.custom_resource as cr
+
+
+def object_name(obj):
+    """
+    Get the name of a typed (client model) or custom (dict) object.
+    """
+    if isinstance(obj, dict):
+        return obj["metadata"]["name"]
+    return obj.metadata.name
+
+
+class ResourceWatch:
+    """
+    Keep a local copy of one kind of object with a LIST followed by a WATCH.
+
+    If the watch drops or the resource version expires (410 Gone) we list
+    again, so the local copy is resynced with the server. With
+    keep_deleted, names of objects we saw go away are kept, so a deleted
+    object can be told from one the watch has not caught up with yet.
+    """
+
+    def __init__(
+        self,
+        kind,
+        list_func,
+        selector,
+        on_event=None,
+        index=None,
+        keep_deleted=False,
+        **kwargs,
+    ):
+        self.kind = kind
+        self.list_func = list_func
+        self.selector = selector
+        self.on_event = on_event
+        self.index = index
+        self.keep_deleted = keep_deleted
+        self.kwargs = kwargs
+
+        # Objects by name, (optionally) grouped by an index key, and deleted
+        self.objects = {}
+        self.indexed = {}
+        self.deleted = set()
+        self.lock = threading.Lock()
+        self.synced = threading.Event()
+        self.stopped = threading.Event()
+        self.watch = None
+        self.thread = threading.Thread(
+            target=self.run, name=f"kueue-watch-{kind}", daemon=True
+        )
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.watch is not None:
+            self.watch.stop()
+
+    def get(self, name):
+        with self.lock:
+            return self.objects.get(name)
+
+    def get_indexed(self, key):
+        with self.lock:
+            return list(self.indexed.get(key, {}).values())
+
+    def was_deleted(self, name):
+        with self.lock:
+            return name in self.deleted
+
+    def store(self, obj):
+        name = object_name(obj)
+        self.objects[name] = obj
+        self.deleted.discard(name)
+        if self.index is not None:
+            self.indexed.setdefault(self.index(obj), {})[name] = obj
+
+    def remove(self, obj):
+        name = object_name(obj)
+        self.objects.pop(name, None)
+        if self.keep_deleted:
+            self.deleted.add(name)
+        if self.index is not None:
+            self.indexed.get(self.index(obj), {}).pop(name, None)
+
+    def notify(self):
+        if self.on_event is not None:
+            self.on_event()
+
+    def relist(self):
+        """
+        List all objects for the run and replace the local copy.
+        """
+        result = self.list_func(label_selector=self.selector, **self.kwargs)
+        if isinstance(result, dict):
+            items = result["items"]
+            resource_version = result["metadata"]["resourceVersion"]
+        else:
+            items = result.items
+            resource_version = result.metadata.resource_version
+
+        with self.lock:
+            previous = self.objects
+            self.objects = {}
+            self.indexed = {}
+            for obj in items:
+                self.store(obj)
+
+            # Objects deleted while we weren't watching
+            if self.keep_deleted:
+                self.deleted.update(set(previous) - set(self.objects))
+        self.synced.set()
+        self.notify()
+        return resource_version
+
+    def handle(self, event):
+        """
+        Apply a single watch event to the local copy.
+        """
+        if event["type"] not in ["ADDED", "MODIFIED", "DELETED"]:
+            return
+        with self.lock:
+            if event["type"] == "DELETED":
+                self.remove(event["object"])
+            else:
+                self.store(event["object"])
+        self.notify()
+
+    def run(self):
+        delay = 1
+        resource_version = None
+        while not self.stopped.is_set():
+            try:
+                if resource_version is None:
+                    resource_version = self.relist()
+                self.watch = watch.Watch()
+                for event in self.watch.stream(
+                    self.list_func,
+                    label_selector=self.selector,
+                    resource_version=resource_version,
+                    timeout_seconds=300,
+                    **self.kwargs,
+                ):
+                    self.handle(event)
+                    resource_version = self.watch.resource_version
+                    delay = 1
+
+            # The resource version is too old, we need a fresh list
+            except ApiException as e:
+                resource_version = None
+                if e.status != 410:
+                    logger.debug(f"Watch for {self.kind} failed: {e}")
+                    self.stopped.wait(delay)
+                    delay = min(delay * 2, 60)
+
+            except Exception as e:
+                logger.debug(f"Watch for {self.kind} dropped: {e}")
+                resource_version = None
+                self.stopped.wait(delay)
+                delay = min(delay * 2, 60)
+
+
+class StatusCache:
+    """
+    Shared status cache for Jobs, Pods, and MiniClusters of one workflow run.
+
+    Each kind is fed by one LIST+WATCH stream selected by the run label,
+    so checking status for active jobs is a local lookup.
+    """
+
+    def __init__(self, api, namespace, workflow_uid):
+        selector = f"{cr.workflow_label}={workflow_uid}"
+        self.changed = threading.Event()
+
+        batch_api = api.batch_v1
+        core_api = api.core_v1
+        crd_api = api.custom_objects
+
+        self.jobs = ResourceWatch(
+            "jobs",
+            batch_api.list_namespaced_job,
+            selector,
+            on_event=self.changed.set,
+            namespace=namespace,
+        )
+        self.pods = ResourceWatch(
+            "pods",
+            core_api.list_namespaced_pod,
+            selector,
+            index=lambda pod: (pod.metadata.labels or {}).get("job-name"),
+            on_event=self.changed.set,
+            namespace=namespace,
+        )
+        self.miniclusters = ResourceWatch(
+            "miniclusters",
+            crd_api.list_namespaced_custom_object,
+            selector,
+            group=cr.FluxMiniCluster.group,
+            version=cr.FluxMiniCluster.version,
+            plural=cr.FluxMiniCluster.plural,
+            namespace=namespace,
+            keep_deleted=True,
+        )
+        self.watches = [self.jobs, self.pods, self.miniclusters]
+
+    def start(self):
+        for resource in self.watches:
+            resource.start()
+
+    def stop(self):
+        for resource in self.watches:
+            resource.stop()
+
+    def wait(self, timeout):
+        """
+        Block until a job event arrives (or the timeout passes).
+        """
+        self.changed.wait(timeout)
+        self.changed.clear()
+
+    def get_job(self, name):
+        """
+        Get a cached Job, or None if the cache cannot answer for it.
+        """
+        if not self.jobs.synced.is_set():
+            return
+        return self.jobs.get(name)
+
+    def get_pods(self, jobname):
+        """
+        Get cached pods for a job, or None if the cache is not synced.
+        """
+        if not self.pods.synced.is_set():
+            return
+        return self.pods.get_indexed(jobname)
+
+    def minicluster_deleted(self, name):
+        """
+        The watch can lag behind a create, so we can't tell a new
+        MiniCluster from a deleted one by absence alone, only by having
+        seen it go.
+        """
+        return self.miniclusters.was_deleted(name)
+
+
+class StatusSnapshot:
+    """
+    Status for all jobs of a run in one namespace, from one LIST per kind.
+
+    This is the poll-based alternative to the StatusCache: the number of
+    requests per status check is constant instead of one per active job.
+    """
+
+    def __init__(self, api, namespace, workflow_uid, miniclusters=False):
+        selector = f"{cr.workflow_label}={workflow_uid}"
+        batch_api = api.batch_v1
+        jobs = batch_api.list_namespaced_job(namespace, label_selector=selector)
+        self.jobs = {job.metadata.name: job for job in jobs.items}
+
+        # Pods, by job, to catch pods that are stuck or failed
+        self.pods = {}
+        pods = api.core_v1.list_namespaced_pod(namespace, label_selector=selector)
+        for pod in pods.items:
+            jobname = (pod.metadata.labels or {}).get("job-name")
+            self.pods.setdefault(jobname, []).append(pod)
+
+        # Only ask for MiniClusters if we have some (the CRD might not exist)
+        self.miniclusters = None
+        if miniclusters:
+            crd_api = api.custom_objects
+            result = crd_api.list_namespaced_custom_object(
+                group=cr.FluxMiniCluster.group,
+                version=cr.FluxMiniCluster.version,
+                namespace=namespace,
+                plural=cr.FluxMiniCluster.plural,
+                label_selector=selector,
+            )
+            self.miniclusters = {object_name(mc): mc for mc in result["items"]}
+
+    def get_job(self, name):
+        return self.jobs.get(name)
+
+    def get_pods(self, jobname):
+        return self.pods.get(jobname)
+
+    def minicluster_deleted(self, name):
+        """
+        A list is a consistent read, so a missing MiniCluster was deleted.
+        """
+        return self.miniclusters is not None and name not in self.miniclusters
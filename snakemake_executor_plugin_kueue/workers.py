@@ -0,0 +1,431 @@
+import queue
+import threading
+
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+from snakemake.logging import logger
+
+import snakemake_executor_plugin_kueue.custom_resource as cr
+import snakemake_executor_plugin_kueue.utils as utils
+
+# Label on worker jobs (and pods), so we can find and delete them
+worker_label = "snakemake-kueue/worker"
+
+# The worker waits for jobs, and exits when nothing ran for a while
+# (in case the executor is gone and can't delete it)
+worker_script = """touch /tmp/heartbeat
+while [ $(( $(date +%s) - $(stat -c %Y /tmp/heartbeat) )) -lt {limit} ]; do
+  sleep 10
+done
+"""
+
+# Each job runs in its own directory (or the shared one), and keeps the worker
+# alive while it runs
+job_script = """mkdir -p {workdir} && cd {workdir} || exit 1
+(while true; do touch /tmp/heartbeat; sleep 10; done) &
+heartbeat=$!
+{command}
+status=$?
+kill $heartbeat
+{cleanup}exit $status
+"""
+
+
+class WorkerJob(cr.TrackedJob):
+    """
+    A job run on a warm worker, its log is written as it runs.
+    """
+
+    def __init__(self, pool, job, command, logfile):
+        super().__init__(job)
+        self.pool = pool
+        self.command = command
+        self.logfile = logfile
+        self.jobname = f"{pool.name}-job-{job.jobid}"
+        self.state = cr.JobStatus.QUEUED
+        self.pod = None
+
+    @property
+    def settings(self):
+        return self.pool.settings
+
+    @classmethod
+    def delete_batch(cls, api, namespace, crds, label_selector):
+        """
+        Nothing to delete, the pool deletes its workers when it stops.
+        """
+        pass
+
+    def status(self, job=None):
+        return self.state
+
+    def log_pods(self, pods=None):
+        """
+        The worker pod the job ran on (its log is written as the job runs).
+        """
+        if self.pod is None:
+            return []
+        return [client.V1Pod(metadata=client.V1ObjectMeta(name=self.pod))]
+
+    def write_pod_log(self, pod, filename, limit_bytes=None):
+        """
+        The log part (log_part) was written by the exec already.
+        """
+        pass
+
+    def finished(self):
+        """
+        Nothing to clean up, the worker goes on to the next job.
+        """
+        pass
+
+    def log_part(self, pod):
+        return f"{self.logfile}.{pod}"
+
+
+class WorkerPool:
+    """
+    A pool of long lived, Kueue admitted worker pods that run jobs by exec.
+
+    Jobs skip admission, scheduling, and container start: each one runs
+    its Snakemake command in a worker that is already running, and the
+    exit code of the exec tells us if it succeeded. Workers are Jobs in
+    the queue, one thread per worker takes jobs from a shared queue, and
+    the pool grows with the jobs waiting (up to a maximum) and shrinks as
+    workers sit idle. If workers keep exiting before they run, the pool
+    gives up and fails its jobs instead of starting more.
+    """
+
+    # Workers in a row that exit before running, before we give up
+    max_failed_starts = 3
+
+    # Seconds between checks on a starting worker, and before the next one
+    # is started after a worker exited before it ran
+    poll_interval = 2
+    restart_delay = 10
+
+    def __init__(
+        self,
+        api,
+        settings,
+        snakefile,
+        workflow_uid,
+        image,
+        container=None,
+        environment=None,
+        timelines=None,
+    ):
+        self.api = api
+        self.settings = settings
+        self.snakefile = snakefile
+        self.workflow_uid = workflow_uid
+        self.image = image
+        self.container = container or image
+        self.environment = environment or {}
+        self.timelines = timelines
+        self.name = f"snakemake-workers-{workflow_uid[:10]}"
+
+        self.max_workers = settings.workers
+        self.cores = settings.worker_cores or 1
+        self.memory = settings.worker_memory or "1Gi"
+        self.idle = settings.worker_idle or 60
+
+        self.jobs = queue.Queue()
+        self.workers = {}
+        self.configmap = None
+        self.failed_starts = 0
+        self.broken = False
+        self.lock = threading.Lock()
+        self.scaling = threading.Lock()
+        self.stopped = threading.Event()
+
+    @property
+    def labels(self):
+        return {cr.workflow_label: self.workflow_uid, worker_label: "true"}
+
+    def accepts(self, job, image):
+        """
+        Can a job run on a worker (same container, and it fits)?
+        """
+        if image != self.container:
+            return False
+        if (job.resources.get("kueue_operator") or "job") != "job":
+            return False
+        if int(job.resources.get("kueue_shards") or 1) > 1:
+            return False
+        if (job.resources.get("_cores") or 1) > self.cores:
+            return False
+        memory = utils.parse_quantity(job.resources.get("kueue_memory") or "200Mi")
+        limit = utils.parse_quantity(self.memory)
+        return memory is not None and limit is not None and memory <= limit
+
+    def submit(self, job, command, logfile):
+        """
+        Queue a job for the next free worker, adding workers if needed.
+        """
+        crd = WorkerJob(self, job, command, logfile)
+        with self.lock:
+            if self.broken:
+                crd.state = cr.JobStatus.FAILED
+                return crd
+            self.jobs.put(crd)
+        self.scale()
+        return crd
+
+    def scale(self):
+        """
+        Start workers for the jobs waiting that no idle (or starting) worker
+        will pick up.
+        """
+        with self.scaling:
+            with self.lock:
+                if self.stopped.is_set() or self.broken:
+                    return
+                available = sum(
+                    1
+                    for state in self.workers.values()
+                    if state in ["starting", "idle"]
+                )
+                wanted = min(
+                    self.jobs.qsize() - available, self.max_workers - len(self.workers)
+                )
+            for _ in range(max(wanted, 0)):
+                try:
+                    self.start_worker()
+                except Exception as e:
+                    logger.warning(f"Cannot start a worker: {e}")
+                    break
+
+    def start_worker(self):
+        if self.configmap is None:
+            self.create_configmap()
+        result = self.api.batch_v1.create_namespaced_job(
+            self.settings.namespace, self.generate()
+        )
+        name = result.metadata.name
+        with self.lock:
+            self.workers[name] = "starting"
+        threading.Thread(
+            target=self.run_worker, args=[name], name=f"kueue-{name}", daemon=True
+        ).start()
+        logger.debug(f"Started worker {name}")
+
+    def create_configmap(self):
+        name = f"{self.name}-snakefile"
+        cm = client.V1ConfigMap(
+            metadata=client.V1ObjectMeta(
+                name=name, namespace=self.settings.namespace, labels=self.labels
+            ),
+            data={"snakefile": utils.read_file(self.snakefile)},
+        )
+        try:
+            self.api.core_v1.create_namespaced_config_map(self.settings.namespace, cm)
+        except ApiException as e:
+            if e.status != 409:
+                raise
+        self.configmap = name
+
+    def generate(self):
+        """
+        A worker Job, in the queue like any other job.
+        """
+        limit = self.idle + 600
+        container = client.V1Container(
+            name="worker",
+            image=self.image,
+            command=["/bin/bash", "-c", worker_script.format(limit=limit)],
+            working_dir=cr.shared_workdir(self.settings) or self.settings.working_dir,
+            env=[{"name": k, "value": v} for k, v in self.environment.items()],
+            resources={"requests": {"cpu": self.cores, "memory": self.memory}},
+            volume_mounts=[
+                client.V1VolumeMount(
+                    mount_path="/snakemake_workdir", name="snakefile-mount"
+                ),
+                client.V1VolumeMount(
+                    mount_path=cr.shared_workdir(self.settings) or "/workdir",
+                    name="workdir-mount",
+                ),
+            ],
+        )
+        volumes = [
+            client.V1Volume(
+                name="snakefile-mount",
+                config_map=client.V1ConfigMapVolumeSource(
+                    name=self.configmap,
+                    items=[client.V1KeyToPath(key="snakefile", path="Snakefile")],
+                ),
+            ),
+            cr.workdir_volume(self.settings),
+        ]
+        return client.V1Job(
+            api_version="batch/v1",
+            kind="Job",
+            metadata=client.V1ObjectMeta(
+                generate_name=f"{self.name}-",
+                labels={
+                    "kueue.x-k8s.io/queue-name": self.settings.queue_name,
+                    **self.labels,
+                },
+            ),
+            spec=client.V1JobSpec(
+                parallelism=1,
+                completions=1,
+                backoff_limit=0,
+                template={
+                    "metadata": {"labels": self.labels},
+                    "spec": {
+                        "containers": [container],
+                        "restartPolicy": "Never",
+                        "volumes": volumes,
+                    },
+                },
+            ),
+        )
+
+    def wait_for_pod(self, name):
+        """
+        Wait until Kueue admits the worker and its pod runs.
+        """
+        while not self.stopped.is_set():
+            try:
+                pods = self.api.core_v1.list_namespaced_pod(
+                    self.settings.namespace, label_selector=f"job-name={name}"
+                ).items
+            except Exception as e:
+                logger.debug(f"Cannot list pods for worker {name}: {e}")
+                pods = []
+            for pod in pods:
+                phase = pod.status.phase if pod.status else None
+                if phase == "Running":
+                    return pod.metadata.name
+                if phase in ["Succeeded", "Failed"]:
+                    return
+            self.stopped.wait(self.poll_interval)
+
+    def run_worker(self, name):
+        """
+        Run jobs on one worker until it is idle for too long (or broken).
+        """
+        pod = self.wait_for_pod(name)
+        if pod is None and not self.stopped.is_set():
+            self.failed_start(name)
+
+            # Don't start the next one right away if workers can't start
+            self.stopped.wait(self.restart_delay)
+        elif pod is not None:
+            logger.debug(f"Worker {name} is running as {pod}")
+            with self.lock:
+                self.failed_starts = 0
+        while pod is not None and not self.stopped.is_set():
+            with self.lock:
+                self.workers[name] = "idle"
+            try:
+                crd = self.jobs.get(timeout=self.idle)
+            except queue.Empty:
+                break
+            with self.lock:
+                self.workers[name] = "busy"
+            if not self.run_job(crd, pod):
+                break
+
+        with self.lock:
+            self.workers.pop(name, None)
+        self.delete_worker(name)
+
+        # Someone else has to pick up what is waiting
+        self.scale()
+
+    def failed_start(self, name):
+        """
+        Count a worker that exited before it ran, failing the waiting jobs
+        once too many have in a row.
+        """
+        with self.lock:
+            self.failed_starts += 1
+            if self.failed_starts < self.max_failed_starts or self.broken:
+                return
+            self.broken = True
+        logger.error(
+            f"Worker {name} exited before running, and so did the "
+            f"{self.max_failed_starts - 1} before it. Failing the jobs waiting "
+            "for workers."
+        )
+        while True:
+            try:
+                crd = self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            crd.state = cr.JobStatus.FAILED
+
+    def run_job(self, crd, pod):
+        """
+        Run one job on a worker pod, returning False if the worker is broken.
+        """
+        crd.pod = pod
+        crd.state = cr.JobStatus.ACTIVE
+        self.record(crd, "scheduled")
+        self.record(crd, "started")
+        workdir = f"/workdir/job-{crd.job.jobid}-{crd.job.attempt}"
+        cleanup = f"cd / && rm -rf {workdir}\n"
+
+        # Outputs stay where they are written in the shared working directory
+        if cr.shared_workdir(self.settings):
+            workdir, cleanup = cr.shared_workdir(self.settings), ""
+        command = job_script.format(
+            workdir=workdir, command=crd.command, cleanup=cleanup
+        )
+        try:
+            code = self.exec(pod, command, crd.log_part(pod))
+        except Exception as e:
+            logger.warning(f"Worker {pod} failed running {crd.jobname}: {e}")
+            utils.append_file(f"\nWorker {pod} failed: {e}\n", crd.log_part(pod))
+            crd.state = cr.JobStatus.FAILED
+            self.record(crd, "finished")
+            return False
+        self.record(crd, "finished")
+        crd.state = cr.JobStatus.SUCCEEDED if code == 0 else cr.JobStatus.FAILED
+        return True
+
+    def exec(self, pod, command, filename):
+        """
+        Run a command in the worker pod, streaming output to file.
+        """
+        with open(filename, "w") as fd:
+            return self.api.exec(
+                self.settings.namespace, pod, "worker", ["/bin/bash", "-c", command], fd
+            )
+
+    def record(self, crd, event):
+        if self.timelines is not None:
+            self.timelines.record(crd.jobname, event)
+
+    def delete_worker(self, name):
+        try:
+            self.api.batch_v1.delete_namespaced_job(
+                name, self.settings.namespace, propagation_policy="Background"
+            )
+        except ApiException as e:
+            if e.status != 404:
+                logger.warning(f"Cannot delete worker {name}: {e}")
+        except Exception as e:
+            logger.warning(f"Cannot delete worker {name}: {e}")
+
+    def stop(self):
+        """
+        Stop taking jobs, and delete all workers and the config map.
+        """
+        self.stopped.set()
+        if self.configmap is None:
+            return
+        selector = ",".join(f"{k}={v}" for k, v in self.labels.items())
+        try:
+            self.api.batch_v1.delete_collection_namespaced_job(
+                self.settings.namespace,
+                label_selector=selector,
+                propagation_policy="Background",
+            )
+            self.api.core_v1.delete_collection_namespaced_config_map(
+                self.settings.namespace, label_selector=selector
+            )
+        except Exception as e:
+            logger.warning(f"Cannot delete workers: {e}")
@@ -0,0 +1,271 @@
+import threading
+import time
+
+from snakemake.logging import logger
+
+import snakemake_executor_plugin_kueue.utils as utils
+
+# Imports the Kubernetes client, which we don't need until we list workloads
+cr = utils.lazy_import("snakemake_executor_plugin_kueue.custom_resource")
+
+
+def workload_conditions(workload):
+    """
+    Get Workload conditions that are currently true.
+    """
+    conditions = (workload.get("status") or {}).get("conditions") or []
+    return {c["type"] for c in conditions if c.get("status") == "True"}
+
+
+def workload_condition(workload, kind):
+    """
+    Get a Workload condition by type, if it is true.
+    """
+    conditions = (workload.get("status") or {}).get("conditions") or []
+    for condition in conditions:
+        if condition.get("type") == kind and condition.get("status") == "True":
+            return condition
+
+
+def workload_state(workload):
+    """
+    Summarize Kueue's view of a workload: pending, admitted, evicted,
+    deactivated, or finished.
+
+    An evicted (e.g., preempted) workload goes back to the queue, and is
+    admitted again later. A deactivated one (by hand, or after too many
+    evictions) never is.
+    """
+    conditions = workload_conditions(workload)
+    if "Finished" in conditions:
+        return "finished"
+    if deactivated(workload):
+        return "deactivated"
+    if "Evicted" in conditions and evicted_since(workload):
+        return "evicted"
+    if "Admitted" in conditions or "QuotaReserved" in conditions:
+        return "admitted"
+    return "pending"
+
+
+def evicted_since(workload):
+    """
+    Was the workload evicted since it was last admitted?
+    """
+    evicted = workload_condition(workload, "Evicted") or {}
+    admitted = workload_condition(workload, "QuotaReserved") or {}
+    return str(evicted.get("lastTransitionTime") or "") >= str(
+        admitted.get("lastTransitionTime") or ""
+    )
+
+
+def deactivated(workload):
+    """
+    Was the workload deactivated (spec.active is false)?
+    """
+    if (workload.get("spec") or {}).get("active") is False:
+        return True
+    evicted = workload_condition(workload, "Evicted") or {}
+    return evicted.get("reason") == "InactiveWorkload"
+
+
+def deactivation_reason(workload):
+    """
+    Why a workload was deactivated, from its eviction if Kueue says.
+    """
+    evicted = workload_condition(workload or {}, "Evicted") or {}
+    if evicted.get("reason") == "InactiveWorkload" and evicted.get("message"):
+        return evicted["message"]
+    return "the Kueue workload was deactivated"
+
+
+def eviction_reason(workload):
+    """
+    Why a workload was evicted (e.g., Preempted, PodsReadyTimeout).
+    """
+    evicted = workload_condition(workload or {}, "Evicted") or {}
+    return evicted.get("reason") or "Evicted"
+
+
+class WorkloadTracker:
+    """
+    Track Kueue Workloads (and queue status) for the jobs we submit.
+
+    Kueue creates a Workload owned by each Job, so we can tell a job that
+    is waiting for quota from one that is running, and we can hold back
+    new submissions when the queue is already saturated.
+    """
+
+    group = "kueue.x-k8s.io"
+    version = "v1beta1"
+
+    def __init__(
+        self, api, namespace, queue_name, workflow_uid, max_pending=None, interval=10
+    ):
+        self.api = api
+        self.namespace = namespace
+        self.queue_name = queue_name
+        self.max_pending = max_pending
+        self.interval = interval
+
+        # Runs whose workloads we list (ours, and those we adopted jobs from)
+        self.workflow_uids = {workflow_uid}
+
+        # Workloads by the name of the owning job, and queue positions
+        self.workloads = {}
+        self.positions = {}
+
+        # Pending count from the queue, plus what we submitted since
+        self.pending = 0
+        self.pending_checked = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def track(self, workflow_uid):
+        """
+        Also list the workloads of an earlier run we adopted a job from.
+        """
+        with self.lock:
+            self.workflow_uids.add(workflow_uid)
+
+    def refresh(self):
+        """
+        List the workloads of our runs (one request per status check).
+
+        Kueue copies the workflow label of a job to its workload (if it is in
+        labelKeysToCopy), and queue positions are among our pending workloads.
+        """
+        with self.lock:
+            uids = ",".join(sorted(self.workflow_uids))
+        result = self.api.custom_objects.list_namespaced_custom_object(
+            group=self.group,
+            version=self.version,
+            namespace=self.namespace,
+            plural="workloads",
+            label_selector=f"{cr.workflow_label} in ({uids})",
+        )
+        workloads = {}
+        pending = []
+        for workload in result["items"]:
+            for owner in workload["metadata"].get("ownerReferences") or []:
+                workloads[owner["name"]] = workload
+            spec = workload.get("spec") or {}
+            if (
+                spec.get("queueName") == self.queue_name
+                and workload_state(workload) == "pending"
+            ):
+                pending.append(workload)
+
+        # Estimate queue position by priority, then first in first out
+        pending.sort(
+            key=lambda w: (
+                -((w.get("spec") or {}).get("priority") or 0),
+                w["metadata"]["creationTimestamp"],
+            )
+        )
+        positions = {w["metadata"]["name"]: i + 1 for i, w in enumerate(pending)}
+        with self.lock:
+            self.workloads = workloads
+            self.positions = positions
+
+    def get(self, jobname):
+        """
+        Get the workload for a job (as of the last refresh), if any.
+        """
+        with self.lock:
+            return self.workloads.get(jobname)
+
+    def admission(self, jobname):
+        """
+        Get the admission state and (if pending) queue position for a job.
+        """
+        with self.lock:
+            workload = self.workloads.get(jobname)
+            if workload is None:
+                return None, None
+            return (
+                workload_state(workload),
+                self.positions.get(workload["metadata"]["name"]),
+            )
+
+    def count_pending(self):
+        """
+        Pending workloads for our queue, from the ClusterQueue if we can
+        read it, otherwise the LocalQueue.
+        """
+        crd_api = self.api.custom_objects
+        local_queue = crd_api.get_namespaced_custom_object(
+            group=self.group,
+            version=self.version,
+            namespace=self.namespace,
+            plural="localqueues",
+            name=self.queue_name,
+        )
+        pending = (local_queue.get("status") or {}).get("pendingWorkloads") or 0
+        cluster_queue = (local_queue.get("spec") or {}).get("clusterQueue")
+        if not cluster_queue:
+            return pending
+        try:
+            cluster_queue = crd_api.get_cluster_custom_object(
+                group=self.group,
+                version=self.version,
+                plural="clusterqueues",
+                name=cluster_queue,
+            )
+        except Exception as e:
+            logger.debug(f"Cannot read ClusterQueue {cluster_queue}: {e}")
+            return pending
+        return max(
+            pending, (cluster_queue.get("status") or {}).get("pendingWorkloads") or 0
+        )
+
+    def release(self):
+        """
+        Give back a slot reserved by wait_for_capacity, the submission failed.
+        """
+        with self.lock:
+            self.pending = max(self.pending - 1, 0)
+
+    def stop(self):
+        """
+        Stop waiting for capacity, e.g., when the run is cancelled.
+        """
+        self.stopped.set()
+
+    def wait_for_capacity(self):
+        """
+        Block submission while too many workloads are pending, returning
+        False if the run was cancelled while we waited.
+
+        This is called from the submit pool, so the check and the slot it
+        reserves (counted toward pending until we next ask the queue) happen
+        under the lock, or several threads could see the same free slot.
+        Call release if the submission then fails.
+        """
+        waiting = False
+        while not self.stopped.is_set():
+            with self.lock:
+                stale = time.time() - self.pending_checked > self.interval
+                if stale and self.max_pending:
+                    self.pending_checked = time.time()
+            if stale and self.max_pending:
+                try:
+                    pending = self.count_pending()
+                except Exception as e:
+                    logger.debug(f"Cannot read LocalQueue {self.queue_name}: {e}")
+                    pending = 0
+                with self.lock:
+                    self.pending = pending
+            with self.lock:
+                if not self.max_pending or self.pending < self.max_pending:
+                    self.pending += 1
+                    return True
+                pending = self.pending
+            if not waiting:
+                logger.info(
+                    f"Holding back submissions, {pending} workloads are "
+                    f"pending in {self.queue_name}"
+                )
+                waiting = True
+            self.stopped.wait(self.interval)
+        return False
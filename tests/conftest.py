@@ -0,0 +1,202 @@
+"""
+The executor as Snakemake runs it, against the fake API server in benchmark/.
+
+Snakemake's workflow and jobs need a parsed Snakefile and a DAG, so they are
+stand-ins here, that decide what Snakemake decides before the executor exists
+(what jobs share, and whether the sources are archived for them).
+"""
+
+import os
+import sys
+import threading
+import time
+
+import pytest
+from snakemake_interface_executor_plugins.settings import SharedFSUsage
+from snakemake_interface_executor_plugins.utils import format_cli_arg, join_cli_args
+
+import snakemake_executor_plugin_kueue as plugin
+from snakemake_executor_plugin_kueue import ExecutorSettings
+from snakemake_executor_plugin_kueue.executor import KueueExecutor
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(here), "benchmark"))
+
+import fakeapi  # noqa: E402
+import loadtest  # noqa: E402
+
+Namespace = loadtest.Namespace
+
+
+class Job(loadtest.Job):
+    """
+    A Snakemake job, with what formatting its command needs.
+    """
+
+    is_local = False
+
+    def __init__(self, jobid, name="hello_world", input=(), **resources):
+        super().__init__(jobid, name)
+        self.input = list(input)
+        self.resources = dict(self.resources, **resources)
+
+    def get_target_spec(self):
+        return []
+
+    def __str__(self):
+        return f"{self.name}-{self.jobid}"
+
+
+class SpawnedJobArgs:
+    """
+    The arguments Snakemake gives spawned jobs.
+    """
+
+    def __init__(self, workflow):
+        self.workflow = workflow
+
+    def envvars(self):
+        return {}
+
+    def general_args(
+        self, pass_default_storage_provider_args=True, pass_default_resources_args=False
+    ):
+        usage = self.workflow.storage_settings.shared_fs_usage
+        storage = self.workflow.storage_settings
+        return join_cli_args(
+            [
+                "--force",
+                "--nocolor",
+                format_cli_arg(
+                    "--shared-fs-usage",
+                    sorted(item.item_to_choice() for item in usage) or "none",
+                ),
+                format_cli_arg(
+                    "--default-storage-provider",
+                    storage.default_storage_provider,
+                    skip=not pass_default_storage_provider_args,
+                ),
+            ]
+        )
+
+    def precommand(self, auto_deploy_default_storage_provider=True):
+        """
+        Jobs that don't share the sources unpack them from the archive.
+        """
+        if SharedFSUsage.SOURCES in self.workflow.storage_settings.shared_fs_usage:
+            return ""
+        archive = self.workflow.source_archive
+        return (
+            f"python -m snakemake --deploy-sources {archive.query} {archive.checksum}"
+        )
+
+
+class Workflow(loadtest.Workflow):
+    """
+    A workflow, set up like Snakemake sets it up for the executor plugin.
+    """
+
+    def __init__(self, settings, snakefile, shared_fs_usage=None):
+        super().__init__(settings, snakefile, loadtest.Scheduler(), 0.05)
+        common_settings = plugin.common_settings
+        self.executor_plugin = Namespace(common_settings=common_settings)
+
+        # Snakemake shares all by default, and nothing if the plugin implies so
+        if shared_fs_usage is None:
+            shared_fs_usage = SharedFSUsage.all()
+        if common_settings.implies_no_shared_fs:
+            shared_fs_usage = frozenset()
+        self.storage_settings = Namespace(
+            shared_fs_usage=frozenset(shared_fs_usage),
+            default_storage_provider="s3",
+            default_storage_prefix="s3://bucket",
+            local_storage_prefix=".snakemake/storage",
+        )
+
+        # And archives the sources (before the executor exists) if not shared
+        self._source_archive = None
+        if (
+            SharedFSUsage.SOURCES not in self.storage_settings.shared_fs_usage
+            and common_settings.job_deploy_sources
+        ):
+            self._source_archive = Namespace(
+                query="s3://bucket/sources.tar.xz", checksum="0123abcd"
+            )
+
+        self.spawned_job_args_factory = SpawnedJobArgs(self)
+        self.group_settings = Namespace(local_groupid="local")
+        self.resource_settings = Namespace(cores=1)
+        self.resource_scopes = Namespace(excluded=set())
+        self.remote_execution_settings.envvars = []
+        self.envvars = []
+
+    @property
+    def source_archive(self):
+        assert self._source_archive is not None
+        return self._source_archive
+
+
+@pytest.fixture
+def cluster():
+    """
+    The fake API server, with fast admission and jobs.
+    """
+    args = fakeapi.get_parser().parse_args(
+        ["--admission-delay", "0.05", "--runtime", "0.1", "--log-lines", "2"]
+    )
+    server = fakeapi.serve(args)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    cluster = server.RequestHandlerClass.cluster
+    cluster.port = server.server_address[1]
+    yield cluster
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_executor(cluster, tmp_path, monkeypatch):
+    """
+    Make executors against the fake cluster, in a fresh working directory.
+    """
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(".snakemake")
+    with open("kubeconfig", "w") as fd:
+        fd.write(loadtest.kubeconfig.format(port=cluster.port))
+    with open("Snakefile", "w") as fd:
+        fd.write("rule hello_world:\n    shell: 'echo hello'\n")
+
+    executors = []
+
+    def make(shared_fs_usage=None, **settings):
+        settings.setdefault("kubeconfig", str(tmp_path / "kubeconfig"))
+        workflow = Workflow(
+            ExecutorSettings(**settings),
+            str(tmp_path / "Snakefile"),
+            shared_fs_usage=shared_fs_usage,
+        )
+        executor = KueueExecutor(workflow, loadtest.Logger())
+        executors.append(executor)
+        return executor
+
+    yield make
+    for executor in executors:
+        if executor.wait:
+            executor.shutdown()
+
+
+@pytest.fixture
+def executor(make_executor):
+    return make_executor()
+
+
+def wait_for(check, timeout=10):
+    """
+    Wait until check() is true (and return it), or fail.
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        result = check()
+        if result:
+            return result
+        time.sleep(0.05)
+    raise AssertionError("timed out waiting for the cluster")
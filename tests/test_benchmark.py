@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+from .conftest import loadtest
+
+
+def run(cluster, tmp_path, monkeypatch, *options):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(".snakemake")
+    args = loadtest.get_parser().parse_args(
+        ["--jobs", "20", "--batch", "5", "--check-interval", "0.05"]
+        + ["--timeout", "60", *options]
+    )
+    return loadtest.run(args, str(tmp_path), cluster.port)
+
+
+@pytest.mark.parametrize("options", [[], ["--poll"], ["--pack-size", "5"]])
+def test_load_test(cluster, tmp_path, monkeypatch, options):
+    """
+    The load test runs its jobs through the executor and the fake cluster.
+    """
+    result = run(cluster, tmp_path, monkeypatch, *options)
+    assert result["finished"]
+    assert result["scheduler"].succeeded == 20
+    assert not result["errors"]
+    assert len(result["executor"].reported) == len(cluster.finished)
+
+
+def test_lost_responses_do_not_run_jobs_twice(cluster, tmp_path, monkeypatch):
+    """
+    A create whose response is lost went through, so the retry must not
+    run the job again.
+    """
+    cluster.args.lost_rate = 0.2
+    result = run(cluster, tmp_path, monkeypatch)
+    assert result["finished"]
+    assert result["scheduler"].succeeded == 20
+    assert len(cluster.finished) == 20
+    creates = cluster.requests["create jobs"] + cluster.requests["create configmaps"]
+    assert creates > 40
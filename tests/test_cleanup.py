@@ -0,0 +1,37 @@
+import types
+
+import snakemake_executor_plugin_kueue.custom_resource as cr
+from snakemake_executor_plugin_kueue.cleanup import CleanupQueue
+
+
+class FinishedJob:
+    """
+    A finished job that records the selectors it is deleted with.
+    """
+
+    selectors = []
+
+    def __init__(self, jobid, attempt):
+        self.settings = types.SimpleNamespace(namespace="default")
+        self.workflow_uid = "run"
+        self.jobid = str(jobid)
+        self.submission = f"{jobid}-{attempt}"
+        self.jobname = f"job-{jobid}"
+
+    @classmethod
+    def delete_batch(cls, api, namespace, crds, label_selector):
+        cls.selectors.append(label_selector)
+
+
+def test_flush_selects_submissions():
+    """
+    A retry keeps the job id, so cleanup of an attempt must not select it.
+    """
+    FinishedJob.selectors = []
+    queue = CleanupQueue(api=None, workflow_uid="run")
+    queue.put(FinishedJob(1, 1))
+    queue.put(FinishedJob(2, 3))
+    queue.flush()
+    assert FinishedJob.selectors == [
+        f"{cr.workflow_label}=run,{cr.submission_label} in (1-1,2-3)"
+    ]
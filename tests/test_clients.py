@@ -0,0 +1,48 @@
+import io
+
+from .conftest import Job, wait_for
+
+
+def test_exec_reuses_one_client(executor, cluster, monkeypatch):
+    """
+    Execs share one client of their own, closed with the others.
+    """
+    namespace = executor.executor_settings.namespace
+    cluster.create("pods", namespace, {"metadata": {"name": "worker"}})
+    cluster.exec_handler = lambda ns, pod, command: (3, " ".join(command))
+    api = executor.api
+
+    out = io.StringIO()
+    assert api.exec(namespace, "worker", "main", ["echo", "hi"], out) == 3
+    assert out.getvalue() == "echo hi"
+    exec_client = api.exec_client
+    assert exec_client is not api.api_client
+    assert api.exec(namespace, "worker", "main", ["true"], io.StringIO()) == 3
+    assert api.exec_client is exec_client
+
+    closed = []
+    monkeypatch.setattr(exec_client, "close", lambda: closed.append(True))
+    executor.shutdown()
+    assert closed
+
+
+def test_one_pool_for_all_requests(make_executor, cluster):
+    """
+    The executor and its jobs share one client, whose pool keeps the
+    connections open across requests.
+    """
+    executor = make_executor(submit_concurrency=4, io_concurrency=2)
+    api = executor.api
+    assert api.batch_v1.api_client is api.core_v1.api_client is api.api_client
+    assert api.api_client.configuration.connection_pool_maxsize == api.pool_size
+    assert api.pool_size == 4 + 2 + api.watches + api.spare
+
+    executor.run_jobs([Job(jobid) for jobid in range(20)])
+    wait_for(lambda: executor.workflow.scheduler.succeeded == 20)
+    assert cluster.connections <= api.pool_size
+    assert sum(cluster.requests.values()) > 5 * cluster.connections
+
+
+def test_pool_size(make_executor):
+    executor = make_executor(pool_size=5)
+    assert executor.api.api_client.configuration.connection_pool_maxsize == 5
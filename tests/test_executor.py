@@ -0,0 +1,54 @@
+import pytest
+from snakemake_interface_common.exceptions import WorkflowError
+from snakemake_interface_executor_plugins.settings import SharedFSUsage
+
+from snakemake_executor_plugin_kueue import common_settings
+
+from .conftest import Job
+
+
+def test_format_job_exec(executor):
+    command = executor.format_job_exec(Job(1))
+    assert "-m snakemake" in command
+    assert "--keep-storage-local-copies" not in command
+
+
+def test_format_job_exec_with_cache(make_executor):
+    executor = make_executor(cache_path="/var/cache/snakemake")
+    command = executor.format_job_exec(Job(1))
+    assert "-m snakemake" in command
+    assert "--keep-storage-local-copies" in command
+
+
+def test_format_job_exec_without_shared_fs(executor):
+    """
+    By default jobs share nothing, and unpack the archived sources.
+    """
+    assert common_settings.implies_no_shared_fs
+    command = executor.format_job_exec(Job(1))
+    assert "--deploy-sources s3://bucket/sources.tar.xz" in command
+    assert "--snakefile '/snakemake_workdir/Snakefile'" in command
+
+    # What Snakemake decided is left alone
+    assert executor.workflow.storage_settings.shared_fs_usage == frozenset()
+
+
+def test_shared_workdir_needs_environment(make_executor):
+    """
+    Snakemake has decided jobs share nothing when the setting is read.
+    """
+    with pytest.raises(WorkflowError, match="SNAKEMAKE_KUEUE_SHARED_WORKDIR"):
+        make_executor(shared_workdir="claim")
+
+
+def test_format_job_exec_with_shared_workdir(make_executor, monkeypatch):
+    """
+    With SNAKEMAKE_KUEUE_SHARED_WORKDIR at import, jobs share what Snakemake says.
+    """
+    monkeypatch.setattr(common_settings, "implies_no_shared_fs", False)
+    executor = make_executor(
+        shared_workdir="claim", shared_fs_usage=SharedFSUsage.all()
+    )
+    command = executor.format_job_exec(Job(1))
+    assert "--deploy-sources" not in command
+    assert f"--snakefile '{executor.workflow.main_snakefile}'" in command
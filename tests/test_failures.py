@@ -0,0 +1,82 @@
+import datetime
+
+from kubernetes import client
+
+from snakemake_executor_plugin_kueue import failures
+
+now = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def pod(name, reason=None, containers=None, conditions=None):
+    return client.V1Pod(
+        metadata=client.V1ObjectMeta(name=name),
+        status=client.V1PodStatus(
+            reason=reason, container_statuses=containers, conditions=conditions
+        ),
+    )
+
+
+def container(waiting=None, message=None, terminated=None):
+    state = client.V1ContainerState(
+        waiting=waiting
+        and client.V1ContainerStateWaiting(reason=waiting, message=message),
+        terminated=terminated
+        and client.V1ContainerStateTerminated(reason=terminated, exit_code=137),
+    )
+    return client.V1ContainerStatus(
+        name="main",
+        image="image",
+        image_id="",
+        ready=False,
+        restart_count=0,
+        state=state,
+    )
+
+
+def unschedulable(seconds):
+    return client.V1PodCondition(
+        type="PodScheduled",
+        status="False",
+        reason="Unschedulable",
+        message="0/3 nodes are available",
+        last_transition_time=now - datetime.timedelta(seconds=seconds),
+    )
+
+
+def test_healthy_pods_have_no_failure():
+    assert failures.classify([pod("a", containers=[container()])]) is None
+    assert failures.classify(None) is None
+
+
+def test_image_pull_failures():
+    failure = failures.classify(
+        [pod("a", containers=[container("ImagePullBackOff", "back-off")])]
+    )
+    assert (failure.reason, failure.retryable) == ("ImagePullBackOff", False)
+
+    # The kubelet retries a pull unless the image is not there
+    pulling = container("ErrImagePull", "connection reset")
+    assert failures.classify([pod("a", containers=[pulling])]) is None
+    missing = container("ErrImagePull", "manifest unknown")
+    assert failures.classify([pod("a", containers=[missing])]).reason == "ErrImagePull"
+
+
+def test_out_of_memory():
+    failure = failures.classify(
+        [pod("a", containers=[container(terminated="OOMKilled")])]
+    )
+    assert (failure.reason, failure.retryable) == ("OOMKilled", False)
+
+
+def test_permanent_failures_come_first():
+    evicted = pod("a", reason="Evicted")
+    oom = pod("b", containers=[container(terminated="OOMKilled")])
+    assert failures.classify([evicted]).retryable
+    assert failures.classify([evicted, oom]).pod == "b"
+
+
+def test_unschedulable_after_timeout():
+    stuck = pod("a", conditions=[unschedulable(600)])
+    assert failures.classify([stuck]) is None
+    assert failures.pod_failure(stuck, 300, now=now).reason == "Unschedulable"
+    assert failures.pod_failure(stuck, 900, now=now) is None
@@ -0,0 +1,56 @@
+import re
+
+import snakemake_executor_plugin_kueue.fluxsession as fluxsession
+
+from .conftest import Job, wait_for
+
+
+class Flux:
+    """
+    Flux in the lead broker, as the fake cluster runs exec in it.
+
+    The first submission fails (the exec errors), later jobs complete.
+    """
+
+    def __init__(self):
+        self.submissions = 0
+        self.jobs = {}
+
+    def __call__(self, ns, pod, command):
+        script = command[-1]
+        if script.endswith("flux uptime"):
+            return 0, ""
+        if "flux jobs" in script:
+            return 0, "".join(f"{fluxid} COMPLETED\n" for fluxid in self.jobs)
+        if "flux job attach" in script:
+            return 0, "hello\n"
+        names = re.findall(r"echo (\S+) \$\(flux submit", script)
+        self.submissions += 1
+        if self.submissions == 1:
+            raise RuntimeError("connection reset")
+        lines = []
+        for name in names:
+            fluxid = f"f{len(self.jobs)}"
+            self.jobs[fluxid] = name
+            lines.append(f"{name} {fluxid}\n")
+        return 0, "".join(lines)
+
+
+def test_failed_batch_does_not_stop_the_session(make_executor, cluster, monkeypatch):
+    """
+    An exec that fails fails its batch, and the session takes the next one.
+    """
+    monkeypatch.setattr(fluxsession.FluxSession, "poll_interval", 0.05)
+    cluster.args.runtime = 60
+    cluster.exec_handler = flux = Flux()
+    executor = make_executor(flux_session=True)
+    scheduler = executor.workflow.scheduler
+
+    executor.run_jobs([Job(1, kueue_operator="flux-operator")])
+    wait_for(lambda: scheduler.failed == 1)
+    executor.run_jobs([Job(2, kueue_operator="flux-operator")])
+    wait_for(lambda: scheduler.succeeded == 1)
+
+    assert flux.submissions == 2
+    assert list(flux.jobs) == ["f0"]
+    assert executor.flux_session.error is None
@@ -0,0 +1,32 @@
+import subprocess
+import sys
+
+import pytest
+
+from snakemake_executor_plugin_kueue import ExecutorSettings
+
+
+def test_plugin_import_does_not_load_kubernetes():
+    """
+    --help, dry runs, and plugin scans import the plugin, but don't talk
+    to a cluster.
+    """
+    code = (
+        "import sys, snakemake_executor_plugin_kueue; "
+        "print('kubernetes' in sys.modules)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "False"
+
+
+def test_kubeconfig_is_loaded_on_first_use(tmp_path):
+    from kubernetes.config import ConfigException
+
+    import snakemake_executor_plugin_kueue.clients as clients
+
+    api = clients.ClientManager(ExecutorSettings(kubeconfig=str(tmp_path / "none")))
+    assert api._api_client is None
+    with pytest.raises(ConfigException):
+        api.core_v1
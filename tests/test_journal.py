@@ -0,0 +1,137 @@
+import pytest
+from kubernetes.client.rest import ApiException
+
+import snakemake_executor_plugin_kueue.custom_resource as cr
+import snakemake_executor_plugin_kueue.journal as journal
+
+from .conftest import Job, wait_for
+
+# The status of each job from the earlier run (None if it is gone)
+jobs = {
+    "running": {"active": 1},
+    "done": {"succeeded": 1},
+    "failed": {"failed": 1},
+    "gone": None,
+    "unreachable": {"active": 1},
+}
+
+
+def submit(log, name):
+    log.submitted(
+        jobid="1",
+        name=name,
+        namespace="default",
+        operator="job",
+        spec_hash=name,
+        workflow_uid="old",
+    )
+
+
+@pytest.fixture
+def filename(tmp_path):
+    return str(tmp_path / ".snakemake" / "journal.jsonl")
+
+
+def test_journal_keeps_unfinished_jobs(filename):
+    log = journal.SubmissionJournal(filename)
+    submit(log, "running")
+    submit(log, "done")
+    log.finished("done")
+
+    # A line cut short when the head process died
+    log.fd.write('{"event": "subm')
+    log.fd.flush()
+
+    log = journal.SubmissionJournal(filename)
+    assert sorted(log.previous) == ["running"]
+    assert log.adopt("running")["name"] == "running"
+    assert log.adopt("running") is None
+
+    # Jobs from earlier runs that this run did not adopt are finished
+    log = journal.SubmissionJournal(filename)
+    log.close()
+    assert journal.SubmissionJournal(filename).previous == {}
+
+
+def test_adopt(make_executor, cluster):
+    """
+    Jobs of an earlier run are adopted if they are running or succeeded.
+    """
+    log = journal.SubmissionJournal(".snakemake/kueue_journal.jsonl")
+    for name, status in jobs.items():
+        submit(log, name)
+        if status is None:
+            continue
+        with cluster.lock:
+            cluster.put(
+                "jobs",
+                "default",
+                {
+                    "metadata": {
+                        "name": name,
+                        "namespace": "default",
+                        "labels": {cr.workflow_label: "old", cr.submission_label: "1"},
+                    },
+                    "spec": {"completions": 1, "template": {}},
+                    "status": status,
+                },
+            )
+    log.close()
+    executor = make_executor()
+    submitted = executor.workflow.scheduler.submitted
+
+    def adopt(jobid, name):
+        job = Job(jobid)
+        crd = cr.BatchJob(
+            job,
+            executor.get_original_snakefile(),
+            executor.executor_settings,
+            workflow_uid=executor.workflow_uid,
+            api=executor.api,
+        )
+        return executor.adopt(job, crd, name, "log")
+
+    assert adopt(1, "running")
+    assert adopt(2, "done")
+    assert submitted == {1, 2}
+
+    # A failed job is cleaned up and submitted again, a missing one just again
+    assert not adopt(3, "failed")
+    assert not adopt(4, "gone")
+    assert submitted == {1, 2}
+    wait_for(lambda: ("default", "failed") not in cluster.objects["jobs"])
+
+    # We can't tell if it is still there, so it must not run twice
+    cluster.args.error_rate = 1
+    with pytest.raises(ApiException):
+        adopt(5, "unreachable")
+
+
+def test_changed_snakefile_is_not_adopted(make_executor, cluster):
+    """
+    A job still running from an earlier run is only adopted if its spec
+    (here, the Snakefile in its config map) is the same.
+    """
+    cluster.args.runtime = 60
+
+    # The workflow uid comes from the address of the workflow, so earlier
+    # runs are kept alive to give each run its own
+    runs = []
+
+    def run():
+        executor = make_executor()
+        runs.append(executor)
+        executor.run_jobs([Job(1)])
+        wait_for(lambda: executor.workflow.scheduler.submitted)
+        return executor
+
+    run().shutdown()
+    with open("Snakefile", "a") as fd:
+        fd.write("\nrule other:\n    shell: 'echo other'\n")
+    run().shutdown()
+    assert cluster.requests["create jobs"] == 2
+
+    # The same Snakefile again adopts the last one
+    run()
+    assert cluster.requests["create jobs"] == 2
+    assert len(cluster.objects["jobs"]) == 2
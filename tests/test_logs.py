@@ -0,0 +1,96 @@
+import asyncio
+import threading
+import time
+import types
+
+from snakemake_interface_executor_plugins.executors.base import SubmittedJobInfo
+
+import snakemake_executor_plugin_kueue.custom_resource as cr
+from snakemake_executor_plugin_kueue import logs
+
+from .conftest import Job
+
+
+class Response:
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, size):
+        yield self.body
+
+    def release_conn(self):
+        pass
+
+
+class CoreApi:
+    """
+    A pod log that the server ends twice before the container stops.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.bodies = [
+            b"2024-01-01T00:00:01.000000000Z one\n",
+            b"2024-01-01T00:00:01.000000000Z one\n"
+            b"2024-01-01T00:00:02.000000000Z two\n",
+            b"2024-01-01T00:00:03.000000000Z three\n",
+        ]
+
+    def read_namespaced_pod_log(self, **kwargs):
+        self.requests.append(kwargs)
+        return Response(self.bodies[len(self.requests) - 1])
+
+    def read_namespaced_pod(self, name, namespace):
+        running = len(self.requests) < len(self.bodies)
+        state = types.SimpleNamespace(terminated=None if running else object())
+        return types.SimpleNamespace(
+            status=types.SimpleNamespace(
+                phase="Running",
+                container_statuses=[types.SimpleNamespace(name="main", state=state)],
+            )
+        )
+
+
+class Stopped(threading.Event):
+    """
+    Reconnect without waiting.
+    """
+
+    def wait(self, timeout=None):
+        return self.is_set()
+
+
+def test_follower_reconnects_until_the_container_stops(tmp_path):
+    api = CoreApi()
+    filename = tmp_path / "pod.log"
+    follower = logs.LogFollower(api, "default", "pod", "main", str(filename))
+    follower.stopped = Stopped()
+    follower.start().join(5)
+
+    assert filename.read_bytes() == b"one\ntwo\nthree\n"
+    assert len(api.requests) == 3
+    assert api.requests[0]["since_seconds"] is None
+    assert api.requests[1]["since_seconds"] >= 1
+
+
+def test_fetch_log_does_not_wait_after_the_last_attempt(executor, cluster):
+    """
+    A log that can't be written is retried, but not waited for once more.
+    """
+    executor.log_retry_delay = 0.5
+    job = Job(1)
+    crd = cr.BatchJob(
+        job,
+        executor.get_original_snakefile(),
+        executor.executor_settings,
+        workflow_uid=executor.workflow_uid,
+        api=executor.api,
+    )
+    j = SubmittedJobInfo(
+        job, external_jobid=crd.jobname, aux={"crd": crd, "kueue_logfile": "log"}
+    )
+    cluster.args.error_rate = 1
+    start = time.monotonic()
+    assert asyncio.run(executor.fetch_log(j, retries=2)) is None
+    assert 0.5 <= time.monotonic() - start < 1
+    assert cluster.requests["list pods"] == 2
@@ -0,0 +1,54 @@
+import csv
+import json
+
+from snakemake_executor_plugin_kueue import metrics
+
+from .conftest import Job, wait_for
+
+
+def test_timelines_and_latencies(make_executor, cluster):
+    """
+    Each job gets a timeline in event order, and each request its endpoint.
+    """
+    executor = make_executor(metrics_file="metrics.json")
+    executor.run_jobs([Job(jobid) for jobid in range(3)])
+    wait_for(lambda: executor.workflow.scheduler.succeeded == 3)
+    executor.shutdown()
+
+    with open("metrics.json") as fd:
+        exported = json.load(fd)
+    assert len(exported["jobs"]) == 3
+    for timeline in exported["jobs"].values():
+        seen = [event for event in metrics.events if event in timeline]
+        assert seen[:2] == ["submitted", "admitted"]
+        assert "reported" in seen
+        times = [timeline[event] for event in ["submitted", "reported"]]
+        assert times == sorted(times)
+
+    creates = [
+        endpoint
+        for endpoint in exported["api"]
+        if endpoint["method"] == "POST" and endpoint["path"].endswith("/jobs")
+    ]
+    assert [endpoint["count"] for endpoint in creates] == [3]
+    assert sum(creates[0]["buckets"].values()) == 3
+
+    text = metrics.prometheus(executor.timelines, executor.api.latencies)
+    assert 'le="+Inf"} 3' in text
+    assert 'snakemake_kueue_job_phase_duration_seconds_count{phase="running"} 3' in text
+
+
+def test_export_csv(tmp_path):
+    timelines = metrics.Timelines()
+    timelines.record("job", "submitted", 1)
+    timelines.record("job", "submitted", 2)
+    latencies = metrics.Latencies()
+    latencies.observe("GET", "/api/v1/pods", 0.02, 500)
+    metrics.export(str(tmp_path / "metrics.csv"), timelines, latencies)
+
+    with open(tmp_path / "metrics.csv") as fd:
+        rows = list(csv.reader(fd))
+    assert rows[1][:2] == ["job", "1"]
+    with open(tmp_path / "metrics-api.csv") as fd:
+        rows = list(csv.reader(fd))
+    assert rows[1] == ["GET", "/api/v1/pods", "1", "0.02", "0.02", "1"]
@@ -0,0 +1,84 @@
+import os
+import subprocess
+import sys
+
+from snakemake_executor_plugin_kueue import inputcache
+
+from .conftest import Job, Namespace, wait_for
+
+
+class StorageFile(str):
+    """
+    A storage input, as Snakemake gives it to the job.
+    """
+
+    is_storage = True
+
+    def __new__(cls, query, local_path):
+        path = super().__new__(cls, local_path)
+        path.storage_object = Namespace(query=query, local_path=lambda: local_path)
+        return path
+
+
+def pod(directory, cache, action, *args):
+    """
+    Run the cache script as a job pod would, in its working directory.
+    """
+    return subprocess.run(
+        [sys.executable, inputcache.script, action, cache, "cache-inputs", *args],
+        cwd=directory,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+
+
+def test_pods_on_a_node_share_inputs(tmp_path):
+    """
+    An input one pod downloaded is restored (not downloaded) by the next.
+    """
+    cache = str(tmp_path / "cache")
+    local = ".snakemake/storage/s3/bucket/reads.fq"
+    job = Job(1, input=[StorageFile("s3://bucket/reads.fq", local), "local.txt"])
+    storage = Namespace(local_storage_prefix=".snakemake/storage")
+    manifest = inputcache.manifest(job, storage)
+    assert manifest == f"s3://bucket/reads.fq\t{local}\n"
+
+    first, second, third = tmp_path / "first", tmp_path / "second", tmp_path / "third"
+    for directory in [first, second, third]:
+        directory.mkdir()
+        (directory / "cache-inputs").write_text(manifest)
+
+    assert "Input cache miss" in pod(first, cache, "restore")
+    os.makedirs(first / os.path.dirname(local))
+    (first / local).write_text("ACGT\n")
+    assert "Input cache saved" in pod(first, cache, "save")
+
+    assert "Input cache hit" in pod(second, cache, "restore")
+    assert (second / local).read_text() == "ACGT\n"
+    assert os.stat(second / local).st_mtime == os.stat(first / local).st_mtime
+    assert "saved" not in pod(second, cache, "save")
+
+    # Over the size limit, the least recently used object goes
+    assert "evicted" in pod(second, cache, "save", "--size", "1")
+    assert "Input cache miss" in pod(third, cache, "restore")
+
+
+def test_jobs_ship_the_cache_script(make_executor, cluster):
+    """
+    The script and the manifest go in the config map, around the command.
+    """
+    cluster.args.runtime = 60
+    executor = make_executor(cache_path="/var/cache/snakemake")
+    executor.run_jobs([Job(1)])
+    wait_for(lambda: executor.workflow.scheduler.submitted)
+
+    (configmap,) = cluster.objects["configmaps"].values()
+    assert configmap["data"]["nodecache.py"] == open(inputcache.script).read()
+    assert configmap["data"]["cache-inputs"] == ""
+    (job,) = cluster.objects["jobs"].values()
+    spec = job["spec"]["template"]["spec"]
+    command = spec["containers"][0]["args"][-1]
+    assert command.startswith("python3 /snakemake_workdir/nodecache.py restore")
+    volume = spec["volumes"][-1]
+    assert volume["hostPath"]["path"] == "/var/cache/snakemake"
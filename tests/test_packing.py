@@ -0,0 +1,28 @@
+from .conftest import Job, wait_for
+
+
+def test_packed_jobs_succeed(make_executor, cluster):
+    """
+    Jobs of the same rule and resources run as indexes of one Indexed Job.
+    """
+    executor = make_executor(pack_size=3, pack_window=0.1)
+    scheduler = executor.workflow.scheduler
+    executor.run_jobs([Job(jobid) for jobid in range(3)])
+    wait_for(lambda: scheduler.succeeded == 3)
+    assert cluster.requests["create jobs"] == 1
+
+
+def test_cancel_packed_jobs(make_executor, cluster):
+    """
+    Cancelling deletes the Indexed Job (and its config map) of the packed jobs.
+    """
+    cluster.args.runtime = 60
+    executor = make_executor(pack_size=2, pack_window=0.1)
+    executor.run_jobs([Job(jobid) for jobid in range(4)])
+    wait_for(lambda: len(executor.active_jobs) == 4)
+    assert len(cluster.objects["jobs"]) == 2
+
+    executor.cancel()
+    assert not cluster.objects["jobs"]
+    assert not cluster.objects["configmaps"]
+    assert cluster.requests["deletecollection jobs"] == 1
@@ -0,0 +1,40 @@
+from snakemake_executor_plugin_kueue import prepull
+
+from .conftest import Job, wait_for
+
+image = "registry.example.com/tools/align@sha256:0123abcd"
+
+
+def test_parse_and_pin():
+    assert prepull.parse_image("ubuntu") == (
+        "registry-1.docker.io",
+        "library/ubuntu",
+        "latest",
+    )
+    assert prepull.parse_image("localhost:5000/tools/align:1.0") == (
+        "localhost:5000",
+        "tools/align",
+        "1.0",
+    )
+    assert prepull.pin("ubuntu:22.04", "sha256:0123") == "ubuntu@sha256:0123"
+
+
+def test_prepulled_images_need_no_shell(make_executor, cluster):
+    """
+    The DaemonSet pulls each image with an init container that runs a
+    static true, so images without /bin/sh are pulled too.
+    """
+    executor = make_executor(prepull=True, container=image)
+    executor.run_jobs([Job(1)])
+    wait_for(lambda: executor.workflow.scheduler.succeeded == 1)
+
+    name = executor.prepuller.name
+    daemonset = cluster.objects["daemonsets"][("default", name)]
+    init = daemonset["spec"]["template"]["spec"]["initContainers"]
+    assert [c["image"] for c in init] == [prepull.ImagePrepuller.true_image, image]
+    assert init[0]["command"] == ["/bin/cp", "/bin/busybox", "/snakemake_prepull/true"]
+    assert init[1]["command"] == ["/snakemake_prepull/true"]
+    assert all(c["volumeMounts"][0]["name"] == "true" for c in init)
+
+    executor.shutdown()
+    assert ("default", name) not in cluster.objects["daemonsets"]
@@ -0,0 +1,61 @@
+import types
+
+import pytest
+
+from snakemake_executor_plugin_kueue import priority
+
+
+class Job:
+    def __init__(self, name, priority=0, resources=None):
+        self.name = name
+        self.priority = priority
+        self.resources = resources or {}
+
+    def is_group(self):
+        return False
+
+
+def dag(edges):
+    """
+    A DAG where each job has the jobs that depend on it.
+    """
+    return types.SimpleNamespace(depending=edges, needrun=lambda job: True)
+
+
+def test_parse_classes():
+    assert priority.parse_classes("low=0,high=5, mid=2") == [
+        (5, "high"),
+        (2, "mid"),
+        (0, "low"),
+    ]
+    assert priority.parse_classes(None) == []
+    with pytest.raises(ValueError):
+        priority.parse_classes("high=x")
+
+
+def test_length():
+    a, b, c, d = Job("a"), Job("b"), Job("c"), Job("d")
+    path = priority.CriticalPath(dag({a: {b: None, c: None}, b: {d: None}}))
+    assert [path.length(job) for job in [a, b, c, d]] == [3, 2, 1, 1]
+
+
+def test_assign():
+    a, b, c = Job("a"), Job("b"), Job("c")
+    classes = priority.parse_classes("high=3,mid=2,low=0")
+    path = priority.CriticalPath(dag({a: {b: None}, b: {c: None}}), classes)
+    assert path.assign([c]) == "low"
+    assert path.assign([b]) == "mid"
+    assert path.assign([c, a]) == "high"
+    assert path.assign([Job("urgent", priority=1)]) == "high"
+    assert path.assign([Job("asks", resources={"kueue_priority_class": "mid"})]) == (
+        "mid"
+    )
+
+
+def test_assign_ranks_unknown_classes_last():
+    classes = priority.parse_classes("high=3,low=0")
+    path = priority.CriticalPath(dag({}), classes)
+    other = Job("other", resources={"kueue_priority_class": "other"})
+    assert path.assign([other, Job("leaf")]) == "low"
+    assert path.assign([other]) == "other"
+    assert priority.CriticalPath(dag({})).assign([Job("leaf")]) is None
@@ -0,0 +1,60 @@
+import threading
+import time
+
+from snakemake_executor_plugin_kueue import ratelimit
+
+
+def test_request_lanes():
+    assert ratelimit.request_lane("/api/v1/namespaces/a/pods", "GET") == "status"
+    assert ratelimit.request_lane("/api/v1/namespaces/a/pods/b/log", "GET") == "logs"
+    assert (
+        ratelimit.request_lane("/apis/batch/v1/namespaces/a/jobs", "POST") == "submit"
+    )
+    assert ratelimit.request_lane("/apis/batch/v1/namespaces/a/jobs", "DELETE") == (
+        "cleanup"
+    )
+
+
+def test_retry_after():
+    error = type("Error", (), {"headers": {"Retry-After": "3"}})()
+    assert ratelimit.retry_after(error, 0) == 3
+    assert ratelimit.retry_after(None, 2) == 4
+    assert ratelimit.retry_after(None, 10) == 30
+
+
+def test_bucket_limits_rate():
+    limiter = ratelimit.RateLimiter(qps=20, burst=2)
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.acquire()
+
+    # Two from the burst, then one every 50ms
+    assert time.monotonic() - start >= 0.19
+    assert limiter.stats["status"]["requests"] == 6
+
+
+def test_lanes_go_in_priority_order():
+    limiter = ratelimit.RateLimiter(qps=10, burst=1)
+    limiter.acquire()
+    order = []
+
+    def request(lane):
+        limiter.acquire(lane)
+        order.append(lane)
+
+    threads = []
+    for lane in ["cleanup", "logs", "submit"]:
+        threads.append(threading.Thread(target=request, args=[lane]))
+        threads[-1].start()
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+    assert order == ["submit", "cleanup", "logs"]
+
+
+def test_pause_holds_back_every_lane():
+    limiter = ratelimit.RateLimiter()
+    limiter.pause(0.2)
+    start = time.monotonic()
+    limiter.acquire("submit")
+    assert time.monotonic() - start >= 0.19
@@ -0,0 +1,54 @@
+from kubernetes import client
+
+import snakemake_executor_plugin_kueue.custom_resource as cr
+
+from .conftest import Job, wait_for
+
+
+def test_sharded_job(make_executor, cluster):
+    """
+    A sharded job is one Indexed Job with a pod per shard, never packed.
+    """
+    cluster.args.runtime = 60
+    executor = make_executor(pack_size=3, pack_window=0.1)
+    executor.run_jobs([Job(1), Job(2, kueue_shards=3), Job(3, kueue_shards=3)])
+    wait_for(lambda: len(executor.workflow.scheduler.submitted) == 3)
+    assert cluster.requests["create jobs"] == 3
+
+    jobs = sorted(
+        cluster.objects["jobs"].values(), key=lambda job: job["spec"]["completions"]
+    )
+    specs = [job["spec"] for job in jobs]
+    assert [(spec["parallelism"], spec["completions"]) for spec in specs] == [
+        (1, 1),
+        (3, 3),
+        (3, 3),
+    ]
+    assert "completionMode" not in specs[0]
+    assert specs[1]["completionMode"] == "Indexed"
+    env = specs[1]["template"]["spec"]["containers"][0]["env"]
+    assert {"name": "SNAKEMAKE_KUEUE_SHARDS", "value": "3"} in env
+    wait_for(lambda: len(cluster.objects["pods"]) == 7)
+
+
+def test_sharded_job_succeeds_with_every_shard(executor):
+    crd = cr.BatchJob(
+        Job(1, kueue_shards=3),
+        executor.get_original_snakefile(),
+        executor.executor_settings,
+        workflow_uid=executor.workflow_uid,
+        api=executor.api,
+    )
+
+    def status(**counts):
+        return crd.status(
+            client.V1Job(
+                spec=client.V1JobSpec(completions=3, template={}),
+                status=client.V1JobStatus(**counts),
+            )
+        )
+
+    assert status(succeeded=2) == cr.JobStatus.UNKNOWN
+    assert status(succeeded=2, active=1) == cr.JobStatus.ACTIVE
+    assert status(succeeded=3) == cr.JobStatus.SUCCEEDED
+    assert status(succeeded=2, failed=1) == cr.JobStatus.FAILED
@@ -0,0 +1,75 @@
+import json
+
+from kubernetes import client
+
+from snakemake_executor_plugin_kueue import sizing
+
+from .conftest import Job, wait_for
+
+
+def requests(cluster):
+    return {
+        job["metadata"]["labels"]["snakemake-kueue/jobid"]: job["spec"]["template"][
+            "spec"
+        ]["containers"][0]["resources"]["requests"]
+        for job in cluster.objects["jobs"].values()
+    }
+
+
+def test_requests_follow_past_usage(make_executor, cluster):
+    """
+    Peak usage of the jobs of a rule sizes its later jobs.
+    """
+    cluster.args.runtime = 0.3
+    executor = make_executor(rightsize="apply", rightsize_headroom=20)
+    executor.run_jobs([Job(jobid, _cores=2) for jobid in range(3)])
+    wait_for(lambda: executor.workflow.scheduler.succeeded == 3)
+    executor.shutdown()
+    with open(".snakemake/kueue_resources.json") as fd:
+        history = json.load(fd)["hello_world"]
+    assert history == {"cpu": [0.25] * 3, "memory": [100 * 2**20] * 3}
+
+    # CPU is lowered, memory only replaced where the rule doesn't set it
+    cluster.args.runtime = 60
+    executor = make_executor(rightsize="apply", rightsize_headroom=20)
+    executor.run_jobs([Job(3, _cores=2, kueue_memory=None), Job(4, _cores=2)])
+    wait_for(lambda: len(executor.workflow.scheduler.submitted) == 2)
+    assert requests(cluster) == {
+        "3": {"cpu": "300m", "memory": "120Mi"},
+        "4": {"cpu": "300m", "memory": "200Mi"},
+    }
+
+
+def test_suggest_does_not_change_requests(make_executor, cluster):
+    with open(".snakemake/kueue_resources.json", "w") as fd:
+        json.dump({"hello_world": {"cpu": [0.25] * 3, "memory": [2**20] * 3}}, fd)
+    cluster.args.runtime = 60
+    executor = make_executor(rightsize="suggest")
+    executor.run_jobs([Job(1)])
+    wait_for(lambda: executor.workflow.scheduler.submitted)
+    assert requests(cluster) == {"1": {"cpu": 1, "memory": "200Mi"}}
+
+
+def test_retry_after_oom_gets_twice_the_memory(tmp_path):
+    history = sizing.ResourceHistory(str(tmp_path / "history.json"))
+    job = Job(1)
+    assert history.requests(job, 1, "200Mi") == (1, "200Mi")
+
+    terminated = client.V1ContainerStateTerminated(exit_code=137, reason="OOMKilled")
+    pod = client.V1Pod(
+        status=client.V1PodStatus(
+            container_statuses=[
+                client.V1ContainerStatus(
+                    name="main",
+                    image="image",
+                    image_id="",
+                    ready=False,
+                    restart_count=0,
+                    state=client.V1ContainerState(terminated=terminated),
+                )
+            ]
+        )
+    )
+    assert sizing.oom_killed([pod])
+    history.oom(job)
+    assert history.requests(job, 1, "200Mi") == (1, "400Mi")
@@ -0,0 +1,25 @@
+from .conftest import Job, wait_for
+
+
+def test_one_list_per_status_check(make_executor, cluster):
+    """
+    Without the watch, each status check lists the jobs (and pods) of the
+    run once, instead of reading every active job.
+    """
+    cluster.args.runtime = 0.3
+    executor = make_executor(watch=False)
+    checks = []
+    status_snapshots = executor.status_snapshots
+
+    def count(active_jobs):
+        checks.append(len(active_jobs))
+        return status_snapshots(active_jobs)
+
+    executor.status_snapshots = count
+    executor.run_jobs([Job(jobid) for jobid in range(8)])
+    wait_for(lambda: executor.workflow.scheduler.succeeded == 8)
+
+    assert max(checks) > 1
+    assert cluster.requests["list jobs"] == len(checks)
+    assert cluster.requests["list pods"] == len(checks)
+    assert not cluster.requests["get jobs"]
@@ -0,0 +1,64 @@
+import snakemake_executor_plugin_kueue.custom_resource as cr
+
+from .conftest import Job, wait_for
+
+
+def batch_job(executor, job):
+    return cr.BatchJob(
+        job,
+        executor.get_original_snakefile(),
+        executor.executor_settings,
+        workflow_uid=executor.workflow_uid,
+        api=executor.api,
+    )
+
+
+def put_configmap(cluster, name, labels):
+    with cluster.lock:
+        cluster.put(
+            "configmaps",
+            "default",
+            {
+                "metadata": {"name": name, "namespace": "default", "labels": labels},
+                "data": {"snakefile": "stale"},
+            },
+        )
+
+
+def test_concurrent_submissions(make_executor, cluster):
+    """
+    Jobs submitted from the pool each run once.
+    """
+    executor = make_executor(submit_concurrency=8)
+    scheduler = executor.workflow.scheduler
+    executor.run_jobs([Job(jobid) for jobid in range(20)])
+    wait_for(lambda: scheduler.succeeded == 20)
+    assert cluster.requests["create jobs"] == 20
+    assert cluster.requests["create configmaps"] == 20
+
+
+def test_retry_replaces_its_own_configmap(executor, cluster):
+    """
+    A config map left by an earlier attempt of the submission is replaced.
+    """
+    crd = batch_job(executor, Job(1))
+    put_configmap(cluster, crd.snakefile_configmap, crd.run_labels)
+    executor.run_jobs([Job(1)])
+    wait_for(lambda: executor.workflow.scheduler.submitted)
+    assert cluster.requests["update configmaps"] == 1
+    configmap = cluster.objects["configmaps"][("default", crd.snakefile_configmap)]
+    assert configmap["data"] == crd.configmap_data()
+    wait_for(lambda: executor.workflow.scheduler.succeeded == 1)
+
+
+def test_retry_keeps_other_configmaps(executor, cluster):
+    """
+    A config map of the same name from someone else is not replaced.
+    """
+    crd = batch_job(executor, Job(1))
+    put_configmap(cluster, crd.snakefile_configmap, {cr.workflow_label: "other"})
+    executor.run_jobs([Job(1)])
+    wait_for(lambda: executor.workflow.scheduler.failed == 1)
+    configmap = cluster.objects["configmaps"][("default", crd.snakefile_configmap)]
+    assert configmap["data"] == {"snakefile": "stale"}
+    assert not cluster.requests["create jobs"]
@@ -0,0 +1,41 @@
+import pytest
+
+import snakemake_executor_plugin_kueue.custom_resource as cr
+
+from .conftest import Job
+
+
+@pytest.mark.parametrize("shards", [1, 2])
+def test_cached_spec_is_the_full_spec(make_executor, shards):
+    """
+    A job generated from the cached template of its rule gets the same
+    spec as one built from scratch.
+    """
+    executor = make_executor(cache_path="/var/cache", checkpoint_claim="checkpoints")
+    environment = {"SNAKEMAKE_KUEUE": "1"}
+
+    def generate(job, build=False):
+        crd = cr.BatchJob(
+            job,
+            executor.get_original_snakefile(),
+            executor.executor_settings,
+            workflow_uid=executor.workflow_uid,
+            api=executor.api,
+            templates=executor.spec_templates,
+            priority_class=f"class-{job.jobid}",
+        )
+        command = executor.use_input_cache(crd, job, f"echo {job.jobid}")
+        args = ["-c", command]
+        if build:
+            spec = crd.build("image", "/bin/bash", args, environment=environment)
+            return executor.api.api_client.sanitize_for_serialization(spec)
+        return crd.generate("image", "/bin/bash", args, environment=environment)
+
+    generate(Job(1, kueue_shards=shards))
+    assert len(executor.spec_templates) == 1
+    for job in [
+        Job(2, kueue_shards=shards),
+        Job(3, kueue_shards=shards, kueue_memory="1Gi", _cores=4),
+    ]:
+        assert generate(job) == generate(job, build=True)
+    assert len(executor.spec_templates) == 1
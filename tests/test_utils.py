@@ -0,0 +1,8 @@
+from snakemake_executor_plugin_kueue import utils
+
+
+def test_parse_indexes():
+    assert utils.parse_indexes("1,3-5,7") == {1, 3, 4, 5, 7}
+    assert utils.parse_indexes("0") == {0}
+    assert utils.parse_indexes("") == set()
+    assert utils.parse_indexes(None) == set()
@@ -0,0 +1,70 @@
+import threading
+import time
+
+from snakemake_executor_plugin_kueue.watcher import ResourceWatch
+
+
+def minicluster(name):
+    return {"metadata": {"name": name}}
+
+
+def listing(*names):
+    return lambda **kwargs: {
+        "metadata": {"resourceVersion": "1"},
+        "items": [minicluster(name) for name in names],
+    }
+
+
+def test_watch_remembers_deleted_objects():
+    watch = ResourceWatch("miniclusters", listing("a", "b"), "", keep_deleted=True)
+    watch.relist()
+    watch.handle({"type": "DELETED", "object": minicluster("a")})
+    assert watch.was_deleted("a")
+
+    # Not seen yet is not deleted (the watch may lag behind a create)
+    assert not watch.was_deleted("c")
+
+    # Deleted while the watch was down
+    watch.list_func = listing()
+    watch.relist()
+    assert watch.was_deleted("b")
+
+
+def test_watch_forgets_deleted_objects_by_default():
+    watch = ResourceWatch("pods", listing("a"), "")
+    watch.relist()
+    watch.handle({"type": "DELETED", "object": minicluster("a")})
+    assert not watch.was_deleted("a")
+
+
+def test_job_events_do_not_turn_checks_into_polling(executor):
+    """
+    A storm of job events still leaves max_status_checks_per_second.
+    """
+    executor.max_status_checks_per_second = 5
+    executor.next_seconds_between_status_checks = 60
+    cache = executor.start_status_cache()
+    assert executor.start_status_cache() is cache
+
+    checks = []
+    check_active_jobs = executor.check_active_jobs
+
+    def count(active_jobs):
+        checks.append(time.monotonic())
+        return check_active_jobs(active_jobs)
+
+    executor.check_active_jobs = count
+    stop = threading.Event()
+
+    def storm():
+        while not stop.wait(0.001):
+            cache.changed.set()
+
+    thread = threading.Thread(target=storm)
+    thread.start()
+    try:
+        time.sleep(1)
+    finally:
+        stop.set()
+        thread.join()
+    assert 2 <= len(checks) <= 7
@@ -0,0 +1,37 @@
+import pytest
+
+import snakemake_executor_plugin_kueue.custom_resource as cr
+
+from .conftest import Job, wait_for
+
+
+def test_pool_gives_up_on_workers_that_cannot_start(make_executor, cluster):
+    """
+    Workers whose pods fail at once fail the jobs waiting for them.
+    """
+    cluster.args.failure_rate = 1
+    cluster.args.runtime = 0
+    executor = make_executor(workers=1, worker_idle=1)
+    pool = executor.worker_pool
+    pool.poll_interval = 0.05
+    pool.restart_delay = 0
+    scheduler = executor.workflow.scheduler
+
+    executor.run_jobs([Job(1)])
+    wait_for(lambda: scheduler.failed == 1)
+    wait_for(lambda: not pool.workers)
+    assert pool.broken
+    assert cluster.requests["create jobs"] == pool.max_failed_starts
+
+    # Later jobs fail without starting more workers
+    executor.run_jobs([Job(2)])
+    wait_for(lambda: scheduler.failed == 2)
+    assert cluster.requests["create jobs"] == pool.max_failed_starts
+
+
+def test_tracked_job_needs_status():
+    class Tracked(cr.TrackedJob):
+        pass
+
+    with pytest.raises(TypeError):
+        Tracked(Job(1))
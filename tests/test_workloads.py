@@ -0,0 +1,133 @@
+import threading
+import time
+
+import pytest
+
+import snakemake_executor_plugin_kueue.custom_resource as cr
+from snakemake_executor_plugin_kueue import workloads
+
+from .conftest import Job, wait_for
+
+
+class Tracker(workloads.WorkloadTracker):
+    """
+    A tracker with a queue that always reports no pending workloads.
+    """
+
+    def count_pending(self):
+        return 0
+
+
+def test_wait_for_capacity_reserves_slots():
+    """
+    Threads waiting together must not all take the same free slot.
+    """
+    tracker = Tracker(None, "default", "queue", "uid", max_pending=3, interval=60)
+    admitted = []
+    threads = [
+        threading.Thread(target=lambda: admitted.append(tracker.wait_for_capacity()))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    tracker.stop()
+    for thread in threads:
+        thread.join()
+    assert sorted(admitted) == [False, False, True, True, True]
+
+
+def test_release_gives_back_a_slot():
+    tracker = Tracker(None, "default", "queue", "uid", max_pending=1, interval=60)
+    assert tracker.wait_for_capacity()
+    tracker.release()
+    assert tracker.wait_for_capacity()
+    assert tracker.pending == 1
+
+
+def workload(*conditions, active=None):
+    """
+    A workload with true conditions, given as (type, time, reason).
+    """
+    spec = {} if active is None else {"active": active}
+    return {
+        "spec": spec,
+        "status": {
+            "conditions": [
+                {
+                    "type": kind,
+                    "status": "True",
+                    "lastTransitionTime": when,
+                    "reason": reason,
+                }
+                for kind, when, reason in conditions
+            ]
+        },
+    }
+
+
+def test_workload_state():
+    admitted = ("QuotaReserved", "2024-01-01T00:00:01Z", "QuotaReserved")
+    assert workloads.workload_state(workload()) == "pending"
+    assert workloads.workload_state(workload(admitted)) == "admitted"
+    assert (
+        workloads.workload_state(
+            workload(admitted, ("Finished", "2024-01-01T00:00:02Z", "Succeeded"))
+        )
+        == "finished"
+    )
+
+
+def test_evicted_since_admission():
+    admitted = ("QuotaReserved", "2024-01-01T00:00:02Z", "QuotaReserved")
+    before = ("Evicted", "2024-01-01T00:00:01Z", "Preempted")
+    after = ("Evicted", "2024-01-01T00:00:03Z", "Preempted")
+    assert not workloads.evicted_since(workload(admitted, before))
+    assert workloads.evicted_since(workload(admitted, after))
+    assert workloads.workload_state(workload(admitted, before)) == "admitted"
+    assert workloads.workload_state(workload(admitted, after)) == "evicted"
+    assert workloads.workload_state(workload(after)) == "evicted"
+
+
+def test_deactivated_workload():
+    inactive = ("Evicted", "2024-01-01T00:00:03Z", "InactiveWorkload")
+    assert workloads.workload_state(workload(active=False)) == "deactivated"
+    assert workloads.workload_state(workload(inactive)) == "deactivated"
+    assert workloads.workload_state(workload(active=True)) == "pending"
+    assert workloads.deactivation_reason(workload(active=False)) == (
+        "the Kueue workload was deactivated"
+    )
+
+
+def test_refresh_lists_the_workloads_of_the_run(executor, cluster):
+    """
+    Workloads of other runs in the namespace are not listed.
+    """
+    cluster.args.runtime = 60
+    cluster.create(
+        "jobs",
+        "default",
+        {"metadata": {"name": "other", "labels": {cr.workflow_label: "other"}}},
+    )
+    executor.run_jobs([Job(1)])
+    wait_for(lambda: executor.workflow.scheduler.submitted)
+    executor.workloads.refresh()
+    assert len(executor.workloads.workloads) == 1
+    assert executor.workloads.get("other") is None
+
+    # Adopted jobs are labeled with the run that submitted them
+    executor.workloads.track("other")
+    executor.workloads.refresh()
+    assert executor.workloads.get("other")
+
+
+@pytest.mark.parametrize("pack_size", [1, 2])
+def test_cancelled_while_waiting_for_capacity(make_executor, cluster, pack_size):
+    """
+    Jobs held back when the run is cancelled fail instead of vanishing.
+    """
+    executor = make_executor(pack_size=pack_size, pack_window=0.1)
+    executor.workloads.stop()
+    executor.run_jobs([Job(1), Job(2)])
+    wait_for(lambda: executor.workflow.scheduler.failed == 2)
+    assert not cluster.requests["create jobs"]